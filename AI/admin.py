@@ -0,0 +1,113 @@
+"""
+Admin-only introspection endpoints, registered only when ADMIN_TOKEN is set (nothing is
+routed, sampled or traced otherwise). Every call needs the header X-Admin-Token: <ADMIN_TOKEN>.
+
+    POST /admin/profile/cpu?seconds=10&interval_ms=10   sample all threads, folded stacks (text)
+    POST /api/ask  + header X-Profile: <tag>              profile that one request
+    GET  /admin/profile/requests                         tagged request profiles kept
+    GET  /admin/profile/requests/<tag>                   folded stacks of a tagged request (text)
+    GET  /admin/memory                                   tracemalloc status, snapshots kept
+    POST /admin/memory/start?frames=10                   start tracemalloc
+    POST /admin/memory/snapshot?top=20                   snapshot, top allocation sites
+    GET  /admin/memory/diff?base=<id>[&to=<id>]&top=20   growth between snapshots (to: a new one)
+    POST /admin/memory/stop                              stop tracemalloc, drop the snapshots
+
+Folded stacks load in speedscope, or: flamegraph.pl profile.folded > profile.svg
+"""
+import hmac
+import os
+from contextlib import nullcontext
+
+from flask import Blueprint, Response, abort, jsonify, request
+
+from profiling import DEFAULT_INTERVAL, MemoryTracker, Profiles
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+admin = Blueprint("admin", __name__, url_prefix="/admin")
+profiles = Profiles()
+memory = MemoryTracker()
+
+
+def authorized() -> bool:
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+
+
+@admin.before_request
+def require_token():
+    if not authorized():
+        abort(403)
+
+
+def folded_response(text: str) -> Response:
+    return Response(text, mimetype="text/plain")
+
+
+def interval_arg() -> float:
+    return request.args.get("interval_ms", DEFAULT_INTERVAL * 1000, type=float) / 1000
+
+
+@admin.route("/profile/cpu", methods=["POST"])
+def profile_cpu():
+    try:
+        profiler = profiles.profile_process(request.args.get("seconds", 10.0, type=float), interval_arg())
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    response = folded_response(profiler.folded())
+    response.headers["X-Profile-Samples"] = str(profiler.samples)
+    return response
+
+
+@admin.route("/profile/requests", methods=["GET"])
+def request_profiles():
+    return jsonify(profiles.request_tags())
+
+
+@admin.route("/profile/requests/<tag>", methods=["GET"])
+def request_profile(tag: str):
+    profile = profiles.request_profile(tag)
+    if profile is None:
+        return jsonify({"status": "error", "message": f"No profile tagged '{tag}'"}), 404
+    return folded_response(profile["folded"])
+
+
+@admin.route("/memory", methods=["GET"])
+def memory_status():
+    return jsonify(memory.status())
+
+
+@admin.route("/memory/start", methods=["POST"])
+def memory_start():
+    return jsonify(memory.start(request.args.get("frames", 10, type=int)))
+
+
+@admin.route("/memory/snapshot", methods=["POST"])
+def memory_snapshot():
+    try:
+        return jsonify(memory.snapshot(request.args.get("top", 20, type=int), request.args.get("group_by", "lineno")))
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+
+
+@admin.route("/memory/diff", methods=["GET"])
+def memory_diff():
+    try:
+        return jsonify(memory.diff(request.args.get("base", type=int), request.args.get("to", type=int),
+                                   request.args.get("top", 20, type=int), request.args.get("group_by", "lineno")))
+    except KeyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+
+
+@admin.route("/memory/stop", methods=["POST"])
+def memory_stop():
+    return jsonify(memory.stop())
+
+
+def request_profiling():
+    """Context for an API request: sampled and kept under its X-Profile tag when an admin asks for it"""
+    tag = request.headers.get("X-Profile") if ADMIN_TOKEN else None
+    if not tag or not authorized():
+        return nullcontext()
+    return profiles.profile_request(tag, interval_arg())
@@ -1,10 +1,20 @@
+import os
 from flask import Flask, request, jsonify
 # from rag import ask_rag
-from mealPlanner import ask_rag
+from mealPlanner import ask_rag, meal_planner
+from catalog_registry import UnknownStoreError
+from deadline import Deadline, client_socket, request_budget, scope, watch_disconnect
 from logger import get_logger
 
 app = Flask(__name__)
 
+# Profiling and memory introspection (admin.py) - not even routed without ADMIN_TOKEN
+if os.getenv("ADMIN_TOKEN"):
+    from admin import admin, request_profiling
+    app.register_blueprint(admin)
+else:
+    from contextlib import nullcontext as request_profiling
+
 @app.route("/api/ask", methods=["POST"])
 def ask():
     data = request.get_json()
@@ -15,9 +25,26 @@ def ask():
     dietary_restrictions = data.get("restrictions", [])
     meal_types = data.get("meal_types", ["śniadanie", "obiad", "kolacja"])
     excluded_ingredients = data.get("excluded_ingredients", "")
+    try:
+        # Store (chain or regional offer sheet) whose catalog the plan is built from
+        store = meal_planner.catalogs.resolve_store(data.get("store"))
+    except UnknownStoreError:
+        return jsonify({"status": "error", "message": f"Unknown store '{data.get('store')}'",
+                        "stores": meal_planner.catalogs.stores()}), 400
     query = data["query"]
-    result = ask_rag(query, days, people, dietary_restrictions, meal_types, excluded_ingredients)
-    return jsonify(result)
+    # Time budget of the whole request (client's "deadline_s" or REQUEST_DEADLINE_S); a client
+    # that disconnects cancels it, so no more tokens are spent on an answer nobody reads
+    deadline = Deadline(request_budget(data.get("deadline_s")))
+    with scope(deadline), watch_disconnect(deadline, client_socket(request.environ)), request_profiling():
+        result = ask_rag(query, days, people, dietary_restrictions, meal_types, excluded_ingredients, store)
+    status = {"deadline": 504, "cancelled": 499}.get(result.get("reason"), 200)
+    return jsonify(result), status
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    # Queue wait of OpenAI calls per priority (null without OPENAI_RPM / OPENAI_TPM)
+    limiter = meal_planner.openai_limiter
+    return jsonify({"openai_limiter": limiter.metrics() if limiter is not None else None})
 
 if __name__ == "__main__":
     get_logger("app-main").info("Starting Flask server...")
@@ -0,0 +1,173 @@
+"""
+Memory and access-time benchmark: raw catalog dicts (as loaded from JSON) vs the compact Catalog
+vs the memory-mapped ShardCatalog that requests are served from (its memory is the Python heap
+plus the mapped file, which the page cache shares between all workers).
+
+    python bench_catalog.py [--products 50000] [--lookups 1000] [--json]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from catalog import CATEGORIES, DIETARY_FLAGS, Catalog
+from shard import ShardCatalog, write_shard
+
+BRANDS = ["Kraina Wędlin", "Pilos", "Dobra Kaloria", "Vitanella", "Marinero", "Wawel", "Go Active", "Mleczna Dolina"]
+NOUNS = ["Szynka", "Kiełbasa", "Ser żółty", "Jogurt naturalny", "Filet z kurczaka", "Makaron", "Ryż", "Mleko",
+         "Pomidory", "Łosoś", "Jaja", "Masło", "Chleb żytni", "Twaróg", "Papryka", "Schab"]
+UNITS = ["100 g", "200 g", "400 g", "500 g", "1 kg", "1 l", "10 szt."]
+KEYWORDS = ["meat", "pork", "dairy", "cheese", "vegetable", "fish", "bread", "pasta", "rice", "egg", "deli", "fresh"]
+
+
+def synthetic_lines(count: int, seed: int = 7) -> List[str]:
+    """JSONL product lines shaped like the scraper's published catalog"""
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+        name = f"{rng.choice(NOUNS)} {rng.choice(BRANDS)}, {rng.choice(UNITS)} #{index}"
+        price = rng.randint(99, 4999)
+        record = {
+            "product_id": str(400000 + index),
+            "name": name,
+            "price": f"{price // 100},{price % 100:02d}",
+            "original_price": f"{(price + 150) // 100},{(price + 150) % 100:02d}" if index % 3 == 0 else None,
+            "discount_info": "-30%" if index % 3 == 0 else None,
+            "unit": rng.choice(UNITS),
+            "promotion_type": "Moja Biedronka" if index % 2 else None,
+            "product_url": f"https://www.biedronka.pl/pl/product,id,{400000 + index},name",
+            "image_url": f"https://www.biedronka.pl/img/{400000 + index}.png",
+            "scraped_at": "2026-10-19T03:00:00",
+            "diff_status": "unchanged",
+            "translated_name": f"product {index}",
+            "english_keywords": rng.sample(KEYWORDS, 4),
+            "category": rng.choice(CATEGORIES),
+            "keep": True,
+            "dietary_flags": {flag: rng.random() < 0.5 for flag in DIETARY_FLAGS},
+        }
+        lines.append(json.dumps(record, ensure_ascii=False))
+    return lines
+
+
+def measure_memory(build: Callable[[], object]) -> Tuple[object, int]:
+    """Bytes retained by the object built by `build` (after temporary allocations are freed)"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def best_time(func: Callable[[], object], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(count: int, lookups: int, work_dir: str) -> Dict[str, Dict[str, float]]:
+    lines = synthetic_lines(count)
+    raw, raw_bytes = measure_memory(lambda: [json.loads(line) for line in lines])
+    catalog, catalog_bytes = measure_memory(lambda: Catalog.from_records(json.loads(line) for line in lines))
+    shard_path = os.path.join(work_dir, "bench.shard")
+    write_shard(shard_path, catalog)
+    shard, shard_heap = measure_memory(lambda: ShardCatalog(shard_path))
+
+    names = [product["name"] for product in random.Random(1).sample(raw, min(lookups, count))]
+    # Plan names are often shortened by the LLM ("Szynka Kraina Wędlin") - resolved by closest match
+    partial_names = [name.rsplit(",", 1)[0] for name in names[:100]]
+
+    def raw_total():
+        # What request code had to do with raw dicts: re-parse "12,99" on every access
+        return sum(float(product["price"].replace(",", ".")) for product in raw)
+
+    def catalog_total():
+        return sum(product.price_cents for product in catalog)
+
+    def shard_total():
+        return sum(product.price_cents for product in shard)
+
+    def raw_lookup():
+        # quick_meal_plan's previous linear, case-folding search
+        for name in names:
+            next((p for p in raw if name.lower() in p["name"].lower()), None)
+
+    def catalog_lookup():
+        for name in names:
+            catalog.get(name)
+
+    def shard_lookup():
+        # Repeated lookups are answered from the shard's cache of decoded products
+        for name in names:
+            shard.get(name)
+
+    def raw_closest():
+        # The previous linear closest match, one pass over all products per plan item
+        for name in partial_names:
+            key = name.lower()
+            candidates = [p for p in raw if key in p["name"].lower() or p["name"].lower() in key]
+            min(candidates, key=lambda p: abs(len(p["name"]) - len(key)), default=None)
+
+    def catalog_closest():
+        for name in partial_names:
+            catalog.closest(name)
+
+    def shard_closest():
+        for name in partial_names:
+            shard.closest(name)
+
+    raw_lookup_time = best_time(raw_lookup, repeat=1) if lookups else 0.0
+    raw_closest_time = best_time(raw_closest, repeat=1) if lookups else 0.0
+    results = {
+        "memory_mb": {"raw_dicts": raw_bytes / 2**20, "catalog": catalog_bytes / 2**20,
+                      "shard": (shard_heap + shard.nbytes) / 2**20},
+        "price_scan_ms": {"raw_dicts": best_time(raw_total) * 1000, "catalog": best_time(catalog_total) * 1000,
+                          "shard": best_time(shard_total) * 1000},
+        "lookup_us_per_name": {
+            "raw_dicts": raw_lookup_time / max(1, len(names)) * 1e6,
+            "catalog": best_time(catalog_lookup) / max(1, len(names)) * 1e6,
+            "shard": best_time(shard_lookup) / max(1, len(names)) * 1e6,
+        },
+        # Catalog's trigram index is built on the first call, outside the best of the repeats
+        "closest_us_per_name": {
+            "raw_dicts": raw_closest_time / max(1, len(partial_names)) * 1e6,
+            "catalog": best_time(catalog_closest) / max(1, len(partial_names)) * 1e6,
+            "shard": best_time(shard_closest) / max(1, len(partial_names)) * 1e6,
+        },
+    }
+    shard.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-catalog-") as work_dir:
+        results = run(args.products, args.lookups, work_dir)
+    if args.json:
+        print(json.dumps({"products": args.products, **results}, indent=2))
+        return
+
+    print(f"Catalog benchmark - {args.products} products")
+    print(f"{'metric':<22}{'raw dicts':>14}{'Catalog':>14}{'ratio':>10}{'Shard':>14}")
+    for metric, values in results.items():
+        ratio = values["raw_dicts"] / values["catalog"] if values["catalog"] else float("inf")
+        print(f"{metric:<22}{values['raw_dicts']:>14.2f}{values['catalog']:>14.2f}{ratio:>9.1f}x"
+              f"{values['shard']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Offline end-to-end benchmark of the meal-planning path (MealPlannerAPI.ask_rag) - no OpenAI or
+Qdrant needed: the OpenAI API is the deterministic fake_openai.py server (in a child process) and
+Qdrant runs embedded in memory, loaded with the sample recipes. The bundled offer file is the catalog.
+
+    python bench_e2e.py [--runs 5] [--chat-latency-ms 0] [--json] [--output results.json] [--baseline old.json]
+
+Per scenario (1 day/1 person up to 7 days/6 people) it reports end-to-end and per-stage wall time
+(median of the runs), CPU time of this process (prompt building, search handling, parsing, the
+embedded Qdrant - not the fake API) and allocation peak (one extra run under tracemalloc). Keep the
+injected latency at 0 to see only our own overhead. With --baseline, end-to-end changes against a
+previous --output file are shown and regressions over --threshold are flagged (exit code 1).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from fake_openai import FakeOpenAIServer
+from logger import set_output
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_RECIPES = os.path.join(ROOT, "shared_data", "sample_recipes.json")
+DEFAULT_OFFERS = os.path.join(ROOT, "shared_data", "biedronka_offers_enhanced.json")
+
+SCENARIOS = [
+    {"name": "1d-1p", "days": 1, "people": 1, "question": "Tani i zdrowy obiad dla rodziny",
+     "dietary_restrictions": [], "meal_types": ["obiad"], "excluded_ingredients": ""},
+    {"name": "3d-2p", "days": 3, "people": 2, "question": "Dużo białka, mało węglowodanów",
+     "dietary_restrictions": ["Keto"], "meal_types": ["śniadanie", "obiad", "kolacja"], "excluded_ingredients": ""},
+    {"name": "5d-4p", "days": 5, "people": 4, "question": "Szybkie śniadania i kolacje bez mięsa",
+     "dietary_restrictions": ["Wegetariańskie"], "meal_types": ["śniadanie", "kolacja"],
+     "excluded_ingredients": "grzyby"},
+    {"name": "7d-6p", "days": 7, "people": 6, "question": "Plan na cały tydzień dla rodziny z dziećmi",
+     "dietary_restrictions": [], "meal_types": ["śniadanie", "obiad", "kolacja"], "excluded_ingredients": ""},
+]
+
+# Wall time per stage of the current request (inclusive of nested stages)
+stage_times: Dict[str, float] = defaultdict(float)
+
+
+def timed(stage: str, function: Callable) -> Callable:
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stage_times[stage] += (time.perf_counter() - started) * 1000
+    return wrapper
+
+
+def instrument(mealPlanner, planner):
+    """Wrap the stages of the planning path (instance attributes shadow the methods)"""
+    object.__setattr__(planner, "translate_to_english", timed("translate_query", planner.translate_to_english))
+    object.__setattr__(planner.embedding_model, "embed_query", timed("embed_query", planner.embedding_model.embed_query))
+    mealPlanner.preselect_products = timed("preselect", mealPlanner.preselect_products)
+    object.__setattr__(planner, "generate_search_query", timed("search_query", planner.generate_search_query))
+    object.__setattr__(planner, "batch_search_recipes", timed("recipe_search", planner.batch_search_recipes))
+    object.__setattr__(mealPlanner.chat_prompt, "invoke", timed("plan_prompt", mealPlanner.chat_prompt.invoke))
+    object.__setattr__(planner, "stream_plan", timed("plan_llm", planner.stream_plan))
+    object.__setattr__(planner, "parse_plan_output", timed("plan_parse", planner.parse_plan_output))
+    mealPlanner.PriceIndex.price_plan = timed("pricing", mealPlanner.PriceIndex.price_plan)
+
+
+def load_planner(base_url: str, recipes_path: str, offers_path: str, work_dir: str, show_logs: bool = False):
+    """The backend's MealPlannerAPI wired to the fake API and an in-memory Qdrant with the recipes loaded"""
+    os.environ.update({
+        "OPENAI_API_KEY": "offline-benchmark",
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_BASE": base_url,
+        "QDRANT_URL": ":memory:",
+        "PRODUCTS_FILE": offers_path,
+        "CATALOG_SHARDS_DIR": os.path.join(work_dir, "shards"),
+        "RECIPE_MATCHES_FILE": os.path.join(work_dir, "{store}_recipe_matches.json"),
+        "GLOSSARY_FILE": os.path.join(work_dir, "glossary.json"),
+        "RECIPE_SPARSE_INDEX": os.path.join(work_dir, "recipes.bm25"),
+        "LANGCHAIN_TRACING_V2": "false",
+        "LANGSMITH_TRACING": "false",
+    })
+    os.environ.pop("CATALOG_STORES", None)
+
+    import mealPlanner
+    from recipe_index import build_collection, load_recipes, write_sparse_index
+
+    planner = mealPlanner.meal_planner
+    # Offline: send texts, not tiktoken token IDs (tiktoken would download its encodings)
+    planner.embedding_model.check_embedding_ctx_length = False
+    planner.recipe_embedding_model.check_embedding_ctx_length = False
+    build_collection(planner.qdrant_client, planner.client, load_recipes(recipes_path))
+    write_sparse_index(planner.qdrant_client)
+    # Shard and product embeddings ready before the first measured request
+    planner.catalogs.warm(background=False)
+
+    if not show_logs:
+        # Log records are still formatted (in the logging thread, part of the process CPU time), only not printed
+        set_output(open(os.devnull, "w"))
+    return planner
+
+
+def ask(planner, scenario: Dict[str, Any]) -> Dict[str, Any]:
+    stage_times.clear()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    result = planner.ask_rag(scenario["question"], scenario["days"], scenario["people"],
+                             scenario["dietary_restrictions"], scenario["meal_types"],
+                             scenario["excluded_ingredients"])
+    return {
+        "e2e_ms": (time.perf_counter() - started) * 1000,
+        "cpu_ms": (time.process_time() - cpu_started) * 1000,
+        "stages": dict(stage_times),
+        "status": result.get("status"),
+        "meals": len(result.get("meals", [])),
+    }
+
+
+def run_scenario(planner, scenario: Dict[str, Any], runs: int) -> Dict[str, Any]:
+    samples = [ask(planner, scenario) for _ in range(runs)]
+    stages = sorted({stage for sample in samples for stage in sample["stages"]})
+
+    tracemalloc.start()
+    try:
+        ask(planner, scenario)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "scenario": scenario["name"],
+        "status": samples[-1]["status"],
+        "meals": samples[-1]["meals"],
+        "e2e_ms": round(statistics.median(s["e2e_ms"] for s in samples), 2),
+        "e2e_max_ms": round(max(s["e2e_ms"] for s in samples), 2),
+        "cpu_ms": round(statistics.median(s["cpu_ms"] for s in samples), 2),
+        "alloc_peak_mb": round(peak / 2**20, 2),
+        "stages_ms": {stage: round(statistics.median(s["stages"].get(stage, 0.0) for s in samples), 2)
+                      for stage in stages},
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> List[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if not previous:
+            continue
+        for metric in ("e2e_ms", "cpu_ms", "alloc_peak_mb"):
+            change = (result[metric] - previous[metric]) / previous[metric] if previous[metric] else 0.0
+            result[f"{metric}_change"] = round(change, 3)
+            if change > threshold:
+                regressions.append(f"{result['scenario']} {metric}: {previous[metric]} -> {result[metric]} "
+                                   f"(+{change:.0%})")
+    return regressions
+
+
+def print_table(report: Dict[str, Any]):
+    print(f"\nCold start (first request: maps the store shard and the sparse index): {report['cold_start_ms']:.0f} ms")
+    stages = sorted({stage for result in report["results"] for stage in result["stages_ms"]})
+    print(f"{'scenario':<8} {'status':<8} {'meals':>5} {'e2e ms':>9} {'cpu ms':>9} {'peak MB':>8}  "
+          + " ".join(f"{stage:>15}" for stage in stages))
+    for result in report["results"]:
+        change = f" ({result['e2e_ms_change']:+.0%})" if "e2e_ms_change" in result else ""
+        print(f"{result['scenario']:<8} {result['status']:<8} {result['meals']:>5} {result['e2e_ms']:>9.1f} "
+              f"{result['cpu_ms']:>9.1f} {result['alloc_peak_mb']:>8.2f}  "
+              + " ".join(f"{result['stages_ms'].get(stage, 0.0):>15.1f}" for stage in stages) + change)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="measured runs per scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=[s["name"] for s in SCENARIOS],
+                        default=[s["name"] for s in SCENARIOS])
+    parser.add_argument("--recipes", default=DEFAULT_RECIPES, help="recipes JSON/CSV loaded into Qdrant")
+    parser.add_argument("--offers", default=DEFAULT_OFFERS, help="store catalog")
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--token-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--output", help="write the report to a JSON file (a later --baseline)")
+    parser.add_argument("--baseline", help="report of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    parser.add_argument("--show-logs", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(chat_latency_ms=args.chat_latency_ms, token_latency_ms=args.token_latency_ms,
+                              embedding_latency_ms=args.embedding_latency_ms)
+    with server, tempfile.TemporaryDirectory(prefix="bench-e2e-") as work_dir:
+        planner = load_planner(server.base_url, args.recipes, args.offers, work_dir, args.show_logs)
+        instrument(sys.modules["mealPlanner"], planner)
+        scenarios = [s for s in SCENARIOS if s["name"] in args.scenarios]
+
+        # First request maps the store's shard and the sparse index
+        cold = ask(planner, scenarios[0])
+        report = {"runs": args.runs, "cold_start_ms": round(cold["e2e_ms"], 1),
+                  "latency_ms": {"chat": args.chat_latency_ms, "token": args.token_latency_ms,
+                                 "embedding": args.embedding_latency_ms},
+                  "results": [run_scenario(planner, scenario, args.runs) for scenario in scenarios]}
+
+    regressions = compare(report["results"], args.baseline, args.threshold) if args.baseline else []
+    report["regressions"] = regressions
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+        for regression in regressions:
+            print(f"⚠️ Regression: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Recipe collection benchmark: search latency (p50/p99), memory and recall@10 for each collection
+configuration (quantization x HNSW m x query ef), to choose the recipe_index.py settings and size
+Qdrant nodes for a large recipe corpus.
+
+    python bench_qdrant.py [--url http://localhost:6333] [--size 20000] [--quantization none int8 binary]
+                           [--m 16] [--ef 32 64 128] [--vectors synthetic|collection] [--project 100000] [--json]
+
+Vectors are synthetic (clustered, normalized, seeded) or copied from the recipe collection. Queries
+are held out of the indexed vectors; recall is measured against exact (brute-force) top-10. With
+--url :memory: the embedded client runs exact search and ignores HNSW and quantization - use it to
+check the harness, not to compare configurations. Memory is estimated from the collection layout
+(RAM: quantized vectors + HNSW links, or the float32 vectors without quantization).
+"""
+import argparse
+import json
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import CollectionStatus
+
+from recipe_index import COLLECTION_NAME, HNSW_EF_CONSTRUCT, QUANTIZATIONS, collection_params, search_params
+
+TOP_K = 10
+WARMUP_QUERIES = 20
+MB = 1024 * 1024
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 7, clusters: int = 64) -> np.ndarray:
+    """Normalized vectors around random cluster centres (embeddings are clustered, not uniform)"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def collection_vectors(client: QdrantClient, collection: str, count: int) -> np.ndarray:
+    vectors = []
+    offset = None
+    while len(vectors) < count:
+        page, offset = client.scroll(collection_name=collection, limit=min(512, count - len(vectors)),
+                                     offset=offset, with_payload=False, with_vectors=True)
+        vectors.extend(point.vector for point in page)
+        if offset is None:
+            break
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int = TOP_K) -> List[set]:
+    scores = queries @ corpus.T
+    return [set(np.argpartition(-row, k)[:k].tolist()) for row in scores]
+
+
+def memory_estimate(count: int, dim: int, quantization: str, m: int) -> Dict[str, float]:
+    """RAM and disk (MB) for `count` vectors: level-0 HNSW links take 2*m ids of 4 bytes per point"""
+    links = count * 2 * m * 4
+    original = count * dim * 4
+    quantized = {"none": 0, "int8": count * dim, "binary": count * dim // 8}[quantization]
+    ram = links + quantized + (original if quantization == "none" else 0)
+    disk = original + quantized + links
+    return {"ram_mb": round(ram / MB, 1), "disk_mb": round(disk / MB, 1)}
+
+
+def wait_indexed(client: QdrantClient, collection: str, timeout: float = 1800):
+    """Wait until the optimizer has built the HNSW graph (and quantized the vectors)"""
+    deadline = time.monotonic() + timeout
+    while client.get_collection(collection).status != CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Collection '{collection}' not indexed after {timeout:.0f}s")
+        time.sleep(1)
+
+
+def run_config(client: QdrantClient, corpus: np.ndarray, queries: np.ndarray, truth: List[set],
+               quantization: str, m: int, efs: List[int]) -> List[Dict[str, Any]]:
+    collection = f"bench_{quantization}_m{m}_{uuid.uuid4().hex[:6]}"
+    client.create_collection(collection_name=collection,
+                             **collection_params(quantization, m, HNSW_EF_CONSTRUCT, size=corpus.shape[1]))
+    try:
+        started = time.perf_counter()
+        client.upload_collection(collection_name=collection, vectors=corpus, ids=range(len(corpus)),
+                                 batch_size=256, wait=True)
+        wait_indexed(client, collection)
+        build_seconds = time.perf_counter() - started
+
+        results = []
+        for ef in efs:
+            params = search_params(quantization, ef)
+            for vector in queries[:WARMUP_QUERIES]:
+                client.query_points(collection_name=collection, query=vector, limit=TOP_K,
+                                    search_params=params, with_payload=False)
+            latencies, recalls = [], []
+            for vector, expected in zip(queries, truth):
+                started = time.perf_counter()
+                hits = client.query_points(collection_name=collection, query=vector, limit=TOP_K,
+                                           search_params=params, with_payload=False).points
+                latencies.append((time.perf_counter() - started) * 1000)
+                recalls.append(len(expected.intersection(hit.id for hit in hits)) / TOP_K)
+            results.append({
+                "quantization": quantization, "m": m, "ef_construct": HNSW_EF_CONSTRUCT, "ef": ef,
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                f"recall@{TOP_K}": round(float(np.mean(recalls)), 4),
+                "build_s": round(build_seconds, 1),
+                **memory_estimate(len(corpus), corpus.shape[1], quantization, m),
+            })
+        return results
+    finally:
+        client.delete_collection(collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:6333", help="Qdrant URL or :memory:")
+    parser.add_argument("--size", type=int, default=20000, help="indexed vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=1536, help="synthetic vector size")
+    parser.add_argument("--vectors", choices=("synthetic", "collection"), default="synthetic")
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--project", type=int, default=100000, help="corpus size for the memory projection")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    client = QdrantClient(location=":memory:") if args.url == ":memory:" else QdrantClient(url=args.url)
+    if args.vectors == "collection":
+        vectors = collection_vectors(client, COLLECTION_NAME, args.size + args.queries)
+    else:
+        vectors = synthetic_vectors(args.size + args.queries, args.dim)
+    corpus, queries = vectors[:-args.queries], vectors[-args.queries:]
+    truth = exact_top_k(corpus, queries)
+
+    results = []
+    for quantization in args.quantization:
+        for m in args.m:
+            for result in run_config(client, corpus, queries, truth, quantization, m, args.ef):
+                result[f"ram_mb_at_{args.project}"] = memory_estimate(args.project, corpus.shape[1], quantization, m)["ram_mb"]
+                results.append(result)
+                if not args.json:
+                    print(f"{quantization:<7} m={m:<3} ef={result['ef']:<4} p50={result['p50_ms']:>7.2f}ms "
+                          f"p99={result['p99_ms']:>7.2f}ms recall@{TOP_K}={result[f'recall@{TOP_K}']:.3f} "
+                          f"ram={result['ram_mb']:>8.1f}MB ({result[f'ram_mb_at_{args.project}']:.0f}MB "
+                          f"at {args.project}) build={result['build_s']}s")
+
+    if args.json:
+        print(json.dumps({"url": args.url, "vectors": args.vectors, "size": len(corpus), "dim": int(corpus.shape[1]),
+                          "queries": len(queries), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import sys
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from catalog_io import load_catalog
+from pricing import CENT, normalize_name, parse_price
+
+# Category and dietary vocabularies produced by the scraper's annotation pass
+CATEGORIES = (
+    "other", "meat", "fish", "dairy", "eggs", "bakery", "vegetables", "fruits", "grains",
+    "pantry", "frozen", "sweets", "snacks", "beverages", "non_food"
+)
+CATEGORY_IDS = {name: index for index, name in enumerate(CATEGORIES)}
+DIETARY_FLAGS = ("vegetarian", "vegan", "gluten_free", "lactose_free")
+
+
+def _intern(value: Any) -> Optional[str]:
+    """Intern repeated strings (brands, units, categories, keywords) - one copy per process"""
+    if value is None or value == "":
+        return None
+    return sys.intern(str(value))
+
+
+def _cents(value: Any) -> Optional[int]:
+    price = parse_price(value)
+    return None if price is None else int(price * 100)
+
+
+def trigrams(text: str) -> Set[int]:
+    """Character trigrams of a text, each packed into one integer (3 code points of 21 bits)"""
+    return {(ord(text[i]) << 42) | (ord(text[i + 1]) << 21) | ord(text[i + 2]) for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    Character trigram index over product search keys, for name lookups that are not exact:
+    `containing` narrows down the products whose key contains a text, `within` those whose key is
+    contained in it; callers verify the few candidates. Stored as flat numpy arrays (sorted trigram
+    codes, posting offsets, product indices, trigrams per key), so a shard maps it without copying.
+    Keys shorter than three characters have no trigrams and are only found by exact lookup.
+    """
+    __slots__ = ("codes", "offsets", "postings", "sizes")
+
+    def __init__(self, codes: np.ndarray, offsets: np.ndarray, postings: np.ndarray, sizes: np.ndarray):
+        self.codes = codes
+        self.offsets = offsets
+        self.postings = postings
+        self.sizes = sizes
+
+    @classmethod
+    def build(cls, keys: Iterable[str]) -> "TrigramIndex":
+        pair_codes: List[int] = []
+        pair_indices: List[int] = []
+        sizes: List[int] = []
+        for index, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            pair_codes.extend(grams)
+            pair_indices.extend([index] * len(grams))
+        codes = np.array(pair_codes, dtype=np.uint64)
+        # Stable sort keeps each posting list in product order
+        order = np.argsort(codes, kind="stable")
+        codes, postings = codes[order], np.array(pair_indices, dtype=np.uint32)[order]
+        unique, starts = np.unique(codes, return_index=True)
+        offsets = np.append(starts, len(codes)).astype(np.uint32)
+        return cls(unique, offsets, postings, np.array(sizes, dtype=np.uint16))
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offsets.nbytes + self.postings.nbytes + self.sizes.nbytes
+
+    def _posting(self, code: int) -> Optional[np.ndarray]:
+        position = int(np.searchsorted(self.codes, np.uint64(code)))
+        if position == len(self.codes) or int(self.codes[position]) != code:
+            return None
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+    def containing(self, text: str) -> Optional[np.ndarray]:
+        """Sorted indices of products whose key may contain `text`; None when it is too short to tell"""
+        grams = trigrams(text)
+        if not grams:
+            return None
+        lists = []
+        for code in grams:
+            posting = self._posting(code)
+            if posting is None:
+                return np.empty(0, dtype=np.uint32)
+            lists.append(posting)
+        lists.sort(key=len)
+        result = lists[0]
+        for posting in lists[1:]:
+            if not len(result):
+                break
+            # Posting lists are sorted - keep the candidates found in the next list by binary search
+            positions = np.minimum(np.searchsorted(posting, result), len(posting) - 1)
+            result = result[posting[positions] == result]
+        return result
+
+    def within(self, text: str) -> np.ndarray:
+        """Sorted indices of products all of whose key trigrams occur in `text` (candidates for key in text)"""
+        lists = [posting for posting in map(self._posting, trigrams(text)) if posting is not None]
+        if not lists:
+            return np.empty(0, dtype=np.uint32)
+        hits = np.bincount(np.concatenate(lists), minlength=len(self.sizes))
+        return np.flatnonzero((hits == self.sizes) & (self.sizes > 0))
+
+    def first_containing(self, text: str, search_key: Callable[[int], str]) -> Optional[int]:
+        """Index of the first product whose key contains `text`"""
+        candidates = self.containing(text)
+        for index in range(len(self.sizes)) if candidates is None else candidates.tolist():
+            if text in search_key(index):
+                return index
+        return None
+
+    def closest(self, text: str, search_key: Callable[[int], str]) -> Optional[int]:
+        """Index of the product whose key contains (or is contained in) `text` with the closest length"""
+        candidates = self.containing(text)
+        if candidates is None:
+            candidates = range(len(self.sizes))
+        else:
+            candidates = np.union1d(candidates, self.within(text)).tolist()
+        best, best_distance = None, 0
+        for index in candidates:
+            key = search_key(index)
+            if text in key or key in text:
+                distance = abs(len(key) - len(text))
+                if best is None or distance < best_distance:
+                    best, best_distance = index, distance
+        return best
+
+
+class CatalogProduct(NamedTuple):
+    """
+    One catalog product: an immutable tuple (no per-instance __dict__), with interned strings,
+    the price in grosze (None when the store gives none, e.g. "Sprawdź w sklepie"), a normalized
+    search key, a category ID and a dietary bitmask.
+    """
+    product_id: Optional[str]
+    name: str
+    translated_name: Optional[str]
+    search_key: str
+    price_cents: Optional[int]
+    original_price_cents: Optional[int]
+    discount_info: Optional[str]
+    category_id: int
+    keywords: Tuple[str, ...]
+    dietary: int
+
+    @property
+    def price(self) -> Optional[Decimal]:
+        if self.price_cents is None:
+            return None
+        return (Decimal(self.price_cents) / 100).quantize(CENT)
+
+    @property
+    def original_price(self) -> Optional[Decimal]:
+        if self.original_price_cents is None:
+            return None
+        return (Decimal(self.original_price_cents) / 100).quantize(CENT)
+
+    @property
+    def category(self) -> str:
+        return CATEGORIES[self.category_id]
+
+    @property
+    def search_name(self) -> str:
+        """Name used for recipe search - the English translation when available"""
+        return self.translated_name or self.name
+
+    def has_flag(self, flag: str) -> bool:
+        return bool(self.dietary & (1 << DIETARY_FLAGS.index(flag)))
+
+    @classmethod
+    def from_record(cls, record: Mapping[str, Any]) -> "CatalogProduct":
+        """Build from a catalog JSON record (a price that does not parse is kept as None)"""
+        flags = record.get("dietary_flags") or {}
+        dietary = 0
+        for bit, flag in enumerate(DIETARY_FLAGS):
+            if flags.get(flag) is True:
+                dietary |= 1 << bit
+        name = record.get("name", "")
+        return cls(
+            product_id=_intern(record.get("product_id")),
+            name=sys.intern(name),
+            translated_name=_intern(record.get("translated_name")),
+            search_key=sys.intern(normalize_name(name)),
+            price_cents=_cents(record.get("price")),
+            original_price_cents=_cents(record.get("original_price")),
+            discount_info=_intern(record.get("discount_info")),
+            category_id=CATEGORY_IDS.get(record.get("category"), 0),
+            keywords=tuple(sys.intern(keyword) for keyword in record.get("english_keywords") or ()),
+            dietary=dietary,
+        )
+
+
+class Catalog:
+    """
+    Immutable product catalog shared by all request threads without locks: products are
+    a tuple of CatalogProduct and the name index is built once (the trigram index for inexact
+    lookups on first use). Changes (e.g. translations) produce a new Catalog, which callers swap
+    in with a single reference assignment.
+    """
+    __slots__ = ("products", "metadata", "_by_key", "_trigrams")
+
+    def __init__(self, products: Iterable[CatalogProduct], metadata: Optional[Dict[str, Any]] = None,
+                 trigram_index: Optional[TrigramIndex] = None):
+        products = tuple(products)
+        by_key: Dict[str, int] = {}
+        for index, product in enumerate(products):
+            by_key.setdefault(product.search_key, index)
+        object.__setattr__(self, "products", products)
+        object.__setattr__(self, "metadata", dict(metadata or {}))
+        object.__setattr__(self, "_by_key", by_key)
+        object.__setattr__(self, "_trigrams", trigram_index)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Catalog is immutable")
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping[str, Any]], metadata: Optional[Dict[str, Any]] = None) -> "Catalog":
+        return cls((CatalogProduct.from_record(record) for record in records), metadata)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Catalog":
+        """Load a catalog published by the scraper pipeline, skipping products marked keep=false"""
+        metadata, records = load_catalog(path)
+        return cls.from_records((record for record in records if record.get("keep", True)), metadata)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def __iter__(self) -> Iterator[CatalogProduct]:
+        return iter(self.products)
+
+    def get(self, name: str) -> Optional[CatalogProduct]:
+        """Exact lookup by (normalized) name"""
+        index = self._by_key.get(normalize_name(name))
+        return None if index is None else self.products[index]
+
+    @property
+    def trigram_index(self) -> TrigramIndex:
+        index = self._trigrams
+        if index is None:
+            # Built once per catalog; a concurrent first use only builds it twice
+            index = TrigramIndex.build(product.search_key for product in self.products)
+            object.__setattr__(self, "_trigrams", index)
+        return index
+
+    def _search_key(self, index: int) -> str:
+        return self.products[index].search_key
+
+    def find(self, name: str) -> Optional[CatalogProduct]:
+        """Exact lookup, else the first product whose name contains the given text"""
+        product = self.get(name)
+        if product is not None:
+            return product
+        key = normalize_name(name)
+        if not key:
+            return None
+        index = self.trigram_index.first_containing(key, self._search_key)
+        return None if index is None else self.products[index]
+
+    def closest(self, name: str) -> Optional[CatalogProduct]:
+        """Exact lookup, else the product whose name contains (or is contained in) the text with the closest length"""
+        product = self.get(name)
+        if product is not None:
+            return product
+        key = normalize_name(name)
+        if not key:
+            return None
+        index = self.trigram_index.closest(key, self._search_key)
+        return None if index is None else self.products[index]
+
+    def names(self) -> List[str]:
+        return [product.name for product in self.products]
+
+    def with_translations(self, translations: Mapping[str, str]) -> "Catalog":
+        """New catalog with `translated_name` filled in from a name -> translation mapping"""
+        return Catalog(
+            (product._replace(translated_name=sys.intern(translations[product.name]))
+             if product.name in translations else product
+             for product in self.products),
+            self.metadata,
+            # Same products in the same order - search keys are unchanged
+            self._trigrams,
+        )
@@ -0,0 +1,52 @@
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Reader for the catalog files published by the scraper pipeline.
+# Supports the legacy single-document JSON ({"products": [...]}) and the
+# newline-delimited format: a {"_header": {...}} record, one product per line
+# and a closing {"_footer": {...}} record with statistics.
+HEADER_KEY = "_header"
+FOOTER_KEY = "_footer"
+
+
+def iter_jsonl_catalog(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield ("header" | "product" | "footer", record) tuples from a JSONL catalog"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if HEADER_KEY in record:
+                yield "header", record[HEADER_KEY]
+            elif FOOTER_KEY in record:
+                yield "footer", record[FOOTER_KEY]
+            else:
+                yield "product", record
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """Catalog metadata without loading the products (JSONL: only the first line is read)"""
+    if str(path).endswith(".jsonl"):
+        for kind, record in iter_jsonl_catalog(path):
+            return record if kind == "header" else {}
+        return {}
+    metadata, _ = load_catalog(path)
+    return metadata
+
+
+def load_catalog(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Load (metadata, products) from either catalog format"""
+    if str(path).endswith(".jsonl"):
+        metadata: Dict[str, Any] = {}
+        products = []
+        for kind, record in iter_jsonl_catalog(path):
+            if kind == "product":
+                products.append(record)
+            else:
+                metadata.update(record)
+        return metadata, products
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    products = data.pop('products')
+    return data, products
@@ -0,0 +1,332 @@
+import glob
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from catalog import Catalog
+from catalog_io import read_header
+from logger import get_logger
+from preselect import embedding_text
+from shard import ShardCatalog, embeddings_path, is_current, write_embeddings, write_shard
+
+DEFAULT_STORE = "biedronka"
+# Older shards kept per store next to the current one - the newest is the reuse source for embeddings
+KEEP_PREVIOUS_SHARDS = 1
+
+
+class UnknownStoreError(KeyError):
+    """The requested store has no catalog configured"""
+
+
+def parse_stores(spec: str) -> Dict[str, str]:
+    """Parse "biedronka=shared_data/biedronka.jsonl,lidl-krakow=shared_data/lidl_krakow.jsonl" into {store: path}"""
+    stores = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        store, _, path = entry.partition("=")
+        if not path:
+            raise ValueError(f"Invalid store entry (expected store=path): {entry!r}")
+        stores[store.strip().lower()] = path.strip()
+    return stores
+
+
+class _LoadedShard:
+    __slots__ = ("catalog", "source_mtime", "users")
+
+    def __init__(self, catalog: ShardCatalog, source_mtime: float):
+        self.catalog = catalog
+        self.source_mtime = source_mtime
+        self.users = 0
+
+
+class CatalogRegistry:
+    """
+    Catalogs of several stores (chains or regional offer sheets), one shard per store and
+    offer date. A shard is built from the catalog published by the scraper pipeline (warm() at
+    startup, or when the pipeline publishes a newer catalog), stored under
+    `shards_dir/<store>/<date>.shard` and memory-mapped, so all workers share one copy through
+    the page cache. Shards not used by any request are unmapped, least recently used first,
+    when the mapped total exceeds `memory_budget` bytes. Once a new shard has its embeddings,
+    the store's older shards are deleted except the newest one (KEEP_PREVIOUS_SHARDS).
+
+    Builds (LLM translations, product embeddings) run off the request path: requests keep the
+    previous shard while a newer one is built in the background and swapped in. Only a request
+    for a store with no shard at all waits - for that store's shard, under the store's own build
+    lock; embeddings follow in the background (ranking falls back to discounts until then).
+
+        with registry.acquire("biedronka") as catalog:
+            product = catalog.find("Szynka")
+    """
+
+    def __init__(self, sources: Dict[str, str], shards_dir: str, memory_budget: int,
+                 default_store: Optional[str] = None, prepare: Optional[Callable[[Catalog], Catalog]] = None,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        if not sources:
+            raise ValueError("No store catalogs configured")
+        self.sources = dict(sources)
+        self.shards_dir = shards_dir
+        self.memory_budget = memory_budget
+        self.default_store = default_store or next(iter(self.sources))
+        # Applied to the in-memory catalog before it is written as a shard (e.g. missing translations)
+        self.prepare = prepare
+        # Embeds product texts for relevance ranking (see preselect), stored next to each shard
+        self.embed = embed
+        self.logger = get_logger("app-CatalogRegistry")
+        self._lock = threading.Lock()
+        self._loaded: "OrderedDict[str, _LoadedShard]" = OrderedDict()
+        self._build_locks = {store: threading.Lock() for store in self.sources}
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prepare: Optional[Callable[[Catalog], Catalog]] = None,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None) -> "CatalogRegistry":
+        """
+        CATALOG_STORES="store=path,..." (default: PRODUCTS_FILE as the Biedronka catalog),
+        CATALOG_SHARDS_DIR, CATALOG_MEMORY_BUDGET_MB, DEFAULT_STORE
+        """
+        spec = os.getenv("CATALOG_STORES")
+        if spec:
+            sources = parse_stores(spec)
+        else:
+            sources = {DEFAULT_STORE: os.getenv("PRODUCTS_FILE", "shared_data/biedronka_offers_enhanced.json")}
+        return cls(
+            sources,
+            shards_dir=os.getenv("CATALOG_SHARDS_DIR", "shared_data/shards"),
+            memory_budget=int(float(os.getenv("CATALOG_MEMORY_BUDGET_MB", "256")) * 2**20),
+            default_store=os.getenv("DEFAULT_STORE") or None,
+            prepare=prepare,
+            embed=embed,
+        )
+
+    def stores(self) -> List[str]:
+        return sorted(self.sources)
+
+    def resolve_store(self, store: Optional[str]) -> str:
+        store = (store or self.default_store).strip().lower()
+        if store not in self.sources:
+            raise UnknownStoreError(store)
+        return store
+
+    @property
+    def mapped_bytes(self) -> int:
+        return sum(entry.catalog.nbytes for entry in self._loaded.values())
+
+    def shard_path(self, store: str, source_path: str) -> str:
+        """Shard location for the store's current catalog, dated by the scrape date from its header"""
+        date = None
+        try:
+            header = read_header(source_path)
+            date = str(header.get("scraped_at") or "")[:10] or None
+        except (OSError, ValueError):
+            pass
+        if date is None:
+            date = datetime.fromtimestamp(os.path.getmtime(source_path)).strftime("%Y-%m-%d")
+        return os.path.join(self.shards_dir, store, f"{date}.shard")
+
+    def _shard_ready(self, path: str, source_path: str) -> bool:
+        return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path) and is_current(path)
+
+    def _embeddings_ready(self, path: str) -> bool:
+        embeddings = embeddings_path(path)
+        return self.embed is None or (os.path.exists(embeddings) and os.path.getmtime(embeddings) >= os.path.getmtime(path))
+
+    def _build_shard(self, store: str, source_path: str) -> str:
+        path = self.shard_path(store, source_path)
+        if not self._shard_ready(path, source_path):
+            self.logger.info(f"📦 Building catalog shard for '{store}' from {source_path}")
+            catalog = Catalog.from_file(source_path)
+            if self.prepare is not None:
+                catalog = self.prepare(catalog)
+            # Same-day rebuild (the pipeline re-ran): this shard's embeddings are reused for unchanged products
+            self._keep_as_previous(path)
+            write_shard(path, catalog, {"store": store})
+            self.logger.info(f"📦 Wrote {len(catalog)} products to {path}")
+        return path
+
+    def _keep_as_previous(self, path: str):
+        """Link a shard about to be overwritten, and its embeddings, to `<date>.previous.shard`"""
+        if not (is_current(path) and self._embeddings_ready(path) and os.path.exists(embeddings_path(path))):
+            return
+        previous = f"{path[:-len('.shard')]}.previous.shard"
+        # The shard first - embeddings must not be older than their shard
+        for source, target in ((path, previous), (embeddings_path(path), embeddings_path(previous))):
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+
+    def _previous_shard(self, store: str, path: str) -> Optional[ShardCatalog]:
+        """The store's most recent other shard with embeddings (unchanged products are not re-embedded)"""
+        previous = sorted(p for p in glob.glob(os.path.join(self.shards_dir, store, "*.shard"))
+                          if p != path and os.path.exists(embeddings_path(p)) and is_current(p))
+        for candidate in reversed(previous):
+            try:
+                shard = ShardCatalog(candidate)
+            except (OSError, ValueError):
+                # Pruned by another worker in the meantime
+                continue
+            if shard.embeddings is not None:
+                return shard
+            shard.close()
+        return None
+
+    def _build_embeddings(self, store: str, path: str):
+        shard = ShardCatalog(path)
+        try:
+            texts = [embedding_text(product) for product in shard]
+        finally:
+            shard.close()
+
+        previous = self._previous_shard(store, path)
+        try:
+            reused = {}
+            if previous is not None:
+                reused = {embedding_text(product): index for index, product in enumerate(previous)}
+            missing = list(dict.fromkeys(text for text in texts if text not in reused))
+            self.logger.info(f"📦 Embedding {len(missing)} products for '{store}' ({len(texts) - len(missing)} reused)")
+            embedded = dict(zip(missing, np.asarray(self.embed(missing), dtype=np.float32))) if missing else {}
+            vectors = [embedded[text] if text in embedded else previous.embeddings[reused[text]] for text in texts]
+            write_embeddings(path, np.stack(vectors) if vectors else np.zeros((0, 0), np.float32))
+        finally:
+            if previous is not None:
+                previous.close()
+
+    def build(self, store: str, embeddings: bool = True):
+        """Build the store's shard (and embeddings) for its current catalog if missing, then map it"""
+        source_path = self.sources[store]
+        with self._build_locks[store]:
+            source_mtime = os.path.getmtime(source_path)
+            path = self._build_shard(store, source_path)
+            if embeddings and not self._embeddings_ready(path):
+                try:
+                    self._build_embeddings(store, path)
+                except Exception as e:
+                    # Ranking falls back to discounts; the next build retries
+                    self.logger.error(f"❌ Product embeddings for '{store}' failed: {e}")
+            self._install(store, path, source_mtime)
+            if self._embeddings_ready(path):
+                self._prune(store, path)
+
+    def _prune(self, store: str, path: str):
+        """Delete the store's old shards but the newest KEEP_PREVIOUS_SHARDS (mappings in other workers stay valid)"""
+        older = sorted((p for p in glob.glob(os.path.join(self.shards_dir, store, "*.shard")) if p != path),
+                       reverse=True)
+        for old in older[KEEP_PREVIOUS_SHARDS:]:
+            for file in (old, embeddings_path(old)):
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass
+            self.logger.info(f"📦 Removed old catalog shard {old}")
+
+    def _install(self, store: str, path: str, source_mtime: float):
+        """Map a built shard as the store's current one (requests using the old shard keep it until they finish)"""
+        with self._lock:
+            entry = self._loaded.get(store)
+            if entry is not None and entry.source_mtime >= source_mtime and \
+                    (entry.catalog.embeddings is not None or not self._embeddings_ready(path)):
+                return
+            catalog = ShardCatalog(path)
+            self._loaded[store] = _LoadedShard(catalog, source_mtime)
+            self._loaded.move_to_end(store)
+            if entry is not None and entry.users == 0:
+                entry.catalog.close()
+            self.logger.info(f"📦 Mapped '{store}' catalog ({len(catalog)} products, {catalog.nbytes / 2**20:.1f} MB)")
+            self._evict()
+
+    def build_in_background(self, store: str):
+        """build() in a background thread (at most one pending per store)"""
+        with self._pending_lock:
+            if store in self._pending:
+                return
+            self._pending.add(store)
+
+        def run():
+            try:
+                self.build(store)
+            except Exception as e:
+                self.logger.error(f"❌ Building catalog shard for '{store}' failed: {e}")
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(store)
+        threading.Thread(target=run, name=f"catalog-build-{store}", daemon=True).start()
+
+    def warm(self, background: bool = True):
+        """Build and map the shards of all stores (first all shards, then embeddings)"""
+        def run():
+            for embeddings in (False, True):
+                for store in self.sources:
+                    try:
+                        self.build(store, embeddings)
+                    except Exception as e:
+                        self.logger.error(f"❌ Building catalog shard for '{store}' failed: {e}")
+        if background:
+            threading.Thread(target=run, name="catalog-warm", daemon=True).start()
+        else:
+            run()
+
+    def _current(self, store: str) -> Optional[_LoadedShard]:
+        """The store's mapped shard (a stale one while a newer is built), None when there is none yet"""
+        source_path = self.sources[store]
+        source_mtime = os.path.getmtime(source_path)
+        entry = self._loaded.get(store)
+        if entry is None:
+            # Built earlier (another worker, a previous run) - mapping it is cheap
+            path = self.shard_path(store, source_path)
+            if not self._shard_ready(path, source_path):
+                return None
+            entry = _LoadedShard(ShardCatalog(path), source_mtime)
+            self._loaded[store] = entry
+            self.logger.info(f"📦 Mapped '{store}' catalog ({len(entry.catalog)} products, {entry.catalog.nbytes / 2**20:.1f} MB)")
+            if not self._embeddings_ready(path):
+                self.build_in_background(store)
+        elif entry.source_mtime != source_mtime:
+            # The pipeline published a newer catalog - served from the old shard until it is built
+            self.build_in_background(store)
+        self._loaded.move_to_end(store)
+        return entry
+
+    def _evict(self):
+        for store in list(self._loaded):
+            if self.mapped_bytes <= self.memory_budget:
+                return
+            entry = self._loaded[store]
+            if entry.users == 0:
+                del self._loaded[store]
+                entry.catalog.close()
+                self.logger.info(f"📦 Unmapped idle '{store}' catalog")
+
+    @contextmanager
+    def acquire(self, store: Optional[str] = None) -> Iterator[ShardCatalog]:
+        """Catalog of a store (the default store when None) for the duration of the block"""
+        store = self.resolve_store(store)
+        while True:
+            with self._lock:
+                entry = self._current(store)
+                if entry is not None:
+                    entry.users += 1
+                    self._evict()
+                    break
+            # No shard of this store yet: build it without holding the registry lock (requests for
+            # other stores go on), embeddings afterwards in the background
+            self.build(store, embeddings=False)
+            self.build_in_background(store)
+        try:
+            yield entry.catalog
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.users == 0 and self._loaded.get(store) is not entry:
+                    # Replaced by a newer shard while in use
+                    entry.catalog.close()
+                self._evict()
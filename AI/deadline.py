@@ -0,0 +1,140 @@
+import contextvars
+import math
+import os
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Overall budget of one /api/ask request (seconds) and the cap a client may ask for
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE_S", "60"))
+MAX_REQUEST_DEADLINE = float(os.getenv("MAX_REQUEST_DEADLINE_S", "120"))
+# Time that must be left for an optional stage to run - below it the stage is skipped (degraded)
+DEGRADE_THRESHOLDS = {
+    "translate_query": float(os.getenv("DEGRADE_TRANSLATE_S", "30")),
+    "search_query": float(os.getenv("DEGRADE_REWRITE_S", "30")),
+    "recipe_search": float(os.getenv("DEGRADE_RECIPE_SEARCH_S", "25")),
+}
+# Floor of a call timeout (a zero timeout would fail the call before it is sent)
+MIN_CALL_TIMEOUT = 0.1
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class RequestCancelled(Exception):
+    """The client disconnected - stop spending tokens on the request"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before a result could be produced"""
+
+
+class Deadline:
+    """
+    Time budget of one request, shared by all its stages (via the context, see scope()):
+    calls get timeouts from what is left, optional stages are skipped when time runs short
+    and a disconnected client cancels the request.
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.started = time.monotonic()
+        self.expires = self.started + budget if budget else math.inf
+        self.cancelled = threading.Event()
+        self.degraded: List[str] = []
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self, stage: str = ""):
+        if self.cancelled.is_set():
+            raise RequestCancelled(f"Client disconnected{f' before {stage}' if stage else ''}")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Request deadline exceeded{f' before {stage}' if stage else ''}")
+
+    def timeout(self, stage: str, cap: float, attempts: int = 1) -> float:
+        """
+        Timeout for a call of `stage`: what is left of the budget, at most `cap` - split between
+        the `attempts` the client makes (the SDK retries timed-out calls on its own)
+        """
+        self.check(stage)
+        return max(MIN_CALL_TIMEOUT, min(self.remaining() / max(attempts, 1), cap))
+
+    def allows(self, stage: str) -> bool:
+        """Whether an optional stage still fits in the budget; skipped stages are recorded"""
+        self.check(stage)
+        if self.remaining() >= DEGRADE_THRESHOLDS.get(stage, 0.0):
+            return True
+        self.degraded.append(stage)
+        return False
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Deadline:
+    """Deadline of the request being handled (unlimited outside of a request, e.g. in scripts)"""
+    deadline = _current.get()
+    return deadline if deadline is not None else Deadline()
+
+
+@contextmanager
+def scope(deadline: Deadline) -> Iterator[Deadline]:
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def request_budget(requested: Any) -> float:
+    """Budget for a request: the client's `deadline_s` if given (capped), else REQUEST_DEADLINE"""
+    try:
+        budget = float(requested)
+    except (TypeError, ValueError):
+        return REQUEST_DEADLINE
+    return min(budget, MAX_REQUEST_DEADLINE) if budget > 0 else REQUEST_DEADLINE
+
+
+def client_socket(environ: Dict[str, Any]) -> Optional[socket.socket]:
+    """Connection of the request (Werkzeug and gunicorn expose it in the WSGI environ)"""
+    return environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+
+
+def is_disconnected(sock: socket.socket) -> bool:
+    """A readable socket with nothing to read has been closed by the peer"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+@contextmanager
+def watch_disconnect(deadline: Deadline, sock: Optional[socket.socket]) -> Iterator[None]:
+    """Cancel the deadline when the client closes the connection while the request runs"""
+    if sock is None:
+        yield
+        return
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(DISCONNECT_POLL_INTERVAL):
+            if is_disconnected(sock):
+                deadline.cancel()
+                return
+
+    watcher = threading.Thread(target=watch, name="disconnect-watch", daemon=True)
+    watcher.start()
+    try:
+        yield
+    finally:
+        done.set()
@@ -0,0 +1,126 @@
+"""
+Recall@k of recipe retrieval for product ingredients: the previous dense search (wide limit +
+substring pass) vs sparse BM25 vs hybrid (rank fusion). A recipe is relevant to a query when its
+ingredient list contains the query ingredient.
+
+    python eval_retrieval.py [recipes.json|dataset.csv] [--k 1 3 5] [--queries chicken butter] [--json]
+
+Dense and hybrid need OPENAI_API_KEY (recipe and query embeddings, cached with --embeddings-cache);
+without it only the sparse results are reported.
+"""
+import argparse
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from recipe_index import load_recipes, recipe_payload
+from recipe_tags import parse_ingredients
+from sparse_index import BM25Index, rrf, stem
+
+DEFAULT_RECIPES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "embedder", "sample_recipes.json")
+DEFAULT_QUERIES = ["chicken", "butter", "lemon", "potato", "egg", "onion", "garlic", "milk", "cheddar", "rice",
+                   "lamb", "apple", "sugar", "ginger", "salmon", "tomato", "pasta", "yogurt", "spinach", "mushroom"]
+# The previous live search: one dense search with up to 150 hits, then a substring pass
+DENSE_SEARCH_LIMIT = 150
+HYBRID_DENSE_LIMIT = 20
+
+
+def contains_ingredient(payload: Dict[str, Any], query: str) -> bool:
+    words = {stem(word) for word in re.findall(r"[a-zà-ÿ]+", " ".join(parse_ingredients(payload["ingredients"])).lower())}
+    return stem(query.lower()) in words
+
+
+def recall_at_k(ranking: List[int], relevant: set, k: int) -> float:
+    return len(relevant.intersection(ranking[:k])) / min(k, len(relevant))
+
+
+def embed_all(texts: List[str], cache_path: Optional[str]) -> Optional[np.ndarray]:
+    """Normalized embeddings (cached by text), None without an API key"""
+    cache: Dict[str, List[float]] = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    missing = [text for text in dict.fromkeys(texts) if text not in cache]
+    if missing:
+        if not os.getenv("OPENAI_API_KEY"):
+            return None
+        from openai import OpenAI
+        client = OpenAI()
+        model = os.getenv("RECIPE_EMBEDDING_MODEL", "text-embedding-3-small")
+        for start in range(0, len(missing), 100):
+            batch = missing[start:start + 100]
+            response = client.embeddings.create(model=model, input=batch)
+            for text, item in zip(batch, sorted(response.data, key=lambda item: item.index)):
+                cache[text] = item.embedding
+        if cache_path:
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+    vectors = np.asarray([cache[text] for text in texts], dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run(recipes_path: str, queries: List[str], ks: List[int], cache_path: Optional[str]) -> Dict[str, Any]:
+    payloads = [recipe_payload(row) for row in load_recipes(recipes_path)]
+    index = BM25Index.from_payloads(enumerate(payloads))
+    relevant = {query: {i for i, payload in enumerate(payloads) if contains_ingredient(payload, query)}
+                for query in queries}
+    queries = [query for query in queries if relevant[query]]
+
+    recipe_vectors = embed_all([payload["page_content"] for payload in payloads], cache_path)
+    query_vectors = embed_all(queries, cache_path) if recipe_vectors is not None else None
+
+    rankings: Dict[str, Dict[str, List[int]]] = {"sparse": {}}
+    hits_fetched = {"sparse": 0}
+    for query in queries:
+        rankings["sparse"][query] = [doc for doc, _ in index.search(query, limit=max(ks) * 5)]
+
+    if query_vectors is not None:
+        rankings.update({"dense": {}, "hybrid": {}})
+        hits_fetched.update({"dense": DENSE_SEARCH_LIMIT, "hybrid": HYBRID_DENSE_LIMIT})
+        for query, vector in zip(queries, query_vectors):
+            dense = list(np.argsort(-(recipe_vectors @ vector)))
+            # Previous approach: wide dense search, recipes naming the ingredient first
+            wide = dense[:DENSE_SEARCH_LIMIT]
+            matching = [doc for doc in wide if query.lower() in (payloads[doc]["title"] + str(payloads[doc]["ingredients"])).lower()]
+            rankings["dense"][query] = [int(doc) for doc in matching + [doc for doc in wide if doc not in matching]]
+            rankings["hybrid"][query] = [doc for doc, _ in rrf([rankings["sparse"][query],
+                                                                [int(doc) for doc in dense[:HYBRID_DENSE_LIMIT]]])]
+
+    report = {"recipes": len(payloads), "queries": queries, "hits_fetched_per_request": hits_fetched, "recall": {}}
+    for method, by_query in rankings.items():
+        report["recall"][method] = {
+            f"recall@{k}": float(np.mean([recall_at_k(by_query[q], relevant[q], k) for q in queries])) if queries else 0.0
+            for k in ks
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recipes", nargs="?", default=DEFAULT_RECIPES)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    parser.add_argument("--embeddings-cache", default=None, help="JSON file caching embeddings between runs")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.recipes, args.queries, sorted(args.k), args.embeddings_cache)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Recipe retrieval recall - {report['recipes']} recipes, {len(report['queries'])} ingredient queries")
+    columns = list(next(iter(report["recall"].values())).keys())
+    print(f"{'method':<10}" + "".join(f"{column:>12}" for column in columns) + f"{'hits fetched':>15}")
+    for method, values in report["recall"].items():
+        print(f"{method:<10}" + "".join(f"{values[column]:>12.3f}" for column in columns)
+              + f"{report['hits_fetched_per_request'][method]:>15}")
+    if "dense" not in report["recall"]:
+        print("(dense and hybrid skipped - set OPENAI_API_KEY to embed recipes and queries)")
+
+
+if __name__ == "__main__":
+    main()
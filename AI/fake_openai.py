@@ -0,0 +1,275 @@
+"""
+Deterministic OpenAI-compatible server for offline benchmarks (bench_e2e.py, load tests).
+
+    python fake_openai.py [--port 8010] [--chat-latency-ms 800] [--token-latency-ms 5] [--embedding-latency-ms 50]
+
+Point the backend at it with OPENAI_BASE_URL=http://localhost:8010/v1 (and any OPENAI_API_KEY).
+Chat completions are answered from bench_recordings.json (translations, search query, meal plan
+built from the recorded meal templates for the requested days and products), streamed as
+server-sent events when asked; embeddings are feature-hashed bags of words, so texts sharing words
+are similar. Latency is injected per request (plus per generated token for chat) to model the
+remote API. GET /v1/stats reports generated tokens and streams the client closed early.
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+RECORDINGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_recordings.json")
+EMBEDDING_SIZE = 1536
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+PRODUCT_LINE = re.compile(r"^- (.+): ([\d.,]+) PLN", re.MULTILINE)
+PLAN_SIZE = re.compile(r"meal plan for (\d+) days for (\d+) people")
+STREAM_CHUNK_CHARS = 64
+
+
+def embed_text(text: str, size: int = EMBEDDING_SIZE) -> np.ndarray:
+    """Normalized feature-hashed word counts (stable across processes, unlike hash())"""
+    vector = np.zeros(size, dtype=np.float32)
+    words = WORD_PATTERN.findall(text.lower()) or [text]
+    for word in words:
+        digest = zlib.crc32(word.encode("utf-8"))
+        vector[digest % size] += 1.0 if digest & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[zlib.crc32(text.encode("utf-8")) % size] = 1.0
+        return vector
+    return vector / norm
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class Responder:
+    """Chat completion content for a request, chosen by the prompt it was built from (prompts.py)"""
+
+    def __init__(self, recordings: Dict[str, Any]):
+        self.recordings = recordings
+
+    def reply(self, messages: List[Dict[str, Any]]) -> str:
+        system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+        user = " ".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+        if "grocery product name" in system:
+            return self.recordings["translations"].get(user.strip(), user.strip())
+        if "Translate the user's message" in system:
+            return self.recordings["queries"].get(user.strip(), user.strip())
+        if "meal planner" in system:
+            return self.meal_plan(user)
+        if user.startswith("Rewrite the following user request"):
+            return self.recordings["search_query"]
+        return "OK"
+
+    def meal_plan(self, prompt: str) -> str:
+        size = PLAN_SIZE.search(prompt)
+        days, people = (int(size.group(1)), int(size.group(2))) if size else (1, 1)
+        products = PRODUCT_LINE.findall(prompt) or [("Produkt", "9,99")]
+        meals = []
+        used = 0
+        for day in range(1, days + 1):
+            for template in self.recordings["meal_templates"]:
+                main_products = []
+                for _ in range(2):
+                    name, price = products[used % len(products)]
+                    used += 1
+                    main_products.append({"name": name, "quantity": f"{100 * people}g",
+                                          "price": f"{price.replace(',', '.')} PLN"})
+                meals.append({"day": day, "type": template["type"], "name": template["name"], "image_name": "",
+                              "main_products": main_products,
+                              "additional_ingredients": template["additional_ingredients"],
+                              "instructions": template["instructions"],
+                              "prep_time": template["prep_time"], "cooking_time": template["cooking_time"]})
+        plan = {
+            "plan_info": {"days": days, "people": people, "estimated_total_cost": f"{35.5 * days * people:.2f} PLN"},
+            "meals": meals,
+            "shopping_summary": {"promotional_products_cost": f"{21.3 * days * people:.2f} PLN",
+                                 "additional_ingredients_cost": f"{14.2 * days * people:.2f} PLN",
+                                 "total_savings": f"{9.8 * days:.2f} PLN"},
+        }
+        # Models usually wrap JSON in a code fence - the output parser has to handle it
+        return "```json\n" + json.dumps(plan, ensure_ascii=False, indent=2) + "\n```"
+
+
+def make_handler(responder: Responder, chat_latency: float, token_latency: float, embedding_latency: float):
+    stats = {"completion_tokens": 0, "cancelled_streams": 0}
+    stats_lock = threading.Lock()
+
+    def count(key: str, value: int = 1):
+        with stats_lock:
+            stats[key] += value
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes - without this, delayed ACKs add ~40 ms per response
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status: int, body: Dict[str, Any]):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/health"):
+                return self.send_json(200, {"status": "ok"})
+            if self.path.rstrip("/").endswith("/stats"):
+                with stats_lock:
+                    return self.send_json(200, dict(stats))
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.endswith("/chat/completions"):
+                if request.get("stream"):
+                    return self.stream_chat(request)
+                return self.send_json(200, self.chat(request))
+            if self.path.endswith("/embeddings"):
+                return self.send_json(200, self.embeddings(request))
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def chat(self, request: Dict[str, Any]) -> Dict[str, Any]:
+            messages = request.get("messages", [])
+            content = responder.reply(messages)
+            prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in messages)
+            completion_tokens = count_tokens(content)
+            time.sleep(chat_latency + token_latency * completion_tokens)
+            count("completion_tokens", completion_tokens)
+            return {
+                "id": f"chatcmpl-fake-{zlib.crc32(content.encode('utf-8')):08x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop", "logprobs": None}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }
+
+        def stream_chat(self, request: Dict[str, Any]):
+            """Server-sent events, one chunk per STREAM_CHUNK_CHARS; stops when the client goes away"""
+            content = responder.reply(request.get("messages", []))
+            completion_id = f"chatcmpl-fake-{zlib.crc32(content.encode('utf-8')):08x}"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def event(delta: Dict[str, Any], finish_reason: Optional[str]):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": request.get("model", "fake"),
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            time.sleep(chat_latency)
+            try:
+                event({"role": "assistant", "content": ""}, None)
+                for start in range(0, len(content), STREAM_CHUNK_CHARS):
+                    piece = content[start:start + STREAM_CHUNK_CHARS]
+                    time.sleep(token_latency * count_tokens(piece))
+                    event({"content": piece}, None)
+                    count("completion_tokens", count_tokens(piece))
+                event({}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                count("cancelled_streams")
+
+        def embeddings(self, request: Dict[str, Any]) -> Dict[str, Any]:
+            inputs = request.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            texts = [text if isinstance(text, str) else " ".join(map(str, text)) for text in inputs]
+            time.sleep(embedding_latency)
+            data = []
+            for i, text in enumerate(texts):
+                vector = embed_text(text, int(request.get("dimensions") or EMBEDDING_SIZE))
+                if request.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+            tokens = sum(count_tokens(text) for text in texts)
+            return {"object": "list", "data": data, "model": request.get("model", "fake"),
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return Handler
+
+
+def serve(port: int = 0, host: str = "127.0.0.1", recordings_file: str = RECORDINGS_FILE, chat_latency_ms: float = 0.0,
+          token_latency_ms: float = 0.0, embedding_latency_ms: float = 0.0, ready=None):
+    with open(recordings_file, "r", encoding="utf-8") as f:
+        responder = Responder(json.load(f))
+    handler = make_handler(responder, chat_latency_ms / 1000, token_latency_ms / 1000, embedding_latency_ms / 1000)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class FakeOpenAIServer:
+    """The fake server in a child process (its CPU time is not counted against the benchmarked process)"""
+
+    def __init__(self, port: int = 0, recordings_file: str = RECORDINGS_FILE, chat_latency_ms: float = 0.0,
+                 token_latency_ms: float = 0.0, embedding_latency_ms: float = 0.0):
+        self.options = dict(port=port, recordings_file=recordings_file, chat_latency_ms=chat_latency_ms,
+                            token_latency_ms=token_latency_ms, embedding_latency_ms=embedding_latency_ms)
+        self.process: Optional[multiprocessing.Process] = None
+        self.port: Optional[int] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        self.process = context.Process(target=serve, kwargs={**self.options, "ready": ready}, daemon=True)
+        self.process.start()
+        self.port = ready.get(timeout=30)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to serve other containers")
+    parser.add_argument("--recordings", default=RECORDINGS_FILE)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="per generated token")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    print(f"🤖 Fake OpenAI API on http://{args.host}:{args.port}/v1")
+    serve(args.port, args.host, args.recordings, args.chat_latency_ms, args.token_latency_ms, args.embedding_latency_ms)
+
+
+if __name__ == "__main__":
+    main()
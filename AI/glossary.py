@@ -0,0 +1,320 @@
+"""
+Local Polish -> English glossary for product names and short queries, so translations do not need
+an LLM call. Built up from past LLM translations (phrases) and catalogs (translated names and
+english_keywords, aligned to single words); unknown phrases still go to the LLM and the result is
+learned.
+
+    python glossary.py build catalog.jsonl [...]     # learn from enhanced catalogs into GLOSSARY_FILE
+    python glossary.py translate "Szynka wieprzowa"  # look a phrase up (with timing)
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from logger import get_logger
+
+GLOSSARY_FORMAT = "glossary"
+GLOSSARY_VERSION = 1
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+# Letters without a Unicode decomposition
+TRANSLITERATION = str.maketrans({"ł": "l", "Ł": "L", "ß": "ss"})
+# Inflection endings (after diacritics are stripped), longest first - a light stemmer, not a dictionary
+SUFFIXES = ("ami", "ach", "owie", "owi", "ego", "emu", "ymi", "imi", "ych", "ich", "ow", "om", "em", "ej", "ym",
+            "im", "a", "e", "i", "o", "u", "y")
+MIN_STEM = 3
+# Units, packaging and marketing words that carry no meaning for the translation
+IGNORED = frozenset("""
+g kg ml l szt op opak x na co dzien lub oraz w z ze i do dla select premium classic extra exclusive
+""".split())
+# Word-by-word composition is only used for short phrases (grocery terms, not sentences)
+COMPOSE_LIMIT = 4
+# Word alignment from catalogs: seen at least this often, co-occurring with one English word this often
+ALIGN_MIN_COUNT = 2
+ALIGN_MIN_RATIO = 0.8
+# ...and the English word is mostly seen with it (not 'pork' for every deli product)
+ALIGN_MIN_SPECIFICITY = 0.6
+# Polish adjectives follow the noun ('szynka wędzona'), English ones precede it ('smoked ham')
+ADJECTIVE_ENDINGS = ("owy", "owa", "owe", "owej", "ony", "ona", "one", "onej", "ny", "na", "ne", "nej", "ski", "ska",
+                     "skie", "zy", "za", "ze", "ty", "ta", "te")
+# Raw text -> result of recent lookups (the same names and queries repeat), cleared on learning
+MEMO_SIZE = 10000
+# Starting vocabulary for composition; catalogs and LLM answers extend it
+BASE_WORDS = {
+    "kurczak": "chicken", "pierś z kurczaka": "chicken breast", "indyk": "turkey", "wieprzowina": "pork",
+    "wołowina": "beef", "szynka": "ham", "boczek": "bacon", "kiełbasa": "sausage", "parówki": "frankfurters",
+    "mięso mielone": "minced meat", "łosoś": "salmon", "pstrąg": "trout", "dorsz": "cod", "krewetki": "shrimp",
+    "ser": "cheese", "mleko": "milk", "masło": "butter", "jogurt": "yogurt", "śmietana": "sour cream",
+    "twaróg": "cottage cheese", "jaja": "eggs", "jajko": "egg", "chleb": "bread", "makaron": "pasta",
+    "ryż": "rice", "kasza": "groats", "mąka": "flour", "ziemniaki": "potatoes", "marchew": "carrot",
+    "cebula": "onion", "czosnek": "garlic", "pomidor": "tomato", "ogórek": "cucumber", "papryka": "pepper",
+    "kapusta": "cabbage", "brokuł": "broccoli", "szpinak": "spinach", "pieczarki": "mushrooms", "jabłko": "apple",
+    "banan": "banana", "cytryna": "lemon", "fasola": "beans", "wędzony": "smoked", "świeży": "fresh",
+    "mrożony": "frozen", "obiad": "dinner", "śniadanie": "breakfast", "kolacja": "supper",
+}
+
+logger = get_logger("app-Glossary")
+
+
+def fold(text: str) -> str:
+    """Lowercase without diacritics: 'Łosoś wędzony' -> 'losos wedzony'"""
+    text = unicodedata.normalize("NFKD", (text or "").translate(TRANSLITERATION))
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def lemma(token: str) -> str:
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def lemmas(text: str, keep_ignored: bool = False) -> List[str]:
+    return [lemma(token) for token in TOKEN_PATTERN.findall(fold(text))
+            if keep_ignored or (token not in IGNORED and len(token) > 1)]
+
+
+def content_words(text: str, brands: bool = True) -> List[Tuple[str, str]]:
+    """
+    (lemma, folded word) of the meaningful words. In product names (`brands`) capitalized words
+    after the first are brands ('Kraina Wędlin') and skipped; user queries keep every word.
+    """
+    words = WORD_PATTERN.findall(text or "")
+    return [(lemma(token), token) for i, original in enumerate(words) if not brands or i == 0 or not original[0].isupper()
+            for token in TOKEN_PATTERN.findall(fold(original)) if token not in IGNORED and len(token) > 1]
+
+
+def content_lemmas(text: str) -> List[str]:
+    return [word for word, _ in content_words(text)]
+
+
+def is_adjective(word: str) -> bool:
+    return word.endswith(ADJECTIVE_ENDINGS)
+
+
+def phrase_key(text: str) -> str:
+    return " ".join(lemmas(text, keep_ignored=True))
+
+
+class Glossary:
+    """
+    Phrase table (exact, lemmatized phrases - product names, queries) plus a trie of word
+    sequences for composing short phrases word by word (longest match first).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.phrases: Dict[str, str] = {}
+        self.trie: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.memo: Dict[Tuple[str, bool], Optional[str]] = {}
+        self.saved_at = time.monotonic()
+        for polish, english in BASE_WORDS.items():
+            self._insert(content_lemmas(polish), english)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Glossary {self.path} unreadable, starting empty: {e}")
+            return
+        self.phrases = data.get("phrases", {})
+        for words, translation in data.get("words", {}).items():
+            self._insert(words.split(), translation)
+
+    def save(self):
+        """Atomic write (tmp + rename), only when something was learned"""
+        if not self.path or not self.dirty:
+            return
+        with self.lock:
+            data = {"format": GLOSSARY_FORMAT, "version": GLOSSARY_VERSION, "phrases": self.phrases,
+                    "words": dict(self._words(self.trie, []))}
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.saved_at = time.monotonic()
+
+    def maybe_save(self, min_interval: float = 60.0):
+        """Save learned entries at most every `min_interval` seconds (per-request learning)"""
+        if self.dirty and time.monotonic() - self.saved_at >= min_interval:
+            self.save()
+
+    def _words(self, node: Dict[str, Any], prefix: List[str]) -> Iterable[Tuple[str, str]]:
+        for key, child in node.items():
+            if key == "":
+                yield " ".join(prefix), child
+            else:
+                yield from self._words(child, prefix + [key])
+
+    def _insert(self, words: List[str], translation: str):
+        node = self.trie
+        for word in words:
+            node = node.setdefault(word, {})
+        node[""] = translation
+
+    def add_words(self, polish: str, english: str):
+        """Word or short term entry used for composition ('pierś z kurczaka' -> 'chicken breast')"""
+        words = content_lemmas(polish)
+        if words and english:
+            with self.lock:
+                self._insert(words, english.strip())
+                self.memo.clear()
+                self.dirty = True
+
+    def learn(self, polish: str, english: str):
+        """Remember a translation (an LLM result) for the exact phrase"""
+        key = phrase_key(polish)
+        english = (english or "").strip()
+        if not key or not english or fold(english) == fold(polish):
+            return
+        with self.lock:
+            if self.phrases.get(key) != english:
+                self.phrases[key] = english
+                self.memo.clear()
+                self.dirty = True
+
+    def learn_catalog(self, products: Iterable[Any]) -> int:
+        """
+        Learn product name translations from a catalog (CatalogProduct or dict records) and align
+        single Polish words to the English word they co-occur with in names and english_keywords.
+        Returns the number of phrases learned.
+        """
+        occurrences: Counter = Counter()
+        cooccurrences: Dict[str, Counter] = defaultdict(Counter)
+        english_frequency: Counter = Counter()
+        learned = 0
+        for product in products:
+            get = product.get if isinstance(product, dict) else lambda field, p=product: getattr(p, field, None)
+            name = get("name") or ""
+            translated = get("translated_name")
+            keywords = get("english_keywords") or get("keywords") or ()
+            if translated:
+                self.learn(name, translated)
+                learned += 1
+            english = {word for word in TOKEN_PATTERN.findall(" ".join([translated or "", *keywords]).lower())
+                       if len(word) > 2}
+            if not english:
+                continue
+            english_frequency.update(english)
+            for word in set(content_lemmas(name)):
+                occurrences[word] += 1
+                cooccurrences[word].update(english)
+
+        for word, count in occurrences.items():
+            if count < ALIGN_MIN_COUNT or self._lookup([word]) is not None:
+                continue
+            # Most specific English word among those always seen with it (ties: skip)
+            candidates = [(english_frequency[english], english) for english, seen in cooccurrences[word].items()
+                          if seen / count >= ALIGN_MIN_RATIO
+                          and seen / english_frequency[english] >= ALIGN_MIN_SPECIFICITY]
+            candidates.sort()
+            if candidates and (len(candidates) == 1 or candidates[0][0] < candidates[1][0]):
+                with self.lock:
+                    self._insert([word], candidates[0][1])
+                    self.memo.clear()
+                    self.dirty = True
+        return learned
+
+    def _lookup(self, words: List[str]) -> Optional[str]:
+        node = self.trie
+        for word in words:
+            node = node.get(word)
+            if node is None:
+                return None
+        return node.get("")
+
+    def compose(self, text: str, brands: bool = True) -> Optional[str]:
+        """Word-by-word translation (longest trie match first, brands skipped), None if a word is unknown"""
+        tokens = content_words(text, brands)
+        words = [word for word, _ in tokens]
+        if not words or len(words) > COMPOSE_LIMIT:
+            return None
+        parts = []
+        modifiers = []
+        i = 0
+        while i < len(words):
+            node, match, end = self.trie, None, i
+            for j in range(i, len(words)):
+                node = node.get(words[j])
+                if node is None:
+                    break
+                if "" in node:
+                    match, end = node[""], j + 1
+            if match is None:
+                return None
+            (modifiers if end == i + 1 and i > 0 and is_adjective(tokens[i][1]) else parts).append(match)
+            i = end
+        return " ".join(modifiers + parts)
+
+    def translate(self, text: str, brands: bool = True) -> Optional[str]:
+        """
+        Known phrase, else composition of known words; None = ask the LLM (and learn the answer).
+        `brands`: the text is a product name, whose capitalized words after the first are skipped.
+        """
+        try:
+            translation = self.memo[(text, brands)]
+        except KeyError:
+            translation = self.phrases.get(phrase_key(text)) or self.compose(text, brands)
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[(text, brands)] = translation
+        if translation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return translation
+
+    def translate_query(self, text: str) -> Optional[str]:
+        """Translation of a free-text user query: no word is taken for a brand, any unknown one means the LLM"""
+        return self.translate(text, brands=False)
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f"{len(self.phrases)} phrases, {self.hits}/{lookups} local hits ({rate:.0%})"
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "translate"):
+        print(__doc__)
+        sys.exit(1)
+    glossary = Glossary(os.getenv("GLOSSARY_FILE", "shared_data/glossary.json"))
+    if sys.argv[1] == "build":
+        from catalog_io import load_catalog
+        for path in sys.argv[2:]:
+            _, records = load_catalog(path)
+            learned = glossary.learn_catalog(records)
+            logger.info(f"📖 {path}: {learned} translated names")
+        glossary.save()
+        logger.info(f"📖 Glossary {glossary.path}: {len(glossary)} phrases, {len(dict(glossary._words(glossary.trie, [])))} words")
+    else:
+        text = " ".join(sys.argv[2:])
+        started = time.perf_counter()
+        for _ in range(1000):
+            translation = glossary.translate(text)
+        elapsed_us = (time.perf_counter() - started) * 1000
+        print(f"{text} -> {translation if translation is not None else '(unknown - LLM fallback)'} ({elapsed_us:.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Load test of /api/ask: replays a weighted mix of plan requests with a ramp of concurrent users and
+reports throughput, p50/p95/p99 latency and error rate per step, plus the saturation point (the
+concurrency after which throughput stops growing while latency keeps rising).
+
+    python loadtest.py [--concurrency 1 2 4 8 16] [--duration 30] [--output run.json]
+    python loadtest.py --target http://localhost:5000 [--mix requests.jsonl] ...
+
+Without --target the backend (app.py, Flask threaded server) is started locally in a child process
+with stand-ins: fake_openai.py for OpenAI and an in-memory Qdrant with the sample recipes, both
+with configurable delays (--chat-latency-ms, --token-latency-ms, --embedding-latency-ms,
+--qdrant-latency-ms). With --target an already running deployment is tested as it is configured
+(e.g. OPENAI_BASE_URL pointing at `python fake_openai.py --host 0.0.0.0`). The JSON report
+(--output) keeps the configuration next to the results, so runs can be compared.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from bench_e2e import DEFAULT_OFFERS, DEFAULT_RECIPES, SCENARIOS
+from fake_openai import FakeOpenAIServer
+
+# Short plans are the common case
+DEFAULT_WEIGHTS = {"1d-1p": 0.4, "3d-2p": 0.3, "5d-4p": 0.2, "7d-6p": 0.1}
+REQUEST_TIMEOUT = 300
+
+
+def default_mix() -> List[Dict[str, Any]]:
+    return [{"weight": DEFAULT_WEIGHTS.get(scenario["name"], 0.1), "name": scenario["name"], "body": {
+        "query": scenario["question"], "days": scenario["days"], "people": scenario["people"],
+        "restrictions": scenario["dietary_restrictions"], "meal_types": scenario["meal_types"],
+        "excluded_ingredients": scenario["excluded_ingredients"]}} for scenario in SCENARIOS]
+
+
+def load_mix(path: str) -> List[Dict[str, Any]]:
+    """JSON lines: {"body": <request body>, "weight": 1.0, "name": "..."} or just the request body"""
+    mix = []
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                entry = json.loads(line)
+                if "body" not in entry:
+                    entry = {"body": entry}
+                mix.append({"weight": entry.get("weight", 1.0), "name": entry.get("name", f"request-{i}"),
+                            "body": entry["body"]})
+    return mix
+
+
+class DelayedQdrant:
+    """Qdrant client stand-in: every call is delayed like a network round trip"""
+
+    def __init__(self, client, delay_ms: float):
+        self.client = client
+        self.delay = delay_ms / 1000
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def delayed(*args, **kwargs):
+            time.sleep(self.delay)
+            return attribute(*args, **kwargs)
+        return delayed
+
+
+def serve_backend(base_url: str, qdrant_latency_ms: float, recipes: str, offers: str, work_dir: str, ready):
+    from werkzeug.serving import make_server
+    from bench_e2e import load_planner
+
+    planner = load_planner(base_url, recipes, offers, work_dir)
+    if qdrant_latency_ms:
+        planner.qdrant_client = DelayedQdrant(planner.qdrant_client, qdrant_latency_ms)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    from app import app
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+class LocalBackend:
+    """app.py in a child process, wired to the stand-ins"""
+
+    def __init__(self, base_url: str, qdrant_latency_ms: float, recipes: str, offers: str):
+        self.args = (base_url, qdrant_latency_ms, recipes, offers)
+        self.process: Optional[multiprocessing.Process] = None
+        self.work_dir = tempfile.TemporaryDirectory(prefix="loadtest-")
+
+    def start(self) -> str:
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        self.process = context.Process(target=serve_backend, args=(*self.args, self.work_dir.name, ready), daemon=True)
+        self.process.start()
+        return f"http://127.0.0.1:{ready.get(timeout=120)}"
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+        self.work_dir.cleanup()
+
+
+def send(url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    request = urllib.request.Request(f"{url}/api/ask", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            ok = response.status == 200 and json.loads(response.read()).get("status") == "success"
+            error = None if ok else "plan_error"
+    except urllib.error.HTTPError as e:
+        error = f"http_{e.code}"
+    except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+        error = type(getattr(e, "reason", e)).__name__
+    return {"latency_ms": (time.perf_counter() - started) * 1000, "error": error}
+
+
+def run_step(url: str, mix: List[Dict[str, Any]], concurrency: int, duration: float, seed: int) -> Dict[str, Any]:
+    """Closed loop: `concurrency` users each send the next request as soon as the previous one returns"""
+    samples: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    weights = [entry["weight"] for entry in mix]
+
+    def user(index: int):
+        rng = random.Random(seed * 1000 + index)
+        while time.monotonic() < deadline:
+            entry = rng.choices(mix, weights)[0]
+            sample = send(url, entry["body"])
+            sample["name"] = entry["name"]
+            with lock:
+                samples.append(sample)
+
+    started = time.monotonic()
+    users = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in users:
+        thread.start()
+    for thread in users:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies = np.array([sample["latency_ms"] for sample in samples]) if samples else np.zeros(1)
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if sample["error"]:
+            errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+    completed = len(samples) - sum(errors.values())
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": round(completed / elapsed, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 1),
+    }
+
+
+def saturation_point(steps: List[Dict[str, Any]], min_gain: float, max_error_rate: float) -> Optional[Dict[str, Any]]:
+    """Last step before throughput gains fall under `min_gain` (or errors exceed the limit)"""
+    best = None
+    for step in steps:
+        if step["error_rate"] > max_error_rate:
+            break
+        if best is not None and step["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            break
+        best = step
+    if best is None or best is steps[-1]:
+        # Never saturated within the ramp (or failed at the first step)
+        return None if best is None else {**best, "saturated": False}
+    return {**best, "saturated": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="URL of a running backend (default: start one locally with stand-ins)")
+    parser.add_argument("--mix", help="JSON lines file with the request mix (default: the bench_e2e scenarios)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per concurrency step")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="throughput gain below which the ramp is saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.05)
+    parser.add_argument("--max-p99-ms", type=float, default=120000, help="stop the ramp once p99 exceeds this")
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-latency-ms", type=float, default=2.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=30.0)
+    parser.add_argument("--qdrant-latency-ms", type=float, default=5.0)
+    parser.add_argument("--recipes", default=DEFAULT_RECIPES)
+    parser.add_argument("--offers", default=DEFAULT_OFFERS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="free-form label stored in the report (pod size, serving mode)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    mix = load_mix(args.mix) if args.mix else default_mix()
+    server = backend = None
+    try:
+        if args.target:
+            url = args.target.rstrip("/")
+            stand_ins = None
+        else:
+            server = FakeOpenAIServer(chat_latency_ms=args.chat_latency_ms, token_latency_ms=args.token_latency_ms,
+                                      embedding_latency_ms=args.embedding_latency_ms).start()
+            backend = LocalBackend(server.base_url, args.qdrant_latency_ms, args.recipes, args.offers)
+            url = backend.start()
+            stand_ins = {"chat_latency_ms": args.chat_latency_ms, "token_latency_ms": args.token_latency_ms,
+                         "embedding_latency_ms": args.embedding_latency_ms, "qdrant_latency_ms": args.qdrant_latency_ms}
+            # Warm-up: the first request maps the store catalog and the sparse recipe index
+            send(url, mix[0]["body"])
+
+        steps = []
+        for concurrency in args.concurrency:
+            step = run_step(url, mix, concurrency, args.duration, args.seed)
+            steps.append(step)
+            if not args.json:
+                print(f"👥 {concurrency:>3} users: {step['throughput_rps']:>7.2f} req/s  p50={step['p50_ms']:>8.0f}ms "
+                      f"p95={step['p95_ms']:>8.0f}ms p99={step['p99_ms']:>8.0f}ms errors={step['error_rate']:.1%}")
+            if step["p99_ms"] > args.max_p99_ms or step["error_rate"] > args.max_error_rate:
+                break
+    finally:
+        if backend is not None:
+            backend.stop()
+        if server is not None:
+            server.stop()
+
+    report = {
+        "label": args.label,
+        "target": args.target or "local",
+        "stand_ins": stand_ins,
+        "mix": [{"name": entry["name"], "weight": entry["weight"]} for entry in mix],
+        "duration_s": args.duration,
+        "steps": steps,
+        "saturation": saturation_point(steps, args.min_gain, args.max_error_rate),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif report["saturation"]:
+        saturation = report["saturation"]
+        state = "saturates at" if saturation["saturated"] else "not saturated up to"
+        print(f"📈 Throughput {state} {saturation['concurrency']} users "
+              f"({saturation['throughput_rps']} req/s, p95 {saturation['p95_ms']:.0f} ms)")
+    else:
+        print("💥 No successful step")
+
+
+if __name__ == "__main__":
+    main()
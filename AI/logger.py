@@ -1,18 +1,132 @@
+import atexit
+import copy
+import json
 import logging
-import sys
 import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional, TextIO
+
+# LOG_FORMAT=json (default): one JSON object per line; LOG_FORMAT=text: the readable format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Serialized payloads (plans, product lists) are cut to this many characters
+PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", "2000"))
+# Fraction of payloads serialized at all (the rest are logged as a placeholder)
+PAYLOAD_SAMPLE = float(os.getenv("LOG_PAYLOAD_SAMPLE", "1.0"))
+# Records waiting for the logging thread; when it falls behind, new records are dropped, never waited for
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
+# Attributes every LogRecord has - anything else was passed in `extra` and goes to the JSON record
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class Payload:
+    """
+    Log argument serialized only when the record is written - in the logging thread, and not at all
+    when the level is disabled - truncated to `limit` characters and sampled. Dicts and lists are
+    copied shallowly, so later changes of the top level do not race with the serialization.
+    """
+    __slots__ = ("value", "limit", "sampled")
+
+    def __init__(self, value: Any, limit: Optional[int] = None, sample: Optional[float] = None):
+        self.value = copy.copy(value) if isinstance(value, (dict, list)) else value
+        self.limit = PAYLOAD_LIMIT if limit is None else limit
+        sample = PAYLOAD_SAMPLE if sample is None else sample
+        self.sampled = sample >= 1.0 or random.random() < sample
+
+    def __str__(self) -> str:
+        if not self.sampled:
+            size = f" of {len(self.value)}" if hasattr(self.value, "__len__") else ""
+            return f"<{type(self.value).__name__}{size} not sampled>"
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, ensure_ascii=False, default=str)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}... (+{len(text) - self.limit} chars)"
+        return text
+
+
+def payload(value: Any, limit: Optional[int] = None, sample: Optional[float] = None) -> Payload:
+    return Payload(value, limit, sample)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, `extra` fields and the exception"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the logging thread as they are - formatting (and Payload serialization) happens there"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_output: Optional[logging.StreamHandler] = None
+
+
+def _start() -> NonBlockingQueueHandler:
+    """One queue and one writer thread per process, shared by all loggers"""
+    global _queue_handler, _output
+    with _lock:
+        if _queue_handler is None:
+            _output = logging.StreamHandler(sys.stdout)
+            _output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+            log_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+            listener = QueueListener(log_queue, _output)
+            listener.start()
+            # Records still queued at exit are written before the process ends
+            atexit.register(listener.stop)
+            _queue_handler = NonBlockingQueueHandler(log_queue)
+        return _queue_handler
+
+
+def set_output(stream: TextIO):
+    """Where the logging thread writes (stdout by default)"""
+    _start()
+    _output.setStream(stream)
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
 
 def get_logger(name: str = "app") -> logging.Logger:
     logger = logging.getLogger(name)
     if logger.handlers:
         return logger  # Already configured
 
-    logger.setLevel(logging.INFO)
-    
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(name)s: %(message)s")
-
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
-
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(_start())
+    # Records go only through the queue, not again through the root logger's handlers
+    logger.propagate = False
     return logger
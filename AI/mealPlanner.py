@@ -1,108 +1,249 @@
-import json
+import logging
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
+import httpx
 import openai
 import pickle
 from typing import List, Dict, Any, Optional
 import os
-from logger import get_logger
+import threading
+import time
+from collections import OrderedDict
+from logger import get_logger, payload as log_payload
 from qdrant_client import QdrantClient
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 import pandas as pd
 from uuid import uuid4
 from qdrant_client.models import VectorParams, Distance, PointStruct
-from qdrant_client.http.models import SearchRequest
-from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from langchain_core.runnables import RunnableLambda, RunnableSequence
+from qdrant_client.models import FieldCondition, Filter, MatchValue
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableSequence
 import openai
 from langsmith import traceable
-from prompts import search_query_prompt, translation_prompt, generic_translation_prompt, chat_prompt, recalculate_prompt
-from utils import recalculate_prices, recalculate_prices_manual
+from prompts import search_query_prompt, translation_prompt, generic_translation_prompt, chat_prompt
+from plan_parser import PlanParseError, parse_plan
+from pricing import PriceIndex
+from catalog import Catalog, CatalogProduct
+from catalog_registry import CatalogRegistry
+from deadline import Deadline, DeadlineExceeded, RequestCancelled, current_deadline
+from glossary import Glossary
+from openai_limiter import batch_priority, limited_http_client, limiter_from_env
+from preselect import preselect_products, required_flags
+from recipe_index import SPARSE_INDEX_FILE, search_params, write_sparse_index
+from recipe_matches import RecipeMatchStore
+from recipe_tags import DIET_FIELD, restriction_tags
+from sparse_index import BM25Index, rrf
 
 class MealPlannerAPI:
     def __init__(self):
         self.API_KEY = os.getenv('OPENAI_API_KEY')
         self.QDRANT_URL = os.getenv('QDRANT_URL', 'http://localhost:6333')
         self.RECIPE_DATA_PATH = "shared_data/recipe_embeddings.pkl"
-        self.PRODUCTS_FILE = "shared_data/biedronka_offers_enhanced.json"
-
-        self.client = openai.OpenAI(api_key=self.API_KEY)
+        # Products (most relevant to the request) that reach recipe search and the plan prompt
+        self.PRESELECT_TOP_K = int(os.getenv('PRESELECT_TOP_K', '25'))
+        # Product -> recipe candidates precomputed by the scraper pipeline (match_recipes stage)
+        self.RECIPE_MATCHES_FILE = os.getenv('RECIPE_MATCHES_FILE', "shared_data/{store}_recipe_matches.json")
+        self.QUERY_RECIPE_LIMIT = int(os.getenv('QUERY_RECIPE_LIMIT', '50'))
+        # Dense hits fused with the sparse (BM25) ranking in live recipe search
+        self.HYBRID_DENSE_LIMIT = int(os.getenv('HYBRID_DENSE_LIMIT', '20'))
+        # Upper bounds of single calls (seconds) - within a request they are further cut to its deadline
+        self.QUICK_LLM_TIMEOUT = float(os.getenv('QUICK_LLM_TIMEOUT_S', '10'))
+        self.PLAN_LLM_TIMEOUT = float(os.getenv('PLAN_LLM_TIMEOUT_S', '120'))
+        self.EMBEDDING_TIMEOUT = float(os.getenv('EMBEDDING_TIMEOUT_S', '10'))
+        # Streamed plan generation can be stopped mid-way (disconnect, deadline) at some CPU cost per chunk
+        self.PLAN_STREAM = os.getenv('PLAN_STREAM', '1') != '0'
+        # Retries of a timed-out or failed LLM call (a call's timeout is its share of the deadline)
+        self.LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+
+        # Admission control shared with other replicas and the scraper (OPENAI_RPM, OPENAI_TPM), None when unset
+        self.openai_limiter = limiter_from_env(get_logger("app-OpenAILimiter"))
+        # Waits for capacity are bounded by what is left of the request's deadline
+        http_client = limited_http_client(self.openai_limiter, deadline=lambda: current_deadline().remaining())
+        self.client = openai.OpenAI(api_key=self.API_KEY, http_client=http_client)
         self.logger = get_logger("app-MealPlanner")
 
-        self.qdrant_client = QdrantClient(url=self.QDRANT_URL)
-        self.embedding_model = OpenAIEmbeddings(openai_api_key=self.API_KEY)
+        # QDRANT_URL=":memory:" runs an embedded in-process Qdrant (offline benchmarks)
+        self.qdrant_client = QdrantClient(location=self.QDRANT_URL)
+        # HNSW ef and quantization rescoring for recipe searches (RECIPE_QUANTIZATION, RECIPE_SEARCH_EF)
+        self.recipe_search_params = search_params()
+        self.embedding_model = OpenAIEmbeddings(openai_api_key=self.API_KEY, request_timeout=self.EMBEDDING_TIMEOUT,
+                                                http_client=http_client)
+        # Recipe queries must use the model the recipe collection was indexed with (recipe_index.py)
+        self.recipe_embedding_model = OpenAIEmbeddings(
+            model=os.getenv('RECIPE_EMBEDDING_MODEL', "text-embedding-3-small"),
+            openai_api_key=self.API_KEY,
+            request_timeout=self.EMBEDDING_TIMEOUT,
+            http_client=http_client
+        )
 
         self.llm_quick = ChatOpenAI(
             model="gpt-3.5-turbo",
             temperature=0,
-            max_tokens=60
+            max_tokens=60,
+            max_retries=self.LLM_MAX_RETRIES,
+            http_client=http_client
         )
 
         self.llm = ChatOpenAI(
             model="gpt-4o-mini",
             temperature=0,
-            max_tokens=6000
+            max_tokens=6000,
+            max_retries=self.LLM_MAX_RETRIES,
+            http_client=http_client
         )
 
         self.str_parser = StrOutputParser()
-        self.json_parser = JsonOutputParser()
 
-        # chains
-        self.search_query_chain = search_query_prompt | self.llm_quick | self.str_parser
+        # chains (per-request calls are built by quick_chain, with a timeout from the request deadline)
         self.translation_chain = translation_prompt | self.llm_quick | self.str_parser
-        self.generic_translation_chain = generic_translation_prompt | self.llm_quick | self.str_parser
-
-        self.chat_chain = chat_prompt | self.llm | self.json_parser
-        # self.chat_chain: RunnableSequence = (
-        #     chat_prompt
-        #     | self.llm
-        #     | self.json_parser  # returns dict
-        #     | RunnableLambda(recalculate_prices)
-        #     | recalculate_prompt
-        #     | self.llm
-        #     | self.json_parser  # final parsed dict
-        # )
-
-        # Load data
-        self._load_data()
-        # translate products to english for better results
-        self.translate_product_names()
-
-    def translate_product_names(self):
-        """Translate Polish product names into English (once per session)."""
-        for product in self.products:
-            original_name = product.get("name", "")
+
+        # Provider JSON mode (always syntactically complete JSON, unless cut at max_tokens), then
+        # schema-validated parsing with local repair of truncated output instead of a regeneration
+        self.plan_llm = self.llm
+        if os.getenv('PLAN_JSON_MODE', '1') != '0':
+            self.plan_llm = self.llm.bind(response_format={"type": "json_object"})
+
+        self.recipe_matches = RecipeMatchStore(self.RECIPE_MATCHES_FILE)
+        # Local Polish -> English translations; only unknown phrases go to the LLM (and are learned)
+        self.glossary = Glossary(os.getenv('GLOSSARY_FILE', "shared_data/glossary.json"))
+        # Recipe payloads by Qdrant point ID (bounded, most recently used kept)
+        self.recipe_cache: "OrderedDict[Any, Dict]" = OrderedDict()
+        self.recipe_cache_size = 5000
+        self.recipe_cache_lock = threading.Lock()
+        # Whether the collection has the diet tag index (recipe_index.py tag), rechecked periodically
+        self.diet_index_checked_at = 0.0
+        self.diet_index_available = False
+        # BM25 index file written by recipe_index.py, memory-mapped (one copy for all workers)
+        self.sparse_index: Optional[BM25Index] = None
+        self.sparse_index_mtime: Optional[float] = None
+        self.sparse_index_lock = threading.Lock()
+        threading.Thread(target=self.ensure_sparse_index, name="sparse-index", daemon=True).start()
+
+        # Store catalogs (CATALOG_STORES, default: PRODUCTS_FILE), built and mapped in the background
+        # from startup on. Translations normally come precomputed from the scraper pipeline; names
+        # missing in older catalogs are translated once, when the store's shard is built (so are
+        # product embeddings) - bulk work, admitted with batch priority
+        self.catalogs = CatalogRegistry.from_env(prepare=batch_priority(self.translate_product_names),
+                                                 embed=batch_priority(self.embedding_model.embed_documents))
+        self.catalogs.warm()
+        self.logger.info(f"Configured stores: {', '.join(self.catalogs.stores())} (default: {self.catalogs.default_store})")
+
+    def quick_chain(self, prompt, stage: str) -> RunnableSequence:
+        """prompt | quick LLM | text, the call timeout cut to what is left of the request's deadline"""
+        timeout = current_deadline().timeout(stage, self.QUICK_LLM_TIMEOUT, self.LLM_MAX_RETRIES + 1)
+        return prompt | self.llm_quick.bind(timeout=timeout) | self.str_parser
+
+    def parse_plan_output(self, message: Any) -> Dict:
+        """
+        Meal plan dict from the LLM reply. Raises PlanParseError when it cannot be repaired or has
+        no complete meal; a plan cut short is marked degraded ("plan"), so clients do not cache it.
+        """
+        finish_reason = (getattr(message, "response_metadata", None) or {}).get("finish_reason")
+        try:
+            plan, truncated = parse_plan(message.content)
+        except PlanParseError as e:
+            if finish_reason == "deadline":
+                raise DeadlineExceeded("Request deadline exceeded before a complete meal was generated") from e
+            raise
+        if not plan["meals"]:
+            if finish_reason == "deadline":
+                raise DeadlineExceeded("Request deadline exceeded before a complete meal was generated")
+            raise PlanParseError(f"Model output has no complete meal (finish_reason: {finish_reason})")
+        if truncated:
+            reason = {"length": "cut at max_tokens", "deadline": "cut at the request deadline"}.get(finish_reason, "truncated")
+            self.logger.warning(f"🩹 Plan output {reason}, repaired locally: kept {len(plan['meals'])} complete meals")
+            degraded = current_deadline().degraded
+            if "plan" not in degraded:
+                degraded.append("plan")
+        return plan
+
+    def stream_plan(self, messages: Any, deadline: Deadline) -> AIMessage:
+        """
+        Plan generation streamed, so that a disconnected client or the deadline stops it between
+        chunks - closing the stream closes the connection and the provider stops generating (and
+        billing) tokens. Output cut at the deadline is returned (finish_reason "deadline") and
+        repaired like output cut at max_tokens; a cancelled request raises RequestCancelled.
+        """
+        if not self.PLAN_STREAM:
+            timeout = deadline.timeout("plan", self.PLAN_LLM_TIMEOUT, self.LLM_MAX_RETRIES + 1)
+            try:
+                return self.plan_llm.invoke(messages, timeout=timeout)
+            except openai.APITimeoutError as e:
+                raise DeadlineExceeded("Request deadline exceeded during plan generation") from e
+        parts: List[str] = []
+        finish_reason = None
+        # A streamed call times out between chunks, not for the whole generation
+        stream = self.plan_llm.stream(messages, timeout=deadline.timeout("plan", self.PLAN_LLM_TIMEOUT))
+        try:
+            for chunk in stream:
+                parts.append(chunk.content if isinstance(chunk.content, str) else "")
+                finish_reason = (chunk.response_metadata or {}).get("finish_reason") or finish_reason
+                if deadline.cancelled.is_set():
+                    raise RequestCancelled("Client disconnected during plan generation")
+                if deadline.remaining() <= 0:
+                    finish_reason = "deadline"
+                    break
+        except (openai.APITimeoutError, httpx.TimeoutException):
+            # The read timeout is what was left of the deadline (or the call's cap)
+            finish_reason = "deadline"
+        finally:
+            stream.close()
+        if finish_reason == "deadline":
+            if not parts:
+                raise DeadlineExceeded("Request deadline exceeded before the plan was generated")
+            deadline.degraded.append("plan")
+        return AIMessage(content="".join(parts), response_metadata={"finish_reason": finish_reason})
+
+    def translate_product_names(self, catalog: Catalog) -> Catalog:
+        """Translate Polish product names missing a precomputed English name (once per catalog shard)."""
+        # Precomputed translations and keywords extend the glossary for the names still missing
+        self.glossary.learn_catalog(catalog)
+        missing = [product for product in catalog if not product.translated_name]
+        if not missing:
+            self.logger.info("🗨️ All product names already translated in the catalog")
+            self.glossary.save()
+            return catalog
+        self.logger.info(f"🗨️ Translating {len(missing)} product names missing in the catalog")
+
+        translations = {}
+        for product in missing:
+            original_name = product.name
+            local = self.glossary.translate(original_name)
+            if local is not None:
+                translations[original_name] = local
+                continue
             try:
-                # Skip if already translated
-                if "translated_name" in product:
-                    continue
 
                 translated = self.translation_chain.invoke({"product_name": original_name})
 
-                product["translated_name"] = translated
+                translations[original_name] = translated
+                self.glossary.learn(original_name, translated)
                 self.logger.info(f"🗨️ Translated: {original_name} → {translated}")
 
             except Exception as e:
                 self.logger.error(f"❌ Translation failed for '{original_name}': {e}")
-                product["translated_name"] = original_name  # fallback
-
-    def _load_data(self):
-        """Load recipe embeddings and product data"""
-        try:
-            # Load products
-            with open(self.PRODUCTS_FILE, 'r', encoding='utf-8') as f:
-                products_data = json.load(f)
+                translations[original_name] = original_name  # fallback
+        self.logger.info(f"📖 Glossary: {self.glossary.summary()}")
+        self.glossary.save()
 
-            self.products = products_data['products']
-            self.logger.info(f"Loaded {len(self.products)} products from Biedronka")
-
-        except Exception as e:
-            self.logger.error(f"Error loading data: {e}")
-            raise
+        # The catalog is immutable - return a translated copy
+        return catalog.with_translations(translations)
 
     def translate_to_english(self, text: str) -> str:
+        local = self.glossary.translate_query(text)
+        if local is not None:
+            return local
+        # Short on time: the plan prompt is answered from the Polish query as well
+        if not current_deadline().allows("translate_query"):
+            self.logger.warning("⏱️ Skipping query translation, request deadline is near")
+            return text
+        chain = self.quick_chain(generic_translation_prompt, "translate_query")
         try:
-            return self.generic_translation_chain.invoke({"input_text": text})
+            translated = chain.invoke({"input_text": text})
+            self.glossary.learn(text, translated)
+            self.glossary.maybe_save()
+            return translated
         except Exception as e:
             self.logger.error(f"Translation error: {e}")
             return text  # fallback to original if translation fails
@@ -111,8 +252,12 @@ class MealPlannerAPI:
         """
         Convert user query into a concise recipe search query using LangChain.
         """
+        if not current_deadline().allows("search_query"):
+            self.logger.warning("⏱️ Skipping search query rewrite, request deadline is near")
+            return user_query
+        chain = self.quick_chain(search_query_prompt, "search_query")
         try:
-            rewritten = self.search_query_chain.invoke({"user_request": user_query})
+            rewritten = chain.invoke({"user_request": user_query})
             # result = self.search_query_chain.run(user_request=user_query)
             # rewritten = result.strip()
             self.logger.info(f"Rewritten query: {rewritten}")
@@ -122,136 +267,260 @@ class MealPlannerAPI:
             return user_query
 
     @traceable(name="batch_search_recipes")
-    def batch_search_recipes(self, question: str, products: List[Dict], top_k: int = 10) -> Dict[str, List[Dict]]:
+    def batch_search_recipes(self, question: str, products: List[CatalogProduct], top_k: int = 10,
+                             store: Optional[str] = None, dietary_restrictions: list = []) -> Dict[str, List[Dict]]:
         """
-        Simple, compatible version that works with any Qdrant client version.
-        Major performance improvement with maximum compatibility.
+        Recipes for each product (keyed by its search name). Products in the store's precomputed
+        match table get their candidates from memory, re-ranked by one query-only vector search;
+        the rest fall back to a live combined search. Only recipes tagged with the diets the
+        restrictions require are returned (Qdrant payload filter).
         """
         if not products:
             return {}
+        # Short on time: the plan is generated from the products alone, without suggested recipes
+        if not current_deadline().allows("recipe_search"):
+            self.logger.warning("⏱️ Skipping recipe search, request deadline is near")
+            return {}
 
-        try:
-            keywords = []
-            for product in products:
-                name = product.get("translated_name") or product.get("name", "")
-                keywords.append(name)
-
-
-            # Remove duplicates while preserving order
-            keywords = list(dict.fromkeys(filter(None, keywords)))
-            if not keywords:
-                return {}
-
-            # Create single comprehensive query
-            base_query = self.generate_search_query(question)
-            combined_query = f"{base_query} {', '.join(keywords)}"
-
-            # Single embedding call
-            embedding = self.embedding_model.embed_query(combined_query)
+        # Remove duplicates while preserving order
+        by_keyword = {}
+        for product in products:
+            if product.search_name and product.search_name not in by_keyword:
+                by_keyword[product.search_name] = product
+        if not by_keyword:
+            return {}
 
-            # Calculate search limit
-            search_limit = min(top_k * len(keywords) * 2, 150)
+        base_query = self.generate_search_query(question)
 
-            hits = self.qdrant_client.search(
+        matches = self.recipe_matches.get(store)
+        precomputed, live_keywords = {}, []
+        for keyword, product in by_keyword.items():
+            candidates = matches.candidates(product) if matches is not None else None
+            if candidates:
+                precomputed[keyword] = candidates
+            else:
+                live_keywords.append(keyword)
+
+        diet = restriction_tags(dietary_restrictions)
+        recipe_filter = self.diet_filter(diet)
+        if diet and recipe_filter is None:
+            self.logger.warning("Recipe collection has no diet tags (run recipe_index.py tag), restrictions not filtered")
+            diet = []
+
+        results = {}
+        if precomputed:
+            results.update(self._rank_precomputed_recipes(base_query, precomputed, top_k, diet, recipe_filter))
+            # All precomputed candidates were inadmissible for the diet - search those products live
+            live_keywords += [keyword for keyword in precomputed if not results.get(keyword)] if diet else []
+        if live_keywords:
+            self.logger.info(f"No precomputed recipe matches for {len(live_keywords)} products, searching live")
+            results.update(self._live_search_recipes(base_query, live_keywords, top_k, recipe_filter, diet))
+        return results
+
+    def diet_filter(self, diet: List[str]) -> Optional[Filter]:
+        """Qdrant filter requiring all diet tags, None without restrictions or an untagged collection"""
+        if not diet:
+            return None
+        if time.monotonic() - self.diet_index_checked_at > 600:
+            try:
+                schema = self.qdrant_client.get_collection("recipes").payload_schema or {}
+                self.diet_index_available = DIET_FIELD in schema
+            except Exception as e:
+                self.logger.error(f"Could not read recipe collection schema: {e}")
+                self.diet_index_available = False
+            self.diet_index_checked_at = time.monotonic()
+        if not self.diet_index_available:
+            return None
+        return Filter(must=[FieldCondition(key=DIET_FIELD, match=MatchValue(value=tag)) for tag in diet])
+
+    def _recipe_payloads(self, point_ids) -> Dict[Any, Dict]:
+        """Recipe payloads by point ID - from the cache, missing ones in a single Qdrant retrieve"""
+        with self.recipe_cache_lock:
+            missing = [point_id for point_id in point_ids if point_id not in self.recipe_cache]
+        retrieved = {}
+        if missing:
+            for point in self.qdrant_client.retrieve(collection_name="recipes", ids=missing, with_payload=True):
+                retrieved[point.id] = point.payload or {}
+        payloads = {}
+        with self.recipe_cache_lock:
+            self.recipe_cache.update(retrieved)
+            for point_id in point_ids:
+                if point_id in self.recipe_cache:
+                    self.recipe_cache.move_to_end(point_id)
+                    payloads[point_id] = self.recipe_cache[point_id]
+            while len(self.recipe_cache) > self.recipe_cache_size:
+                self.recipe_cache.popitem(last=False)
+        return payloads
+
+    def _rank_precomputed_recipes(self, base_query: str, precomputed: Dict[str, tuple], top_k: int,
+                                  diet: List[str] = [], recipe_filter: Optional[Filter] = None) -> Dict[str, List[Dict]]:
+        """Precomputed product candidates admissible for the diet, ranked by product match plus relevance to the query"""
+        query_scores = {}
+        try:
+            # The only per-request vector search: the query-specific part
+            hits = self.qdrant_client.query_points(
                 collection_name="recipes",
-                query_vector=embedding,
-                limit=search_limit
-            )
-
-            # Initialize results
-            results_by_keyword = {kw: [] for kw in keywords}
-            seen_ids = set()
-            keyword_counts = {kw: 0 for kw in keywords}
-
-            # Process and distribute results
-            for hit in hits:
-                # Handle different payload access methods
-                payload = getattr(hit, 'payload', None) or {}
-                recipe_id = payload.get("id")
-
-                if recipe_id in seen_ids:
-                    continue
+                query=self.recipe_embedding_model.embed_query(base_query),
+                query_filter=recipe_filter,
+                limit=self.QUERY_RECIPE_LIMIT,
+                search_params=self.recipe_search_params,
+                with_payload=False
+            ).points
+            query_scores = {hit.id: hit.score for hit in hits}
+        except Exception as e:
+            self.logger.error(f"Query recipe search failed, using product matches only: {e}")
 
-                ingredients = payload.get("ingredients", [])
-                title = payload.get("title", "Unknown")
-
-                # Find matching keywords
-                matching_keywords = []
-                for keyword in keywords:
-                    keyword_lower = keyword.lower()
-                    if (any(keyword_lower in str(ing).lower() for ing in ingredients) or
-                        keyword_lower in title.lower()):
-                        matching_keywords.append(keyword)
-
-                # Fallback assignment if no matches
-                if not matching_keywords:
-                    # Assign to keyword with fewest results
-                    matching_keywords = [min(keyword_counts.items(), key=lambda x: x[1])[0]]
-
-                # Assign to first available keyword
-                for keyword in matching_keywords:
-                    if keyword_counts[keyword] < top_k:
-                        # Handle different score access methods
-                        score = getattr(hit, 'score', 0.0)
-
-                        results_by_keyword[keyword].append({
-                            "title": title,
-                            "similarity": score,
-                            "ingredients": ingredients,
-                            "instructions": payload.get("instructions", ""),
-                            "image_name": payload.get("image_name", ""),
-                            "recipe_idx": recipe_id
-                        })
-
-                        seen_ids.add(recipe_id)
-                        keyword_counts[keyword] += 1
-
-                        self.logger.info(f"✔️ Retrieved for '{keyword}': {title} | score: {score:.3f}")
-                        break
-
-                # Early exit if all keywords satisfied
-                if all(count >= top_k for count in keyword_counts.values()):
+        try:
+            payloads = self._recipe_payloads(list(dict.fromkeys(
+                point_id for candidates in precomputed.values() for point_id, _ in candidates)))
+        except Exception as e:
+            self.logger.error(f"Recipe retrieval failed: {e}")
+            return {keyword: [] for keyword in precomputed}
+
+        results_by_keyword = {}
+        seen_ids = set()
+        for keyword, candidates in precomputed.items():
+            ranked = sorted(candidates, key=lambda c: c[1] + query_scores.get(c[0], 0.0), reverse=True)
+            results_by_keyword[keyword] = []
+            for point_id, score in ranked:
+                payload = payloads.get(point_id)
+                if payload is None or point_id in seen_ids:
+                    continue
+                if diet and not set(diet).issubset(payload.get(DIET_FIELD, ())):
+                    continue
+                results_by_keyword[keyword].append({
+                    "title": payload.get("title", "Unknown"),
+                    "similarity": score,
+                    "ingredients": payload.get("ingredients", []),
+                    "instructions": payload.get("instructions", ""),
+                    "image_name": payload.get("image_name", ""),
+                    "recipe_idx": payload.get("id")
+                })
+                seen_ids.add(point_id)
+                self.logger.debug("✔️ Matched for '%s': %s | score: %.3f", keyword, payload.get('title', 'Unknown'), score)
+                if len(results_by_keyword[keyword]) >= top_k:
                     break
+        self.logger.info("Ranked precomputed matches: %d recipes for %d products",
+                         len(seen_ids), len(precomputed))
+        return results_by_keyword
+
+    def ensure_sparse_index(self):
+        """At startup: build the BM25 index file once if recipe_index.py has not written it yet"""
+        if os.path.exists(SPARSE_INDEX_FILE):
+            return
+        try:
+            write_sparse_index(self.qdrant_client)
+        except Exception as e:
+            self.logger.warning(f"Sparse recipe index not built (run recipe_index.py sparse): {e}")
 
-            # Log results
-            total_results = sum(len(recipes) for recipes in results_by_keyword.values())
-            self.logger.info(f"Search completed: {total_results} results across {len(keywords)} keywords")
-
-            return results_by_keyword
-
+    def recipe_sparse_index(self) -> Optional[BM25Index]:
+        """BM25 index over recipe titles/ingredients, mapped from its file and remapped when the file changes"""
+        try:
+            mtime = os.path.getmtime(SPARSE_INDEX_FILE)
+        except OSError:
+            return self.sparse_index
+        if mtime != self.sparse_index_mtime:
+            with self.sparse_index_lock:
+                if mtime != self.sparse_index_mtime:
+                    try:
+                        self.sparse_index = BM25Index.load(SPARSE_INDEX_FILE)
+                        self.logger.info(f"Mapped sparse recipe index: {len(self.sparse_index)} recipes")
+                    except (OSError, ValueError) as e:
+                        self.logger.error(f"Sparse recipe index unreadable: {e}")
+                    self.sparse_index_mtime = mtime
+        return self.sparse_index
+
+    def _live_search_recipes(self, base_query: str, keywords: List[str], top_k: int,
+                             recipe_filter: Optional[Filter] = None, diet: List[str] = []) -> Dict[str, List[Dict]]:
+        """
+        Hybrid search for products without precomputed matches: a local BM25 search per product
+        (recipes that really contain the ingredient) fused by rank with one combined dense search
+        (relevance to the query), so a small dense limit is enough.
+        """
+        dense_ranking = []
+        try:
+            combined_query = f"{base_query} {', '.join(keywords)}"
+            hits = self.qdrant_client.query_points(
+                collection_name="recipes",
+                query=self.recipe_embedding_model.embed_query(combined_query),
+                query_filter=recipe_filter,
+                limit=min(self.HYBRID_DENSE_LIMIT, max(top_k * len(keywords), 1) * 2),
+                search_params=self.recipe_search_params,
+                with_payload=False
+            ).points
+            dense_ranking = [hit.id for hit in hits]
         except Exception as e:
             self.logger.error(f"Vector search failed: {e}")
-            return {kw: [] for kw in keywords}
 
-    def generate_meal_plan_from_products(self, selected_products: List[Dict], question: str,
+        sparse_index = self.recipe_sparse_index()
+        selected: Dict[str, List[tuple]] = {}
+        seen_ids = set()
+        for keyword in keywords:
+            sparse_ranking = []
+            if sparse_index is not None:
+                sparse_ranking = [doc_id for doc_id, _ in sparse_index.search(keyword, limit=top_k * 5, diet=diet)]
+            fused = [(doc_id, score) for doc_id, score in rrf([sparse_ranking, dense_ranking]) if doc_id not in seen_ids]
+            selected[keyword] = fused[:top_k]
+            seen_ids.update(doc_id for doc_id, _ in selected[keyword])
+
+        try:
+            payloads = self._recipe_payloads(list(seen_ids))
+        except Exception as e:
+            self.logger.error(f"Recipe retrieval failed: {e}")
+            return {keyword: [] for keyword in keywords}
+
+        results_by_keyword = {}
+        for keyword, ranked in selected.items():
+            results_by_keyword[keyword] = []
+            for doc_id, score in ranked:
+                payload = payloads.get(doc_id)
+                if payload is None:
+                    continue
+                results_by_keyword[keyword].append({
+                    "title": payload.get("title", "Unknown"),
+                    "similarity": score,
+                    "ingredients": payload.get("ingredients", []),
+                    "instructions": payload.get("instructions", ""),
+                    "image_name": payload.get("image_name", ""),
+                    "recipe_idx": payload.get("id")
+                })
+                self.logger.debug("✔️ Retrieved for '%s': %s | rrf: %.4f", keyword, payload.get('title', 'Unknown'), score)
+
+        total_results = sum(len(recipes) for recipes in results_by_keyword.values())
+        self.logger.info(f"Search completed: {total_results} results across {len(keywords)} keywords")
+        return results_by_keyword
+
+    def generate_meal_plan_from_products(self, selected_products: List[CatalogProduct], question: str,
                                         days: int = 3, people: int = 2, dietary_restrictions: list = [],
-                                        meal_types: list = [], excluded_ingredients: str = "") -> Optional[Dict]:
-        """Generate meal plan from specific product list with batched recipe search"""
+                                        meal_types: list = [], excluded_ingredients: str = "",
+                                        catalog: Optional[Any] = None) -> Optional[Dict]:
+        """Generate meal plan from specific product list with batched recipe search (priced from `catalog`)"""
         if meal_types is []:
             meal_types = ["śniadanie", "obiad", "kolacja"]
 
-        self.logger.info(f"Generating {days}-day plan for {people} people...")
-        self.logger.info(f"Using {len(selected_products)} promotional products")
-        self.logger.info(f"Dietary restrictions: {dietary_restrictions}")
-        self.logger.info(f"Meal types: {meal_types}")
-        self.logger.info(f"Excluded ingredients: {excluded_ingredients}")
+        self.logger.info("Generating %d-day plan for %d people from %d promotional products "
+                         "(restrictions: %s, meal types: %s, excluded: %s)", days, people, len(selected_products),
+                         dietary_restrictions, meal_types, excluded_ingredients)
 
         # Step 1: Build keyword-to-product map
         keyword_to_product = {}
         for product in selected_products:
-            keyword = product.get("translated_name") or product.get("name", "")
+            keyword = product.search_name
             if keyword:
                 keyword_to_product[keyword] = product
 
         # Step 2: Perform batched recipe search
-        recipe_lookup = self.batch_search_recipes(question, selected_products, top_k=1)
+        store = catalog.metadata.get("store") if catalog is not None else None
+        recipe_lookup = self.batch_search_recipes(question, selected_products, top_k=1, store=store,
+                                                  dietary_restrictions=dietary_restrictions)
 
         # Step 3: Prepare context for LLM
         products = ""
         recipies = ""
 
         for keyword, product in keyword_to_product.items():
-            products += f"- {product['name']}: {product['price']} PLN ({product.get('discount_info', 'no discount')})\n"
+            price = f"{product.price} PLN" if product.price is not None else "price not listed"
+            products += f"- {product.name}: {price} ({product.discount_info or 'no discount'})\n"
 
             best_recipe = None
             if keyword in recipe_lookup and recipe_lookup[keyword]:
@@ -264,7 +533,7 @@ class MealPlannerAPI:
                 recipies += f"Full recipe: {best_recipe['instructions'][:1000]}...\n\n"
 
         try:
-            parsed_plan = self.chat_chain.invoke({
+            messages = chat_prompt.invoke({
                 "products": products,
                 "recipies": recipies,
                 "days": days,
@@ -274,44 +543,60 @@ class MealPlannerAPI:
                 "meal_types": meal_types,
                 "excluded_ingredients": excluded_ingredients
             })
+            parsed_plan = self.parse_plan_output(self.stream_plan(messages, current_deadline()))
 
-            parsed_plan = recalculate_prices_manual(parsed_plan)
+            if catalog is not None:
+                # Catalog prices parsed once - plan totals are computed from them, not from LLM output
+                price_index = PriceIndex(catalog)
+                parsed_plan = price_index.price_plan(parsed_plan)
+                unresolved = price_index.unresolved(parsed_plan)
+                if unresolved:
+                    self.logger.warning(f"Products not found in the catalog, using LLM prices: {unresolved}")
 
             return parsed_plan
 
+        except (RequestCancelled, DeadlineExceeded):
+            raise
         except Exception as e:
             self.logger.error(f"Meal plan generation error: {e}")
             return None
 
-    def get_all_products(self) -> List[str]:
-        """Get all product names"""
-        return [product['name'] for product in self.products]
+    def get_all_products(self, store: Optional[str] = None) -> List[str]:
+        """Get all product names of a store (the default store when None)"""
+        with self.catalogs.acquire(store) as catalog:
+            return catalog.names()
 
-    def quick_meal_plan(self, product_names: List[str], question, days: int = 2, people: int = 2, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "") -> Optional[Dict]:
-        """Quick meal plan creation from selected products (by names)"""
+    def quick_meal_plan(self, product_names: List[str], question, days: int = 2, people: int = 2, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "", store: Optional[str] = None) -> Optional[Dict]:
+        """Quick meal plan creation from selected products (by names) of one store"""
 
         if meal_types is []:
             meal_types = ["śniadanie", "obiad", "kolacja"]
 
-        selected_products = []
+        # Only this store's shard is mapped (and kept from eviction) while the plan is generated
+        with self.catalogs.acquire(store) as catalog:
+            selected_products = []
 
-        for name in product_names:
-            product = next((p for p in self.products if name.lower() in p['name'].lower()), None)
-            if product:
-                selected_products.append(product)
-                self.logger.info(f"✅ Added: {product['name']}")
-            else:
-                self.logger.info(f"❌ Not found: {name}")
+            for name in product_names:
+                product = catalog.find(name)
+                if product:
+                    selected_products.append(product)
+                    self.logger.debug("✅ Added: %s", product.name)
+                else:
+                    self.logger.info("❌ Not found: %s", name)
 
-        if not selected_products:
-            self.logger.info("❌ No products selected!")
-            return {"status": "error", "message": "No products selected"}
+            if not selected_products:
+                self.logger.info("❌ No products selected!")
+                return {"status": "error", "message": "No products selected"}
 
-        plan = self.generate_meal_plan_from_products(selected_products, question, days, people, dietary_restrictions, meal_types, excluded_ingredients)
+            plan = self.generate_meal_plan_from_products(selected_products, question, days, people, dietary_restrictions, meal_types, excluded_ingredients, catalog)
 
+        return self._plan_response(plan)
+
+    def _plan_response(self, plan: Optional[Dict]) -> Dict:
         if plan:
-            self.logger.info(f"\n✅ GENERATED MEAL PLAN:")
-            self.logger.info(json.dumps(plan, ensure_ascii=False, indent=2))
+            self.logger.info("✅ Generated meal plan: %d meals", len(plan.get("meals", [])))
+            # Serialized in the logging thread, only with LOG_LEVEL=DEBUG (truncated, sampled)
+            self.logger.debug("Meal plan: %s", log_payload(plan))
 
             # Add status for API compatibility
             plan["status"] = "success"
@@ -320,21 +605,42 @@ class MealPlannerAPI:
         else:
             return {"status": "error", "message": "Failed to generate plan"}
 
-    def generate_plan_from_all_products(self, question, days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "") -> Optional[Dict]:
-        """Generate meal plan using all available products"""
+    def generate_plan_from_all_products(self, question, days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "", store: Optional[str] = None) -> Optional[Dict]:
+        """
+        Generate meal plan from a store's products most relevant to the request: dietary
+        restrictions and excluded ingredients are applied first, then the top PRESELECT_TOP_K
+        products by embedding similarity reach recipe search and the prompt - not the whole catalog.
+        """
 
         if meal_types is []:
             meal_types = ["śniadanie", "obiad", "kolacja"]
 
-        all_product_names = self.get_all_products()
+        query_vector = None
+        current_deadline().check("query embedding")
+        try:
+            restrictions = ", ".join(str(restriction) for restriction in dietary_restrictions or [])
+            query_vector = self.embedding_model.embed_query(f"{question} {restrictions}".strip() or "meal plan")
+        except Exception as e:
+            self.logger.error(f"Query embedding failed, ranking products by discount: {e}")
+
+        with self.catalogs.acquire(store) as catalog:
+            selected_products = preselect_products(catalog, query_vector, dietary_restrictions,
+                                                   excluded_ingredients, self.PRESELECT_TOP_K)
+            _, unchecked = required_flags(dietary_restrictions)
+            self.logger.info(f"📦 Preselected {len(selected_products)} of {len(catalog)} products"
+                             + (f" (restrictions left to the LLM: {unchecked})" if unchecked else ""))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("Preselected products: %s", log_payload([product.name for product in selected_products]))
+
+            if not selected_products:
+                self.logger.info("❌ No products match the request constraints!")
+                return {"status": "error", "message": "No products selected"}
 
-        print(f"\n📦 Available products ({len(all_product_names)}):")
-        for i, name in enumerate(all_product_names, 1):
-            print(f"{i:2d}. {name}")
+            plan = self.generate_meal_plan_from_products(selected_products, question, days, people, dietary_restrictions, meal_types, excluded_ingredients, catalog)
 
-        return self.quick_meal_plan(all_product_names, question, days, people, dietary_restrictions, meal_types, excluded_ingredients)
+        return self._plan_response(plan)
 
-    def ask_rag(self, question: str, days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "") -> Dict:
+    def ask_rag(self, question: str, days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "", store: Optional[str] = None) -> Dict:
         """
         Main API function for frontend
         Returns the new clean format directly
@@ -346,14 +652,25 @@ class MealPlannerAPI:
             # translate to english for better accuracy
             translated_query = self.translate_to_english(question)
 
-            # Generate a plan from all products
-            plan = self.generate_plan_from_all_products(translated_query, days, people, dietary_restrictions, meal_types, excluded_ingredients)
+            # Generate a plan from the store's most relevant products
+            plan = self.generate_plan_from_all_products(translated_query, days, people, dietary_restrictions, meal_types, excluded_ingredients, store)
 
             if plan and plan.get("status") == "success":
+                degraded = current_deadline().degraded
+                if degraded:
+                    # Stages skipped (or a plan cut short) to answer within the deadline
+                    self.logger.warning(f"⏱️ Degraded response, skipped: {degraded}")
+                    plan["degraded"] = list(degraded)
                 return plan
             else:
                 return {"status": "error", "message": "Could not generate meal plan"}
 
+        except RequestCancelled as e:
+            self.logger.info(f"🚫 Request cancelled: {e}")
+            return {"status": "error", "message": "Request cancelled", "reason": "cancelled"}
+        except DeadlineExceeded as e:
+            self.logger.warning(f"⏱️ {e} ({current_deadline().elapsed():.1f}s)")
+            return {"status": "error", "message": "Request deadline exceeded", "reason": "deadline"}
         except Exception as e:
             return {"status": "error", "message": f"Error: {str(e)}"}
 
@@ -362,18 +679,18 @@ class MealPlannerAPI:
 meal_planner = MealPlannerAPI()
 
 # Main function for frontend compatibility
-def ask_rag(question: str, days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "") -> dict:
+def ask_rag(question: str, days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "", store: Optional[str] = None) -> dict:
     """
     Main API function that can be called from frontend
     Returns the new clean format
     """
-    return meal_planner.ask_rag(question, days, people, dietary_restrictions, meal_types, excluded_ingredients)
+    return meal_planner.ask_rag(question, days, people, dietary_restrictions, meal_types, excluded_ingredients, store)
 
 # Additional utility functions
-def quick_meal_plan(product_names: List[str], days: int = 2, people: int = 2, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = ""):
+def quick_meal_plan(product_names: List[str], days: int = 2, people: int = 2, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "", store: Optional[str] = None):
     """Direct access to quick meal plan function"""
-    return meal_planner.quick_meal_plan(product_names, "", days, people, dietary_restrictions, meal_types, excluded_ingredients)
+    return meal_planner.quick_meal_plan(product_names, "", days, people, dietary_restrictions, meal_types, excluded_ingredients, store)
 
-def generate_plan_from_all_products(days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = ""):
+def generate_plan_from_all_products(days: int = 1, people: int = 1, dietary_restrictions: list = [], meal_types: list = [], excluded_ingredients: str = "", store: Optional[str] = None):
     """Generate plan from all available products"""
-    return meal_planner.generate_plan_from_all_products("", days, people, dietary_restrictions, meal_types, excluded_ingredients)
+    return meal_planner.generate_plan_from_all_products("", days, people, dietary_restrictions, meal_types, excluded_ingredients, store)
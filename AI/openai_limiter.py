@@ -0,0 +1,333 @@
+"""
+Admission control for the OpenAI key shared by the backend replicas and the scraper pipeline:
+token buckets of requests and tokens per minute (OPENAI_RPM, OPENAI_TPM; per endpoint - chat
+completions and embeddings have separate OpenAI limits), kept in a store all processes update
+atomically. OPENAI_LIMITER_DB is a SQLite file on the volume shared with the scraper; without it
+the buckets are process-local.
+
+Interactive requests have priority over batch work (pipeline, catalog translations): batch calls
+are admitted only while more than OPENAI_BATCH_RESERVE of a bucket is left, so a nightly run
+cannot drain the capacity /api/ask needs. Calls are admitted in the HTTP transport of the OpenAI
+clients, so LangChain and direct SDK calls alike wait for their turn; time spent waiting is
+recorded per priority (metrics()).
+
+The backend and the scraper are separate images, so both vendor this file: AI/openai_limiter.py and
+scraper/openai_limiter.py must stay byte-identical (AI/test_openai_limiter.py checks it). Keep it
+free of imports from either side - the request deadline and the logger are passed in.
+"""
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+import httpx
+
+PRIORITIES = ("interactive", "batch")
+# Completion tokens charged up front when a request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+# How often a waiting call re-checks the buckets at most (seconds)
+MAX_POLL_INTERVAL = 0.5
+WAIT_SAMPLES = 1000
+
+# name -> (level, updated): tokens left in the bucket and when that was computed (wall clock,
+# shared by processes on the same host)
+BucketState = Dict[str, Tuple[float, float]]
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "openai_priority", default=os.getenv("OPENAI_PRIORITY", "interactive"))
+
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """OpenAI calls made in this block are admitted with the given priority"""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{name}' (one of {PRIORITIES})")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def take(state: BucketState, now: float, amounts: Dict[str, float], capacities: Dict[str, float],
+         reserve: float) -> float:
+    """
+    Take `amounts` from the buckets if all of them have enough above the `reserve` fraction; returns
+    0.0 when taken, otherwise the seconds until they will have (nothing is taken). Buckets refill
+    their capacity per minute; a request larger than a bucket waits for a full bucket and leaves it
+    in debt.
+    """
+    levels, wait = {}, 0.0
+    for name, amount in amounts.items():
+        capacity = capacities[name]
+        rate = capacity / 60.0
+        level, updated = state.get(name, (capacity, now))
+        level = min(capacity, level + max(0.0, now - updated) * rate)
+        levels[name] = level
+        floor = capacity * reserve
+        needed = floor + min(amount, capacity - floor)
+        wait = max(wait, (needed - level) / rate)
+    for name, level in levels.items():
+        state[name] = (level - amounts[name] if wait <= 0 else level, now)
+    return max(0.0, wait)
+
+
+class MemoryStore:
+    """Buckets of this process only (no replicas, or a stand-in in tests and benchmarks)"""
+
+    def __init__(self):
+        self.state: BucketState = {}
+        self.lock = threading.Lock()
+
+    def update(self, names, function: Callable[[BucketState], float]) -> float:
+        with self.lock:
+            return function(self.state)
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file shared by all processes (and containers) that mount it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # Autocommit mode - transactions are opened explicitly with BEGIN IMMEDIATE. The default
+            # rollback journal (not WAL) also works on bind mounts without shared memory
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self.local.connection = connection
+        return connection
+
+    def update(self, names, function: Callable[[BucketState], float]) -> float:
+        """Read, change and write the buckets in one write-locked transaction"""
+        connection = self._connection()
+        names = list(names)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                f"SELECT name, level, updated FROM buckets WHERE name IN ({','.join('?' * len(names))})", names)
+            state = {name: (level, updated) for name, level, updated in rows}
+            result = function(state)
+            connection.executemany("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                                   [(name, level, updated) for name, (level, updated) in state.items()])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+
+class AdmissionTimeout(httpx.TimeoutException):
+    """The call would have to wait for capacity past the request's deadline"""
+
+
+def percentile(values: Deque[float], q: float) -> float:
+    """Linearly interpolated percentile (0.0 for no values)"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Limiter:
+    def __init__(self, store, rpm: float, tpm: float, batch_reserve: float = 0.2,
+                 logger: Optional[logging.Logger] = None):
+        self.store = store
+        self.rpm = rpm
+        self.tpm = tpm
+        self.batch_reserve = batch_reserve
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.waits: Dict[str, Deque[float]] = {name: deque(maxlen=WAIT_SAMPLES) for name in PRIORITIES}
+        self.stats = {name: {"calls": 0, "waited": 0, "wait_s": 0.0, "max_wait_s": 0.0, "rejected": 0}
+                      for name in PRIORITIES}
+
+    def capacities(self, endpoint: str) -> Dict[str, float]:
+        capacities = {}
+        if self.rpm > 0:
+            capacities[f"{endpoint}:requests"] = self.rpm
+        if self.tpm > 0:
+            capacities[f"{endpoint}:tokens"] = self.tpm
+        return capacities
+
+    def acquire(self, endpoint: str, tokens: int, priority_name: Optional[str] = None,
+                timeout: Optional[float] = None) -> float:
+        """
+        Block until the call fits in the buckets; returns the seconds waited. Raises AdmissionTimeout
+        when it would not fit within `timeout`.
+        """
+        priority_name = priority_name or _priority.get()
+        capacities = self.capacities(endpoint)
+        amounts = {name: (1.0 if name.endswith(":requests") else float(tokens)) for name in capacities}
+        reserve = self.batch_reserve if priority_name == "batch" else 0.0
+        started = time.monotonic()
+        while True:
+            wait = self.store.update(capacities, lambda state: take(state, time.time(), amounts, capacities, reserve))
+            waited = time.monotonic() - started
+            if wait <= 0:
+                self._record(priority_name, waited)
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                with self.lock:
+                    self.stats[priority_name]["rejected"] += 1
+                raise AdmissionTimeout(f"OpenAI capacity available in {wait:.1f}s, past the request deadline")
+            # Other processes take from the buckets too - re-check instead of sleeping the whole wait
+            time.sleep(min(wait, MAX_POLL_INTERVAL))
+
+    def settle(self, endpoint: str, charged: int, used: int):
+        """Correct the token bucket with the usage the response reported"""
+        name = f"{endpoint}:tokens"
+        if self.tpm <= 0 or used == charged:
+            return
+
+        def correct(state: BucketState) -> float:
+            level, updated = state.get(name, (self.tpm, time.time()))
+            state[name] = (min(self.tpm, level + charged - used), updated)
+            return 0.0
+        self.store.update([name], correct)
+
+    def drain(self, endpoint: str, retry_after: float):
+        """OpenAI answered 429 - empty the request bucket so no process sends until it refills"""
+        if self.rpm <= 0:
+            return
+        name = f"{endpoint}:requests"
+
+        def empty(state: BucketState) -> float:
+            state[name] = (-retry_after * self.rpm / 60.0, time.time())
+            return 0.0
+        self.store.update([name], empty)
+
+    def _record(self, priority_name: str, waited: float):
+        with self.lock:
+            stats = self.stats[priority_name]
+            stats["calls"] += 1
+            stats["wait_s"] += waited
+            stats["max_wait_s"] = max(stats["max_wait_s"], waited)
+            if waited > 0.01:
+                stats["waited"] += 1
+            self.waits[priority_name].append(waited)
+        if self.logger is not None and waited > 1.0 and priority_name == "interactive":
+            self.logger.info(f"⏳ {priority_name} OpenAI call admitted after {waited:.1f}s")
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Queue wait per priority: counts, total/max and p50/p95/p99 of the recent waits (seconds)"""
+        with self.lock:
+            report = {}
+            for name in PRIORITIES:
+                report[name] = {**self.stats[name],
+                                **{f"p{q}_wait_s": round(percentile(self.waits[name], q), 4) for q in (50, 95, 99)}}
+            return report
+
+
+def endpoint_of(url: httpx.URL) -> str:
+    path = url.path.rstrip("/")
+    return "embeddings" if path.endswith("/embeddings") else "chat"
+
+
+def estimate_tokens(body: bytes) -> int:
+    """Prompt (~4 characters per token) plus the completion the request allows"""
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        return len(body) // 4 + 1
+    if "input" in request:
+        inputs = request["input"]
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        return sum(len(item) if isinstance(item, list) else len(str(item)) // 4 + 1 for item in inputs)
+    prompt = sum(len(str(message.get("content", ""))) // 4 + 1 for message in request.get("messages", []))
+    completion = request.get("max_completion_tokens") or request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt + int(completion)
+
+
+class LimitedTransport(httpx.BaseTransport):
+    """
+    HTTP transport admitting each OpenAI call through the limiter. `priority_name` fixes the priority
+    of all calls (otherwise the one of the calling context); `deadline` returns the seconds left for
+    the call, which bound its wait (inf - unbounded).
+    """
+
+    def __init__(self, limiter: Limiter, transport: Optional[httpx.BaseTransport] = None,
+                 priority_name: Optional[str] = None, deadline: Optional[Callable[[], float]] = None):
+        self.limiter = limiter
+        self.priority_name = priority_name
+        self.deadline = deadline
+        self.transport = transport or httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_of(request.url)
+        tokens = estimate_tokens(request.read())
+        remaining = self.deadline() if self.deadline is not None else float("inf")
+        self.limiter.acquire(endpoint, tokens, self.priority_name,
+                             timeout=remaining if remaining != float("inf") else None)
+        response = self.transport.handle_request(request)
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get("retry-after", "1"))
+            except ValueError:
+                retry_after = 1.0
+            self.limiter.drain(endpoint, retry_after)
+        elif response.headers.get("content-type", "").startswith("application/json"):
+            # Streamed completions keep the up-front estimate
+            response.read()
+            try:
+                usage = json.loads(response.content).get("usage") or {}
+            except ValueError:
+                usage = {}
+            if usage.get("total_tokens"):
+                self.limiter.settle(endpoint, tokens, int(usage["total_tokens"]))
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+def batch_priority(function: Callable) -> Callable:
+    """`function` with its OpenAI calls admitted as batch work"""
+    def wrapper(*args, **kwargs):
+        with priority("batch"):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def limiter_from_env(logger: Optional[logging.Logger] = None) -> Optional[Limiter]:
+    """Limiter configured by OPENAI_RPM / OPENAI_TPM (None when neither is set)"""
+    rpm = float(os.getenv("OPENAI_RPM", "0") or 0)
+    tpm = float(os.getenv("OPENAI_TPM", "0") or 0)
+    if rpm <= 0 and tpm <= 0:
+        return None
+    path = os.getenv("OPENAI_LIMITER_DB")
+    store = SQLiteStore(path) if path else MemoryStore()
+    return Limiter(store, rpm, tpm, float(os.getenv("OPENAI_BATCH_RESERVE", "0.2")), logger)
+
+
+@lru_cache(maxsize=1)
+def shared_limiter() -> Optional[Limiter]:
+    """One limiter per process, configured from the environment (scripts with several OpenAI clients)"""
+    return limiter_from_env()
+
+
+def limited_http_client(limiter: Optional[Limiter], priority_name: Optional[str] = None,
+                        deadline: Optional[Callable[[], float]] = None) -> Optional[httpx.Client]:
+    """httpx client for the OpenAI SDK / LangChain (None - the SDK default - without a limiter)"""
+    if limiter is None:
+        return None
+    transport = LimitedTransport(limiter, priority_name=priority_name, deadline=deadline)
+    return httpx.Client(transport=transport, timeout=httpx.Timeout(600.0, connect=5.0), follow_redirects=True)
@@ -0,0 +1,157 @@
+from typing import Annotated, Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, ValidationError
+
+
+class PlanParseError(ValueError):
+    """LLM output that is not a meal plan even after local repair"""
+
+
+def _text(value: Any) -> str:
+    """Prices and quantities come back as strings or bare numbers"""
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+
+Text = Annotated[str, BeforeValidator(_text)]
+
+
+class _Model(BaseModel):
+    # Fields the model adds on its own are kept, not rejected
+    model_config = ConfigDict(extra="allow")
+
+
+class PlanInfo(_Model):
+    days: int = 0
+    people: int = 0
+    estimated_total_cost: Text = ""
+
+
+class MainProduct(_Model):
+    name: Text = ""
+    quantity: Text = ""
+    price: Text = ""
+
+
+class AdditionalIngredient(_Model):
+    name: Text = ""
+    quantity: Text = ""
+    estimated_price: Text = ""
+
+
+class Meal(_Model):
+    day: int = 1
+    type: Text = ""
+    name: Text = ""
+    image_name: Text = ""
+    main_products: List[MainProduct] = []
+    additional_ingredients: List[AdditionalIngredient] = []
+    instructions: Text = ""
+    prep_time: Text = ""
+    cooking_time: Text = ""
+
+
+class ShoppingSummary(_Model):
+    promotional_products_cost: Text = ""
+    additional_ingredients_cost: Text = ""
+    total_savings: Text = ""
+
+
+class MealPlan(_Model):
+    """The plan format requested by chat_prompt"""
+    plan_info: PlanInfo = PlanInfo()
+    meals: List[Meal] = []
+    shopping_summary: ShoppingSummary = ShoppingSummary()
+
+
+def extract_json(text: str) -> str:
+    """
+    The JSON object in a reply - without the text before it or a closing ``` fence at the end
+    (fences inside string values are kept; other text after the object is dropped by repair_json)
+    """
+    start = text.find("{")
+    if start < 0:
+        raise PlanParseError("No JSON object in the model output")
+    body = text[start:].rstrip()
+    if body.endswith("```"):
+        body = body[:-3].rstrip()
+    return body
+
+
+def repair_json(text: str) -> Tuple[str, bool]:
+    """
+    Make truncated or sloppy JSON parseable: trailing commas are dropped and, if the text ends
+    inside a structure, it is cut after the last value completed at most two levels deep (a whole
+    meal in "meals") and the open structures are closed - the incomplete last meal is dropped.
+    Returns the text and whether it was truncated.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    checkpoint: Optional[Tuple[int, List[str]]] = None
+    in_string = escaped = False
+    length = len(text)
+    i = 0
+    while i < length:
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            out.append(char)
+            if len(stack) <= 2:
+                checkpoint = (len(out), list(stack))
+            if not stack:
+                return "".join(out), False
+        elif char == ",":
+            following = i + 1
+            while following < length and text[following].isspace():
+                following += 1
+            if following < length and text[following] in "}]":
+                i += 1
+                continue
+            out.append(char)
+        else:
+            out.append(char)
+        i += 1
+
+    if not stack:
+        return "".join(out), False
+    if checkpoint is None:
+        raise PlanParseError("Model output truncated before any complete part of the plan")
+    position, open_structures = checkpoint
+    repaired = "".join(out[:position]).rstrip().rstrip(",")
+    return repaired + "".join(reversed(open_structures)), True
+
+
+def parse_plan(text: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Meal plan from the model output, validated against MealPlan (compiled pydantic-core schema,
+    JSON parsed natively). Returns the plan as a dict and whether it was truncated - cut short,
+    so the incomplete rest (at least the last meal) was dropped to repair it.
+    """
+    body = extract_json(text)
+    try:
+        return MealPlan.model_validate_json(body).model_dump(), False
+    except ValidationError as e:
+        if not any(error["type"].startswith("json") for error in e.errors()):
+            raise PlanParseError(f"Model output does not match the plan schema: {e}") from e
+    repaired, truncated = repair_json(body)
+    try:
+        return MealPlan.model_validate_json(repaired).model_dump(), truncated
+    except ValidationError as e:
+        raise PlanParseError(f"Model output is not valid JSON after repair: {e}") from e
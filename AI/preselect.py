@@ -0,0 +1,111 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from catalog import DIETARY_FLAGS, CatalogProduct
+from pricing import normalize_name
+
+# Dietary restrictions (frontend labels and API names) backed by catalog flags.
+# Restrictions without a flag (e.g. "Keto") are left to the LLM prompt.
+RESTRICTION_FLAGS = {
+    "wegetariańskie": "vegetarian", "vegetarian": "vegetarian",
+    "wegańskie": "vegan", "vegan": "vegan",
+    "bezglutenowe": "gluten_free", "gluten_free": "gluten_free", "gluten-free": "gluten_free",
+    "bez laktozy": "lactose_free", "lactose_free": "lactose_free", "lactose-free": "lactose_free",
+}
+# Ranked candidates examined per requested product before excluded ingredients are checked
+CANDIDATE_FACTOR = 4
+
+
+def embedding_text(product: CatalogProduct) -> str:
+    """Text embedded for a product at catalog build time"""
+    parts = [product.search_name]
+    if product.keywords:
+        parts.append(", ".join(product.keywords))
+    if product.category_id:
+        parts.append(product.category)
+    return ". ".join(parts)
+
+
+def required_flags(restrictions: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """Split restrictions into catalog dietary flags and those the catalog cannot check"""
+    flags, other = [], []
+    for restriction in restrictions or ():
+        flag = RESTRICTION_FLAGS.get(str(restriction).strip().lower())
+        if flag:
+            flags.append(flag)
+        else:
+            other.append(restriction)
+    return flags, other
+
+
+def excluded_terms(excluded_ingredients: str) -> List[str]:
+    """"cebula, grzyby; orzechy" -> normalized terms"""
+    text = (excluded_ingredients or "").replace(";", ",").replace("\n", ",")
+    return [term for term in (normalize_name(part) for part in text.split(",")) if term]
+
+
+def is_excluded(product: CatalogProduct, terms: Sequence[str]) -> bool:
+    text = " ".join([product.search_key, normalize_name(product.translated_name or ""), *product.keywords]).lower()
+    return any(term in text for term in terms)
+
+
+def preselect_products(catalog, query_vector: Optional[Sequence[float]], restrictions: Iterable[str] = (),
+                       excluded_ingredients: str = "", top_k: int = 25) -> List[CatalogProduct]:
+    """
+    The `top_k` products of a shard catalog most relevant to the request.
+
+    Hard constraints go first: dietary restrictions are a vectorized mask over the shard's
+    dietary column (skipped for flags no product in the catalog carries, i.e. unannotated
+    catalogs), excluded ingredients are checked on the ranked candidates. Products are ranked
+    by cosine similarity of their precomputed embeddings to the request embedding; without
+    embeddings (or a request embedding) the biggest relative discounts come first.
+    """
+    count = len(catalog)
+    if count == 0 or top_k <= 0:
+        return []
+
+    columns = catalog.columns
+    allowed = np.ones(count, dtype=bool)
+    flags, _ = required_flags(restrictions)
+    for flag in flags:
+        has_flag = (columns["dietary"] & (1 << DIETARY_FLAGS.index(flag))) != 0
+        if has_flag.any():
+            allowed &= has_flag
+
+    if catalog.embeddings is not None and query_vector is not None:
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = catalog.embeddings @ (query / (np.linalg.norm(query) or 1.0))
+    else:
+        price = columns["price_cents"].astype(np.float32)
+        original = columns["original_price_cents"].astype(np.float32)
+        # Products without a price (-1) have no known discount
+        scores = np.where((original > price) & (price >= 0), (original - price) / np.maximum(original, 1), 0.0)
+    scores = np.where(allowed, scores, -np.inf)
+
+    available = int(allowed.sum())
+    terms = excluded_terms(excluded_ingredients)
+    candidates = min(available, top_k * CANDIDATE_FACTOR if terms else top_k)
+    if candidates == 0:
+        return []
+    order = np.argpartition(-scores, candidates - 1)[:candidates]
+    order = order[np.argsort(-scores[order], kind="stable")]
+
+    selected: List[CatalogProduct] = []
+    for index in order:
+        product = catalog.product(int(index))
+        if terms and is_excluded(product, terms):
+            continue
+        selected.append(product)
+        if len(selected) == top_k:
+            return selected
+
+    if candidates < available:
+        # Excluded ingredients removed too many of the best candidates - walk the full ranking
+        for index in np.argsort(-scores, kind="stable")[candidates:available]:
+            product = catalog.product(int(index))
+            if not is_excluded(product, terms):
+                selected.append(product)
+                if len(selected) == top_k:
+                    break
+    return selected
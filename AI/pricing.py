@@ -0,0 +1,116 @@
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+PRICE_PATTERN = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def parse_price(value: Any) -> Optional[Decimal]:
+    """Parse "12,99", "12.99 PLN", "12,99 zł" or a number into Decimal; None if there is no price"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        text = str(value)
+    else:
+        match = PRICE_PATTERN.search(str(value).replace(" ", "").replace(" ", ""))
+        if not match:
+            return None
+        text = match.group(0).replace(",", ".")
+    try:
+        return Decimal(text).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return None
+
+
+def format_price(value: Decimal) -> str:
+    return f"{value.quantize(CENT, rounding=ROUND_HALF_UP)} PLN"
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(re.sub(r"[,;]", " ", (name or "").lower()).split())
+
+
+@dataclass(frozen=True)
+class CatalogPrice:
+    name: str
+    price: Decimal
+    original_price: Optional[Decimal]
+
+    @property
+    def saving(self) -> Decimal:
+        if self.original_price is None or self.original_price <= self.price:
+            return ZERO
+        return self.original_price - self.price
+
+
+class PriceIndex:
+    """
+    Plan pricing against a catalog (catalog.Catalog or a memory-mapped shard.ShardCatalog),
+    whose prices are parsed once at catalog load. `price_plan` resolves every `main_products`
+    item of an LLM plan to its catalog entry and recomputes line, meal and plan totals and the
+    real savings from `original_price`, instead of trusting the numbers written by the LLM.
+    """
+
+    def __init__(self, catalog: Any):
+        self.catalog = catalog
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def resolve(self, name: str) -> Optional[CatalogPrice]:
+        """Catalog entry for a product name from the plan: exact match, else the closest containing name"""
+        # The LLM sometimes shortens ("Szynka Kraina Wędlin") or extends product names
+        product = self.catalog.closest(name)
+        if product is None or product.price is None:
+            # Not in the catalog, or in it without a price ("Sprawdź w sklepie")
+            return None
+        return CatalogPrice(product.name, product.price, product.original_price)
+
+    def price_plan(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Recompute prices of a parsed plan in place (and return it).
+        Promotional products are priced from the catalog, additional ingredients keep the LLM
+        estimate as the only source. Every item is counted in each meal that lists it, catalog
+        and unresolved products alike, so the meal totals add up to the plan total
+        (`shopping_summary.cost_basis` = "per_meal").
+        """
+        promo_cost = ZERO
+        additional_cost = ZERO
+        savings = ZERO
+
+        for meal in plan.get("meals", []):
+            meal_cost = ZERO
+            for item in meal.get("main_products", []):
+                entry = self.resolve(item.get("name", ""))
+                if entry is not None:
+                    item["catalog_name"] = entry.name
+                    price = entry.price
+                    savings += entry.saving
+                else:
+                    # Not in the catalog - fall back to the LLM price, but do not count savings
+                    price = parse_price(item.get("price")) or ZERO
+                item["price"] = format_price(price)
+                meal_cost += price
+                promo_cost += price
+            for item in meal.get("additional_ingredients", []):
+                price = parse_price(item.get("price", item.get("estimated_price"))) or ZERO
+                meal_cost += price
+                additional_cost += price
+            meal["total_cost"] = format_price(meal_cost)
+
+        plan.setdefault("plan_info", {})["estimated_total_cost"] = format_price(promo_cost + additional_cost)
+        plan["shopping_summary"] = {
+            "promotional_products_cost": format_price(promo_cost),
+            "additional_ingredients_cost": format_price(additional_cost),
+            "total_savings": format_price(savings),
+            "cost_basis": "per_meal",
+        }
+        return plan
+
+    def unresolved(self, plan: Dict[str, Any]) -> List[str]:
+        """Names of plan products that are not in the catalog (for logging)"""
+        return [item.get("name", "") for meal in plan.get("meals", [])
+                for item in meal.get("main_products", []) if "catalog_name" not in item]
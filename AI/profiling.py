@@ -0,0 +1,204 @@
+"""
+On-demand introspection of a running backend (served by admin.py, only with ADMIN_TOKEN set):
+
+- SamplingProfiler: a thread that samples the Python stacks of other threads every `interval`
+  seconds and counts them in the collapsed ("folded") format of flamegraph.pl, speedscope and
+  inferno: `thread;outer (file.py:12);inner (file.py:40) <samples>` per line. Wall-clock
+  samples - threads blocked on I/O (LLM calls, Qdrant) show where they wait.
+- MemoryTracker: tracemalloc snapshots (top allocation sites) and diffs between them.
+
+Nothing runs until asked for: no sampling thread, and tracemalloc is started explicitly (it
+slows every allocation while on).
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+DEFAULT_INTERVAL = 0.01
+MAX_PROFILE_SECONDS = 300
+REQUEST_PROFILES = 20
+SNAPSHOTS = 5
+
+
+class SamplingProfiler:
+    """Samples the stacks of `thread_ids` (all other threads when None) until stopped"""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_ids: Optional[Set[int]] = None):
+        self.interval = max(0.001, interval)
+        self.thread_ids = thread_ids
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started = self.stopped = 0.0
+        self._names: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _frame_name(self, code) -> str:
+        name = self._names.get(code)
+        if name is None:
+            name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._names[code] = name
+        return name
+
+    def _sample(self):
+        own = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(thread_names.get(ident, str(ident)).replace(";", ":"))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample()
+            next_sample += self.interval
+            self._stop.wait(max(0.0, next_sample - time.perf_counter()))
+
+    def start(self) -> "SamplingProfiler":
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.perf_counter()
+        return self
+
+    def folded(self) -> str:
+        """Collapsed stacks, most sampled first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        return {"samples": self.samples, "stacks": len(self.counts), "interval_ms": self.interval * 1000,
+                "duration_s": round(self.stopped - self.started, 3)}
+
+
+class Profiles:
+    """Whole-process profiles (one at a time) and the profiles of single tagged requests"""
+
+    def __init__(self, keep: int = REQUEST_PROFILES):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.running = threading.Lock()
+        self.requests: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def profile_process(self, seconds: float, interval: float = DEFAULT_INTERVAL) -> SamplingProfiler:
+        """Sample all threads for `seconds` (blocks); raises RuntimeError while another profile runs"""
+        if not self.running.acquire(blocking=False):
+            raise RuntimeError("A process profile is already running")
+        try:
+            profiler = SamplingProfiler(interval).start()
+            time.sleep(min(max(seconds, 0.0), MAX_PROFILE_SECONDS))
+            return profiler.stop()
+        finally:
+            self.running.release()
+
+    @contextmanager
+    def profile_request(self, tag: str, interval: float = DEFAULT_INTERVAL) -> Iterator[SamplingProfiler]:
+        """Sample only the current thread while the block (one request) runs; kept under `tag`"""
+        profiler = SamplingProfiler(interval, {threading.get_ident()}).start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            with self.lock:
+                self.requests[tag] = {"folded": profiler.folded(), **profiler.summary()}
+                self.requests.move_to_end(tag)
+                while len(self.requests) > self.keep:
+                    self.requests.popitem(last=False)
+
+    def request_profile(self, tag: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.requests.get(tag)
+
+    def request_tags(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [{"tag": tag, **{k: v for k, v in profile.items() if k != "folded"}}
+                    for tag, profile in self.requests.items()]
+
+
+def _statistic(stat) -> Dict[str, Any]:
+    return {"size_kb": round(stat.size / 1024, 1), "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]}
+
+
+def _difference(stat) -> Dict[str, Any]:
+    return {"size_diff_kb": round(stat.size_diff / 1024, 1), "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]}
+
+
+class MemoryTracker:
+    """tracemalloc on demand: numbered snapshots (the last SNAPSHOTS kept) and their top allocation sites"""
+
+    # Allocations of tracemalloc itself and of the import machinery are noise
+    FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+               tracemalloc.Filter(False, "<unknown>")]
+
+    def __init__(self, keep: int = SNAPSHOTS):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.snapshots: "OrderedDict[int, tracemalloc.Snapshot]" = OrderedDict()
+        self.next_id = 1
+
+    def start(self, frames: int = 10) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        tracemalloc.stop()
+        with self.lock:
+            self.snapshots.clear()
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        with self.lock:
+            snapshots = list(self.snapshots)
+        return {"tracing": tracing, "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+                "traced_mb": round(current / 2**20, 2), "peak_mb": round(peak / 2**20, 2), "snapshots": snapshots}
+
+    def snapshot(self, top: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+        """Take a snapshot; returns its ID and the `top` allocation sites"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running (start it first)")
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+        with self.lock:
+            snapshot_id = self.next_id
+            self.next_id += 1
+            self.snapshots[snapshot_id] = snapshot
+            while len(self.snapshots) > self.keep:
+                self.snapshots.popitem(last=False)
+        return {"id": snapshot_id, **self.status(),
+                "top": [_statistic(stat) for stat in snapshot.statistics(group_by)[:top]] if top else []}
+
+    def diff(self, base: int, to: Optional[int] = None, top: int = 20, group_by: str = "lineno") -> Dict[str, Any]:
+        """Top allocation growth from snapshot `base` to `to` (a new snapshot when None)"""
+        with self.lock:
+            if base not in self.snapshots or (to is not None and to not in self.snapshots):
+                raise KeyError(f"Unknown snapshot (kept: {list(self.snapshots)})")
+            older = self.snapshots[base]
+            newer = self.snapshots.get(to) if to is not None else None
+        if newer is None:
+            to = self.snapshot(top=0)["id"]
+            with self.lock:
+                newer = self.snapshots[to]
+        return {"base": base, "to": to,
+                "top": [_difference(stat) for stat in newer.compare_to(older, group_by)[:top]]}
@@ -95,8 +95,3 @@ Return the response in JSON format with Polish text if products don't fit restri
 }}
 }}""")
 ])
-
-recalculate_prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a strict cost calculator. Do not correct price in products. Only correct numeric values (promotional_products_cost, additional_ingredients_cost, total_savings, estimated_total_cost) in this JSON, return a valid JSON with exactly the same structure (You only change numeric values)."),
-    ("user", "{raw_json}")
-])
@@ -0,0 +1,215 @@
+"""
+Recipe collection maintenance: diet tags in the payload and the keyword payload index used by
+filtered recipe search (see recipe_tags).
+
+    python recipe_index.py tag                                  # tag the existing collection in place
+    python recipe_index.py build recipes.csv [--limit 1000]     # embed, tag and upsert recipes
+    python recipe_index.py tune                                 # apply quantization/HNSW settings in place
+    python recipe_index.py sparse                               # rewrite the BM25 index file only
+
+build and tag also rewrite the BM25 index file (RECIPE_SPARSE_INDEX) the backend maps for hybrid search.
+
+Collection schema (env): RECIPE_QUANTIZATION = int8 (default) | binary | none - quantized vectors stay in RAM,
+originals move to disk and are only read to rescore the oversampled candidates; RECIPE_HNSW_M /
+RECIPE_HNSW_EF_CONSTRUCT for the graph and RECIPE_SEARCH_EF for queries. Payloads are stored on disk.
+Measure a configuration with bench_qdrant.py before changing it.
+"""
+import argparse
+import json
+import os
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List
+
+from openai import OpenAI
+from qdrant_client import QdrantClient
+from qdrant_client.models import (BinaryQuantization, BinaryQuantizationConfig, CollectionParamsDiff, Disabled,
+                                  Distance, HnswConfigDiff, PayloadSchemaType, PointStruct, QuantizationSearchParams,
+                                  ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams,
+                                  VectorParams, VectorParamsDiff)
+
+from logger import get_logger
+from recipe_tags import DIET_FIELD, diet_tags
+from sparse_index import BM25Index
+
+COLLECTION_NAME = os.getenv("RECIPE_COLLECTION", "recipes")
+EMBEDDING_MODEL = os.getenv("RECIPE_EMBEDDING_MODEL", "text-embedding-3-small")
+VECTOR_SIZE = 1536
+BATCH_SIZE = 100
+
+QUANTIZATIONS = ("none", "int8", "binary")
+QUANTIZATION = os.getenv("RECIPE_QUANTIZATION", "int8")
+HNSW_M = int(os.getenv("RECIPE_HNSW_M", "16"))
+HNSW_EF_CONSTRUCT = int(os.getenv("RECIPE_HNSW_EF_CONSTRUCT", "128"))
+SEARCH_EF = int(os.getenv("RECIPE_SEARCH_EF", "64"))
+# Candidates fetched per requested hit before rescoring with the original vectors
+OVERSAMPLING = {"int8": 2.0, "binary": 3.0}
+# BM25 index over the collection's payloads, shared by the backend workers (see sparse_index)
+SPARSE_INDEX_FILE = os.getenv("RECIPE_SPARSE_INDEX", "shared_data/recipes.bm25")
+
+logger = get_logger("app-RecipeIndex")
+
+
+def quantization_config(quantization: str = QUANTIZATION):
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {', '.join(QUANTIZATIONS)}")
+    if quantization == "int8":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def collection_params(quantization: str = QUANTIZATION, m: int = HNSW_M, ef_construct: int = HNSW_EF_CONSTRUCT,
+                      size: int = VECTOR_SIZE) -> Dict[str, Any]:
+    """create_collection arguments: quantized vectors in RAM, originals and payloads on disk"""
+    return {
+        "vectors_config": VectorParams(size=size, distance=Distance.COSINE, on_disk=quantization != "none"),
+        "hnsw_config": HnswConfigDiff(m=m, ef_construct=ef_construct),
+        "quantization_config": quantization_config(quantization),
+        "on_disk_payload": True,
+    }
+
+
+def search_params(quantization: str = QUANTIZATION, ef: int = SEARCH_EF) -> SearchParams:
+    """Query-time HNSW ef; quantized searches oversample and rescore with the original vectors"""
+    if quantization == "none":
+        return SearchParams(hnsw_ef=ef)
+    return SearchParams(hnsw_ef=ef, quantization=QuantizationSearchParams(
+        rescore=True, oversampling=OVERSAMPLING[quantization]))
+
+
+def tune_collection(client: QdrantClient, collection: str = COLLECTION_NAME, quantization: str = QUANTIZATION,
+                    m: int = HNSW_M, ef_construct: int = HNSW_EF_CONSTRUCT):
+    """Apply the schema settings to an existing collection (Qdrant rebuilds the index in the background)"""
+    params = collection_params(quantization, m, ef_construct)
+    client.update_collection(
+        collection_name=collection,
+        vectors_config={"": VectorParamsDiff(on_disk=params["vectors_config"].on_disk)},
+        hnsw_config=params["hnsw_config"],
+        quantization_config=params["quantization_config"] or Disabled.DISABLED,
+        collection_params=CollectionParamsDiff(on_disk_payload=True),
+    )
+    logger.info(f"⚙️ Tuned '{collection}': quantization={quantization}, m={m}, ef_construct={ef_construct}")
+
+
+def ensure_payload_indexes(client: QdrantClient, collection: str = COLLECTION_NAME):
+    """Keyword index on the diet tags, so restriction filters do not scan payloads"""
+    schema = client.get_collection(collection).payload_schema or {}
+    if DIET_FIELD not in schema:
+        client.create_payload_index(collection_name=collection, field_name=DIET_FIELD,
+                                    field_schema=PayloadSchemaType.KEYWORD, wait=True)
+        logger.info(f"🏷️ Created keyword payload index '{DIET_FIELD}' on '{collection}'")
+
+
+def tag_collection(client: QdrantClient, collection: str = COLLECTION_NAME) -> int:
+    """Derive diet tags for every recipe already in the collection (no re-embedding). Returns the number of points."""
+    total = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection, limit=256, offset=offset,
+                                       with_payload=["ingredients"], with_vectors=False)
+        # One set_payload call per distinct tag set in the page
+        by_tags: Dict[tuple, List[Any]] = defaultdict(list)
+        for point in points:
+            by_tags[tuple(diet_tags((point.payload or {}).get("ingredients")))].append(point.id)
+        for tags, ids in by_tags.items():
+            client.set_payload(collection_name=collection, payload={DIET_FIELD: list(tags)}, points=ids)
+        total += len(points)
+        if offset is None:
+            break
+    ensure_payload_indexes(client, collection)
+    logger.info(f"🏷️ Tagged {total} recipes in '{collection}'")
+    return total
+
+
+def write_sparse_index(client: QdrantClient, collection: str = COLLECTION_NAME, path: str = SPARSE_INDEX_FILE) -> int:
+    """(Re)build the BM25 index file from the collection payloads. Returns the number of recipes."""
+    index = BM25Index.from_qdrant(client, collection)
+    index.save(path)
+    logger.info(f"🔎 Wrote BM25 index of {len(index)} recipes to {path}")
+    return len(index)
+
+
+def load_recipes(path: str, limit: int = 0) -> List[Dict[str, Any]]:
+    """Recipes from the dataset CSV or a JSON list with the same columns (e.g. sample_recipes.json)"""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+    else:
+        import pandas as pd
+        records = pd.read_csv(path).to_dict(orient="records")
+    return records[:limit] if limit else records
+
+
+def recipe_payload(row: Dict[str, Any]) -> Dict[str, Any]:
+    ingredients = row.get("Cleaned_Ingredients", "")
+    ingredients_text = str(ingredients).replace("['", "").replace("']", "").replace("', '", ", ")
+    return {
+        "page_content": f"Recipe: {row.get('Title', '')}\nIngredients: {ingredients_text}",
+        "title": row.get("Title", ""),
+        "ingredients": ingredients,
+        "instructions": row.get("Instructions", ""),
+        "image_name": row.get("Image_Name", ""),
+        "id": row.get("Unnamed: 0", -1),
+        DIET_FIELD: diet_tags(ingredients),
+    }
+
+
+def point_id(payload: Dict[str, Any]) -> str:
+    """Stable point ID from the dataset row - re-indexing keeps IDs (and precomputed recipe matches) valid"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"recipe:{payload['id']}:{payload['title']}"))
+
+
+def batched(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def build_collection(client: QdrantClient, openai_client: OpenAI, recipes: Iterable[Dict[str, Any]],
+                     collection: str = COLLECTION_NAME, recreate: bool = False) -> int:
+    """Embed, tag and upsert recipes. Returns the number of points written."""
+    if recreate and client.collection_exists(collection):
+        client.delete_collection(collection)
+    if not client.collection_exists(collection):
+        client.create_collection(collection_name=collection, **collection_params())
+    payloads = [recipe_payload(row) for row in recipes]
+    total = 0
+    for batch in batched(payloads, BATCH_SIZE):
+        response = openai_client.embeddings.create(model=EMBEDDING_MODEL, input=[p["page_content"] for p in batch])
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        client.upsert(collection_name=collection,
+                      points=[PointStruct(id=point_id(p), vector=v, payload=p) for p, v in zip(batch, vectors)])
+        total += len(batch)
+        logger.info(f"⬆️ Upserted {total}/{len(payloads)} recipes")
+    ensure_payload_indexes(client, collection)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("tag", help="derive diet tags for the existing collection")
+    build = commands.add_parser("build", help="embed, tag and upsert recipes")
+    build.add_argument("recipes", help="dataset CSV or JSON list of recipes")
+    build.add_argument("--limit", type=int, default=0)
+    build.add_argument("--recreate", action="store_true", help="drop and recreate the collection first")
+    commands.add_parser("tune", help="apply the quantization/HNSW settings to the existing collection")
+    commands.add_parser("sparse", help="rewrite the BM25 index file from the collection")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    if args.command == "tag":
+        tag_collection(client)
+    elif args.command == "tune":
+        tune_collection(client)
+        return
+    elif args.command == "build":
+        recipes = load_recipes(args.recipes, args.limit)
+        build_collection(client, OpenAI(api_key=os.getenv("OPENAI_API_KEY")), recipes, recreate=args.recreate)
+    # Titles, ingredients or diet tags changed - the workers remap the new file on their next search
+    write_sparse_index(client)
+
+
+if __name__ == "__main__":
+    main()
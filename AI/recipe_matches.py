@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from logger import get_logger
+
+MATCHES_FORMAT = "recipe-matches"
+
+# (Qdrant point ID, similarity) pairs, best first
+Candidates = Tuple[Tuple[Any, float], ...]
+
+
+def product_key(product) -> str:
+    """The scraper pipeline's product key (catalog_diff.product_key): product ID, else the normalized name"""
+    if product.product_id:
+        return str(product.product_id)
+    return "name:" + " ".join(product.name.lower().split())
+
+
+class RecipeMatchTable:
+    """
+    Candidate recipes for every catalog product, precomputed by the pipeline's
+    `match_recipes` stage (scraper/recipe_matcher.py) - no embedding or vector search per product.
+    """
+    __slots__ = ("matches", "metadata")
+
+    def __init__(self, matches: Dict[str, Candidates], metadata: Dict[str, Any]):
+        self.matches = matches
+        self.metadata = metadata
+
+    @classmethod
+    def from_file(cls, path: str) -> "RecipeMatchTable":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != MATCHES_FORMAT:
+            raise ValueError(f"Not a recipe match table: {path}")
+        matches = {key: tuple((point_id, float(score)) for point_id, score in entry.get("r", ()))
+                   for key, entry in data.pop("matches", {}).items()}
+        return cls(matches, data)
+
+    def __len__(self) -> int:
+        return len(self.matches)
+
+    def candidates(self, product) -> Optional[Candidates]:
+        """Precomputed candidates for a catalog product, None if the product is not in the table"""
+        return self.matches.get(product_key(product))
+
+
+class RecipeMatchStore:
+    """Match tables per store, loaded on first use and reloaded when the pipeline publishes a new one"""
+
+    def __init__(self, path_pattern: str):
+        # e.g. "shared_data/{store}_recipe_matches.json"
+        self.path_pattern = path_pattern
+        self.logger = get_logger("app-RecipeMatches")
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Tuple[float, RecipeMatchTable]] = {}
+
+    def get(self, store: Optional[str]) -> Optional[RecipeMatchTable]:
+        if not store:
+            return None
+        path = self.path_pattern.format(store=store)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            loaded = self._tables.get(store)
+            if loaded is not None and loaded[0] == mtime:
+                return loaded[1]
+            try:
+                table = RecipeMatchTable.from_file(path)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"❌ Could not load recipe matches for '{store}': {e}")
+                return loaded[1] if loaded else None
+            self._tables[store] = (mtime, table)
+            self.logger.info(f"🍲 Loaded recipe matches for '{store}': {len(table)} products ({path})")
+            return table
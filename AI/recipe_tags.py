@@ -0,0 +1,110 @@
+import ast
+import re
+from typing import Any, Iterable, List
+
+from preselect import RESTRICTION_FLAGS
+
+# Diet tags stored in the recipe payload ("diet", keyword payload index) and used as search filters
+DIET_TAGS = ("vegetarian", "vegan", "gluten_free", "lactose_free", "keto")
+DIET_FIELD = "diet"
+
+# Dietary restrictions (frontend labels and API names) -> recipe diet tags
+RESTRICTION_TAGS = {**RESTRICTION_FLAGS, "keto": "keto"}
+
+# Ingredient terms (whole words, optional plural "s"/"es") that rule a diet tag out
+MEAT = ("chicken", "beef", "pork", "bacon", "ham", "lamb", "mutton", "turkey", "duck", "goose", "veal", "venison",
+        "sausage", "chorizo", "salami", "pepperoni", "prosciutto", "pancetta", "guanciale", "lard", "gelatin",
+        "meat", "steak", "mince", "oxtail", "liver", "bone broth", "chicken broth", "chicken stock", "beef stock",
+        "fish", "salmon", "tuna", "cod", "halibut", "trout", "sardine", "anchovy", "anchovies", "mackerel",
+        "shrimp", "prawn", "crab", "lobster", "clam", "mussel", "oyster", "scallop", "squid", "octopus",
+        "fish sauce", "worcestershire")
+DAIRY = ("milk", "butter", "buttermilk", "cheese", "cheddar", "parmesan", "parmigiano", "mozzarella", "ricotta",
+         "feta", "gruyère", "gruyere", "pecorino", "mascarpone", "cream", "crème fraîche", "creme fraiche",
+         "yogurt", "yoghurt", "ghee", "whey", "custard", "kefir", "quark")
+OTHER_ANIMAL = ("egg", "egg white", "egg yolk", "honey", "mayonnaise", "mayo")
+GLUTEN = ("flour", "all-purpose", "bread", "breadcrumbs", "panko", "baguette", "brioche", "pita", "tortilla",
+          "pasta", "spaghetti", "macaroni", "penne", "linguine", "fettuccine", "lasagna", "noodle", "couscous",
+          "barley", "rye", "wheat", "bulgur", "farro", "semolina", "spelt", "soy sauce", "beer", "cracker",
+          "cookie", "crouton", "dumpling", "seitan", "loaf", "bun", "croissant", "pastry", "pie crust")
+HIGH_CARB = ("sugar", "flour", "bread", "pasta", "spaghetti", "macaroni", "noodle", "rice", "potato", "corn",
+             "beans", "lentil", "chickpea", "oats", "oatmeal", "quinoa", "couscous", "barley", "honey",
+             "maple syrup", "agave", "banana", "tortilla", "cracker", "dal", "juice", "cider", "syrup",
+             "loaf", "bun", "pastry")
+# Phrases that contain a ruled-out term but are not that ingredient (checked per rule)
+DAIRY_EXCEPTIONS = ("peanut butter", "almond butter", "cashew butter", "apple butter", "cocoa butter", "butternut",
+                    "butter bean", "coconut milk", "coconut cream", "almond milk", "oat milk", "soy milk",
+                    "rice milk", "cream of tartar", "vegan")
+ANIMAL_EXCEPTIONS = ("eggplant", "vegan")
+GLUTEN_EXCEPTIONS = ("almond flour", "coconut flour", "rice flour", "chickpea flour", "corn flour", "buckwheat",
+                     "rice noodle", "glass noodle", "tamari", "gluten-free")
+CARB_EXCEPTIONS = ("sugar-free", "cream of tartar")
+
+
+def _pattern(terms: Iterable[str]) -> "re.Pattern":
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternatives})(?:e?s)?\b")
+
+
+class _Rule:
+    """Ingredient terms that rule a tag out, minus exception phrases"""
+
+    def __init__(self, terms: Iterable[str], exceptions: Iterable[str] = ()):
+        self.pattern = _pattern(terms)
+        self.exceptions = _pattern(exceptions) if exceptions else None
+
+    def found_in(self, text: str) -> bool:
+        if self.exceptions is not None:
+            text = self.exceptions.sub(" ", text)
+        return bool(self.pattern.search(text))
+
+
+MEAT_RULE = _Rule(MEAT)
+DAIRY_RULE = _Rule(DAIRY, DAIRY_EXCEPTIONS)
+OTHER_ANIMAL_RULE = _Rule(OTHER_ANIMAL, ANIMAL_EXCEPTIONS)
+GLUTEN_RULE = _Rule(GLUTEN, GLUTEN_EXCEPTIONS)
+HIGH_CARB_RULE = _Rule(HIGH_CARB, CARB_EXCEPTIONS)
+
+
+def parse_ingredients(value: Any) -> List[str]:
+    """Recipe ingredients as a list - payloads hold a list or its string form ("['1 cup milk', ...]")"""
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    text = str(value or "").strip()
+    if text.startswith("["):
+        try:
+            parsed = ast.literal_eval(text)
+            if isinstance(parsed, (list, tuple)):
+                return [str(item) for item in parsed]
+        except (ValueError, SyntaxError):
+            pass
+        text = text.strip("[]")
+    return [part.strip(" '\"") for part in text.split("',") if part.strip(" '\"")]
+
+
+def diet_tags(ingredients: Any) -> List[str]:
+    """Diet tags a recipe satisfies, derived from its ingredient list (conservative lexicon match)"""
+    text = " ; ".join(parse_ingredients(ingredients)).lower()
+    has_meat = MEAT_RULE.found_in(text)
+    has_dairy = DAIRY_RULE.found_in(text)
+    tags = []
+    if not has_meat:
+        tags.append("vegetarian")
+        if not has_dairy and not OTHER_ANIMAL_RULE.found_in(text):
+            tags.append("vegan")
+    if not GLUTEN_RULE.found_in(text):
+        tags.append("gluten_free")
+    if not has_dairy:
+        tags.append("lactose_free")
+    if not HIGH_CARB_RULE.found_in(text):
+        tags.append("keto")
+    return tags
+
+
+def restriction_tags(restrictions: Iterable[str]) -> List[str]:
+    """Diet tags required by the request's dietary restrictions (unknown restrictions are ignored)"""
+    tags = []
+    for restriction in restrictions or ():
+        tag = RESTRICTION_TAGS.get(str(restriction).strip().lower())
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
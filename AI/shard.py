@@ -0,0 +1,272 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from catalog import Catalog, CatalogProduct, TrigramIndex
+from pricing import normalize_name
+
+# Memory-mappable catalog shard. Every worker process maps the same file, so the OS page
+# cache holds a single copy of the catalog instead of one list of objects per worker.
+#
+#   header   MAGIC, version, product count, metadata length
+#   metadata JSON (catalog header/footer, store, date)
+#   records  fixed-size RECORD per product, sorted by search key (binary search lookups)
+#   strings  UTF-8 blob referenced by (offset, length) pairs from the records
+#   trigrams 8-byte aligned arrays of the catalog.TrigramIndex over the search keys: codes (uint64),
+#            postings (uint32), offsets (uint32), trigrams per record (uint16); sizes in the metadata
+MAGIC = b"TGSHARD1"
+# 2: products without a price are kept (price -1)
+# 3: trigram index for inexact name lookups
+VERSION = 3
+HEADER = struct.Struct("<8sIII")
+# price (-1 = none), original price (-1 = none), category, dietary flags, then (offset, length) of:
+# name, translated_name, search_key, product_id, discount_info, keywords ("\x1f"-joined)
+RECORD = struct.Struct("<iiBBxx" + "II" * 6)
+STRING_FIELDS = 6
+# Decoded products kept per shard (least recently used dropped first)
+PRODUCT_CACHE_SIZE = 4096
+# Metadata entry with the trigram index sizes (not part of the catalog metadata)
+INDEX_KEY = "_trigram_index"
+KEYWORD_SEPARATOR = "\x1f"
+# Numeric record columns as a zero-copy numpy view of the mapping (vectorized filtering)
+RECORD_DTYPE = np.dtype([("price_cents", "<i4"), ("original_price_cents", "<i4"), ("category_id", "u1"),
+                         ("dietary", "u1"), ("_pad", "V2"), ("strings", "<u4", (STRING_FIELDS * 2,))])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+def is_current(path: str) -> bool:
+    """Whether `path` is a shard this version can map (older shards are rebuilt)"""
+    try:
+        with open(path, "rb") as f:
+            magic, version, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return False
+    return magic == MAGIC and version == VERSION
+
+
+def embeddings_path(shard_path: str) -> str:
+    """Product embeddings (float32, L2-normalized, one row per record in shard order) stored next to the shard"""
+    return f"{shard_path}.emb.npy"
+
+
+def write_embeddings(shard_path: str, vectors: np.ndarray):
+    """Write normalized product embeddings for a shard (atomically)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    tmp_path = f"{shard_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, vectors)
+    os.replace(tmp_path, embeddings_path(shard_path))
+
+
+def _align(offset: int) -> int:
+    return offset + -offset % 8
+
+
+def write_shard(path: str, catalog: Catalog, metadata: Optional[Dict[str, Any]] = None):
+    """Write a catalog as a shard file (atomically - readers keep their mapping of the old file)"""
+    products = sorted(catalog, key=lambda product: product.search_key)
+    trigram_index = TrigramIndex.build(product.search_key for product in products)
+
+    blob = bytearray()
+    records = bytearray()
+    for product in products:
+        refs = []
+        for value in (product.name, product.translated_name, product.search_key, product.product_id,
+                      product.discount_info, KEYWORD_SEPARATOR.join(product.keywords)):
+            data = (value or "").encode("utf-8")
+            refs += [len(blob), len(data)]
+            blob += data
+        price = -1 if product.price_cents is None else product.price_cents
+        original = -1 if product.original_price_cents is None else product.original_price_cents
+        records += RECORD.pack(price, original, product.category_id, product.dietary, *refs)
+
+    index_info = {"strings": len(blob), "trigrams": len(trigram_index.codes),
+                  "postings": len(trigram_index.postings)}
+    meta = json.dumps({**catalog.metadata, **(metadata or {}), INDEX_KEY: index_info},
+                      ensure_ascii=False).encode("utf-8")
+    meta += b"\0" * (-(HEADER.size + len(meta)) % 8)
+    strings_end = HEADER.size + len(meta) + len(records) + len(blob)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(products), len(meta)))
+        f.write(meta)
+        f.write(records)
+        f.write(blob)
+        f.write(b"\0" * (_align(strings_end) - strings_end))
+        for array in (trigram_index.codes, trigram_index.postings, trigram_index.offsets):
+            f.write(array.tobytes())
+        f.write(trigram_index.sizes.tobytes())
+    os.replace(tmp_path, path)
+
+
+class _SearchKeys:
+    """Lazy sequence of record search keys for bisect"""
+
+    def __init__(self, shard: "ShardCatalog"):
+        self.shard = shard
+
+    def __len__(self):
+        return len(self.shard)
+
+    def __getitem__(self, index: int) -> str:
+        return self.shard._string(index, 2)
+
+
+class ShardCatalog:
+    """
+    Read-only catalog backed by a memory-mapped shard, with the same read interface as
+    catalog.Catalog. Products are decoded on access (with interned strings, like Catalog) and the
+    most recently used PRODUCT_CACHE_SIZE are kept; nothing is copied at open time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, meta_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"Not a catalog shard (or unsupported version): {path}")
+        self._count = count
+        self.metadata: Dict[str, Any] = json.loads(bytes(self._mmap[HEADER.size:HEADER.size + meta_length]).rstrip(b"\0"))
+        index_info = self.metadata.pop(INDEX_KEY)
+        self._records_offset = HEADER.size + meta_length
+        self._strings_offset = self._records_offset + count * RECORD.size
+        self._keys = _SearchKeys(self)
+        self.columns = np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=count, offset=self._records_offset)
+        self.trigram_index = self._map_trigram_index(_align(self._strings_offset + index_info["strings"]),
+                                                     index_info["trigrams"], index_info["postings"])
+        self.embeddings = self._load_embeddings()
+        self._products: "OrderedDict[int, CatalogProduct]" = OrderedDict()
+        self._products_lock = threading.Lock()
+
+    def _map_trigram_index(self, offset: int, trigrams: int, postings: int) -> TrigramIndex:
+        arrays = []
+        for dtype, length in ((np.uint64, trigrams), (np.uint32, postings), (np.uint32, trigrams + 1),
+                              (np.uint16, self._count)):
+            array = np.frombuffer(self._mmap, dtype=dtype, count=length, offset=offset)
+            arrays.append(array)
+            offset += array.nbytes
+        codes, posting_array, offsets, sizes = arrays
+        return TrigramIndex(codes, offsets, posting_array, sizes)
+
+    def _search_key(self, index: int) -> str:
+        return self._string(index, 2)
+
+    def _load_embeddings(self) -> Optional[np.ndarray]:
+        """Memory-mapped product embeddings, if built for this version of the shard"""
+        path = embeddings_path(self.path)
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(self.path):
+                return None
+            embeddings = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return embeddings if embeddings.ndim == 2 and embeddings.shape[0] == self._count else None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mmap) + (self.embeddings.nbytes if self.embeddings is not None else 0)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _record(self, index: int):
+        return RECORD.unpack_from(self._mmap, self._records_offset + index * RECORD.size)
+
+    def _string(self, index: int, field: int) -> str:
+        offset, length = struct.unpack_from("<II", self._mmap, self._records_offset + index * RECORD.size + 12 + field * 8)
+        start = self._strings_offset + offset
+        return self._mmap[start:start + length].decode("utf-8")
+
+    def product(self, index: int) -> CatalogProduct:
+        with self._products_lock:
+            product = self._products.get(index)
+            if product is not None:
+                self._products.move_to_end(index)
+                return product
+        product = self._decode(index)
+        with self._products_lock:
+            self._products[index] = product
+            if len(self._products) > PRODUCT_CACHE_SIZE:
+                self._products.popitem(last=False)
+        return product
+
+    def _decode(self, index: int) -> CatalogProduct:
+        record = self._record(index)
+        strings = []
+        for field in range(STRING_FIELDS):
+            start = self._strings_offset + record[4 + field * 2]
+            strings.append(self._mmap[start:start + record[5 + field * 2]].decode("utf-8"))
+        name, translated_name, search_key, product_id, discount_info, keywords = strings
+        return CatalogProduct(
+            product_id=product_id or None,
+            name=sys.intern(name),
+            translated_name=sys.intern(translated_name) if translated_name else None,
+            search_key=sys.intern(search_key),
+            price_cents=None if record[0] < 0 else record[0],
+            original_price_cents=None if record[1] < 0 else record[1],
+            discount_info=sys.intern(discount_info) if discount_info else None,
+            category_id=record[2],
+            keywords=tuple(map(sys.intern, keywords.split(KEYWORD_SEPARATOR))) if keywords else (),
+            dietary=record[3],
+        )
+
+    def __iter__(self) -> Iterator[CatalogProduct]:
+        # A full pass (builds, name lists) uses cached products but does not flush the cache with the rest
+        for index in range(self._count):
+            product = self._products.get(index)
+            yield product if product is not None else self._decode(index)
+
+    def get(self, name: str) -> Optional[CatalogProduct]:
+        key = normalize_name(name)
+        index = bisect_left(self._keys, key)
+        if index < self._count and self._keys[index] == key:
+            return self.product(index)
+        return None
+
+    def find(self, name: str) -> Optional[CatalogProduct]:
+        product = self.get(name)
+        if product is not None:
+            return product
+        key = normalize_name(name)
+        if not key:
+            return None
+        index = self.trigram_index.first_containing(key, self._search_key)
+        return None if index is None else self.product(index)
+
+    def closest(self, name: str) -> Optional[CatalogProduct]:
+        product = self.get(name)
+        if product is not None:
+            return product
+        key = normalize_name(name)
+        if not key:
+            return None
+        index = self.trigram_index.closest(key, self._search_key)
+        return None if index is None else self.product(index)
+
+    def names(self) -> List[str]:
+        return [self._string(index, 0) for index in range(self._count)]
+
+    def close(self):
+        # numpy views keep the buffer exported - drop them before unmapping
+        self.columns = None
+        self.embeddings = None
+        self.trigram_index = None
+        self._products.clear()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A view is still referenced somewhere - the mapping is released when it is collected
+            pass
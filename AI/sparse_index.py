@@ -0,0 +1,208 @@
+import json
+import math
+import mmap
+import os
+import re
+import struct
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from recipe_tags import DIET_FIELD, DIET_TAGS, parse_ingredients
+
+TOKEN_PATTERN = re.compile(r"[a-zà-ÿ]+")
+# Quantities, units and preparation words carry no information about the ingredient
+STOPWORDS = frozenset("""
+a an and or of the to into for with without about plus more less divided optional taste room temperature
+cup cups tsp tbsp teaspoon teaspoons tablespoon tablespoons oz ounce ounces lb lbs pound pounds g kg ml l
+pinch dash can cans package packages piece pieces stick sticks clove cloves bunch slice slices sprig sprigs
+large small medium whole fresh freshly finely coarsely thinly thickly chopped minced sliced diced grated
+peeled cut torn halved quartered crushed ground melted softened packed total inch inches such as like
+other each some about very good quality store bought storebought homemade
+""".split())
+# Title terms count more than ingredient terms
+TITLE_WEIGHT = 2
+
+# Index file written by recipe_index.py and memory-mapped by every backend worker:
+#   header   MAGIC, metadata length
+#   metadata JSON (terms -> [start, count] of their postings, document IDs, totals)
+#   arrays   posting documents (int32), posting frequencies (int32), document lengths (int32),
+#            document diet tags (uint8 bitmask over DIET_TAGS), each 8-byte aligned
+MAGIC = b"TGBM25\x00\x01"
+HEADER = struct.Struct("<8sQ")
+
+
+def stem(token: str) -> str:
+    """Light plural folding: tomatoes -> tomato, eggs -> egg, berries -> berry"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("oes"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall((text or "").lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def rrf(rankings: Sequence[Sequence[Any]], k: int = 60) -> List[Tuple[Any, float]]:
+    """Reciprocal rank fusion of several rankings (lists of IDs, best first)"""
+    scores: Dict[Any, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    BM25 index over recipe titles and ingredients (the sparse half of hybrid retrieval): exact
+    ingredient words are found directly, not via a wide dense search. Built with add() (or
+    from_qdrant() by recipe_index.py), searched from flat posting arrays - which load() maps
+    from the index file, so all workers share one copy through the page cache.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[Any] = []
+        self.total_length = 0
+        self.metadata: Dict[str, Any] = {}
+        self._building: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        self._diets: List[int] = []
+        self._terms: Optional[Dict[str, Tuple[int, int]]] = None
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._mmap: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def add(self, doc_id: Any, title: str, ingredients: Any, diet: Iterable[str] = ()):
+        if self._mmap is not None:
+            raise ValueError("A loaded index is read-only")
+        terms = Counter(tokenize(title) * TITLE_WEIGHT)
+        terms.update(tokenize(" ".join(parse_ingredients(ingredients))))
+        index = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self._lengths.append(sum(terms.values()))
+        self._diets.append(sum(1 << bit for bit, tag in enumerate(DIET_TAGS) if tag in set(diet or ())))
+        for term, frequency in terms.items():
+            self._building[term].append((index, frequency))
+        self.total_length += self._lengths[-1]
+        self._terms = None
+
+    def _freeze(self):
+        """Posting lists of the added documents as flat arrays (term -> slice)"""
+        terms, documents, frequencies = {}, [], []
+        for term, postings in self._building.items():
+            terms[term] = (len(documents), len(postings))
+            documents.extend(index for index, _ in postings)
+            frequencies.extend(frequency for _, frequency in postings)
+        self._terms = terms
+        self._arrays = {
+            "documents": np.asarray(documents, dtype=np.int32),
+            "frequencies": np.asarray(frequencies, dtype=np.int32),
+            "lengths": np.asarray(self._lengths, dtype=np.int32),
+            "diets": np.asarray(self._diets, dtype=np.uint8),
+        }
+
+    @classmethod
+    def from_payloads(cls, points: Iterable[Tuple[Any, Dict[str, Any]]]) -> "BM25Index":
+        index = cls()
+        for doc_id, payload in points:
+            index.add(doc_id, payload.get("title", ""), payload.get("ingredients"), payload.get(DIET_FIELD, ()))
+        return index
+
+    @classmethod
+    def from_qdrant(cls, client, collection: str = "recipes") -> "BM25Index":
+        """Index every recipe of a Qdrant collection (payload only, no vectors)"""
+        index = cls()
+        offset = None
+        while True:
+            page, offset = client.scroll(collection_name=collection, limit=512, offset=offset,
+                                         with_payload=["title", "ingredients", DIET_FIELD], with_vectors=False)
+            for point in page:
+                payload = point.payload or {}
+                index.add(point.id, payload.get("title", ""), payload.get("ingredients"), payload.get(DIET_FIELD, ()))
+            if offset is None:
+                index.metadata = {"collection": collection}
+                return index
+
+    def save(self, path: str):
+        """Write the index file (atomically); document IDs must be JSON values (Qdrant IDs are)"""
+        if self._terms is None:
+            self._freeze()
+        arrays, offset = [], 0
+        for name in ("documents", "frequencies", "lengths", "diets"):
+            arrays.append((name, offset, self._arrays[name]))
+            offset += -(-self._arrays[name].nbytes // 8) * 8
+        meta = json.dumps({"k1": self.k1, "b": self.b, "total_length": self.total_length, "doc_ids": self.doc_ids,
+                           "terms": self._terms, "metadata": self.metadata,
+                           "arrays": {name: [start, len(array), array.dtype.str] for name, start, array in arrays}},
+                          ensure_ascii=False).encode("utf-8")
+        meta += b" " * (-(HEADER.size + len(meta)) % 8)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(meta)))
+            f.write(meta)
+            for _, start, array in arrays:
+                f.write(array.tobytes())
+                f.write(b"\0" * (-array.nbytes % 8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Map an index file written by save()"""
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            data.close()
+            raise ValueError(f"Not a BM25 index file (or unsupported version): {path}")
+        meta = json.loads(bytes(data[HEADER.size:HEADER.size + meta_length]))
+        index = cls(meta["k1"], meta["b"])
+        index.doc_ids = meta["doc_ids"]
+        index.total_length = meta["total_length"]
+        index.metadata = meta.get("metadata", {})
+        index._terms = {term: tuple(span) for term, span in meta["terms"].items()}
+        base = HEADER.size + meta_length
+        index._arrays = {name: np.frombuffer(data, dtype=np.dtype(dtype), count=count, offset=base + start)
+                         for name, (start, count, dtype) in meta["arrays"].items()}
+        index._mmap = data
+        return index
+
+    def search(self, query: str, limit: int = 10, diet: Sequence[str] = ()) -> List[Tuple[Any, float]]:
+        """Top `limit` (doc ID, score) for the query, only documents tagged with all `diet` tags"""
+        total = len(self.doc_ids)
+        if total == 0 or limit <= 0:
+            return []
+        if self._terms is None:
+            self._freeze()
+        required = sum(1 << bit for bit, tag in enumerate(DIET_TAGS) if tag in set(diet or ()))
+        lengths = self._arrays["lengths"]
+        average_length = self.total_length / total or 1.0
+        scores = np.zeros(total, dtype=np.float64)
+        for term in set(tokenize(query)):
+            span = self._terms.get(term)
+            if span is None:
+                continue
+            start, count = span
+            documents = self._arrays["documents"][start:start + count]
+            frequencies = self._arrays["frequencies"][start:start + count]
+            idf = math.log(1 + (total - count + 0.5) / (count + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[documents] / average_length)
+            # Each document appears once in a term's postings - plain fancy-index addition is safe
+            scores[documents] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+        if required:
+            scores[(self._arrays["diets"] & required) != required] = 0.0
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        best = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.doc_ids[index], float(scores[index])) for index in best]
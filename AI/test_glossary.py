@@ -0,0 +1,26 @@
+from glossary import Glossary
+
+
+def test_product_name_skips_brand_words():
+    glossary = Glossary()
+    assert glossary.translate("Kiełbasa Podwawelska Kraina Wędlin") == "sausage"
+    assert glossary.translate("Szynka wędzona Kraina Wędlin") == "smoked ham"
+
+
+def test_query_keeps_capitalized_words():
+    glossary = Glossary()
+    assert glossary.translate_query("Obiad Kurczak Ryż") == "dinner chicken rice"
+
+
+def test_query_with_unknown_word_goes_to_llm():
+    glossary = Glossary()
+    # Looked up as a product name first - the memo must not answer the query with the brand-stripped result
+    assert glossary.translate("Kiełbasa Podwawelska Kraina Wędlin") == "sausage"
+    assert glossary.translate_query("Kiełbasa Podwawelska Kraina Wędlin") is None
+    assert glossary.translate_query("Obiad bez mięsa") is None
+
+
+def test_learned_query_is_a_local_hit():
+    glossary = Glossary()
+    glossary.learn("Kiełbasa Podwawelska Kraina Wędlin", "Podwawelska sausage")
+    assert glossary.translate_query("Kiełbasa Podwawelska Kraina Wędlin") == "Podwawelska sausage"
@@ -0,0 +1,38 @@
+import os
+
+import httpx
+import pytest
+
+from openai_limiter import AdmissionTimeout, LimitedTransport, Limiter, MemoryStore
+
+SCRAPER_COPY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scraper", "openai_limiter.py")
+
+
+@pytest.mark.skipif(not os.path.exists(SCRAPER_COPY), reason="scraper/ is not part of this image")
+def test_scraper_vendors_the_same_limiter():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "openai_limiter.py"), "rb") as f:
+        ours = f.read()
+    with open(SCRAPER_COPY, "rb") as f:
+        assert f.read() == ours, "scraper/openai_limiter.py differs - copy AI/openai_limiter.py over it"
+
+
+def test_batch_call_past_the_deadline_is_rejected():
+    limiter = Limiter(MemoryStore(), rpm=60, tpm=0, batch_reserve=0.5)
+    answered = []
+
+    def handler(request):
+        answered.append(request.url.path)
+        return httpx.Response(200, json={})
+
+    transport = LimitedTransport(limiter, httpx.MockTransport(handler), priority_name="batch", deadline=lambda: 0.1)
+    client = httpx.Client(transport=transport)
+    for _ in range(30):
+        client.post("https://api.openai.com/v1/chat/completions", json={"messages": []})
+    with pytest.raises(AdmissionTimeout):
+        client.post("https://api.openai.com/v1/chat/completions", json={"messages": []})
+
+    metrics = limiter.metrics()
+    assert len(answered) == 30
+    assert metrics["batch"]["calls"] == 30
+    assert metrics["batch"]["rejected"] == 1
+    assert metrics["interactive"]["p95_wait_s"] == 0.0
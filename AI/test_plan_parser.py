@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from plan_parser import PlanParseError, extract_json, parse_plan, repair_json
+
+
+def meal(day: int, name: str, **fields) -> dict:
+    return {"day": day, "type": "obiad", "name": name,
+            "main_products": [{"name": "Filet z kurczaka", "quantity": "500 g", "price": "12.99 PLN"}],
+            "instructions": "Usmaż.", **fields}
+
+
+def plan_text(*meals) -> str:
+    return json.dumps({"plan_info": {"days": len(meals), "people": 2}, "meals": list(meals),
+                       "shopping_summary": {"total_savings": "3.00 PLN"}}, ensure_ascii=False)
+
+
+def test_complete_plan_is_not_truncated():
+    plan, truncated = parse_plan(plan_text(meal(1, "Kurczak z ryżem")))
+    assert not truncated
+    assert plan["meals"][0]["name"] == "Kurczak z ryżem"
+
+
+def test_truncation_mid_meal_keeps_complete_meals():
+    text = plan_text(meal(1, "Kurczak z ryżem"), meal(2, "Makaron z sosem"))
+    cut = text[:text.index("Makaron") + 10]
+    plan, truncated = parse_plan(cut)
+    assert truncated
+    assert [m["name"] for m in plan["meals"]] == ["Kurczak z ryżem"]
+    assert plan["plan_info"]["days"] == 2
+
+
+def test_truncation_before_first_meal_has_no_meals():
+    text = plan_text(meal(1, "Kurczak z ryżem"))
+    plan, truncated = parse_plan(text[:text.index("Kurczak z ryżem")])
+    assert truncated
+    assert plan["meals"] == []
+
+
+def test_truncation_before_anything_complete_fails():
+    with pytest.raises(PlanParseError):
+        parse_plan('{"plan_info": {"days": 1, "peo')
+
+
+def test_trailing_commas_are_dropped():
+    text = '{"plan_info": {"days": 1,}, "meals": [{"day": 1, "name": "Jajecznica",},],}'
+    repaired, truncated = repair_json(text)
+    assert not truncated
+    assert json.loads(repaired)["meals"] == [{"day": 1, "name": "Jajecznica"}]
+    plan, truncated = parse_plan(text)
+    assert not truncated
+    assert plan["meals"][0]["name"] == "Jajecznica"
+
+
+def test_text_after_the_object_is_ignored():
+    plan, truncated = parse_plan("Oto plan:\n" + plan_text(meal(1, "Zupa")) + "\nSmacznego! {nie JSON}")
+    assert not truncated
+    assert plan["meals"][0]["name"] == "Zupa"
+
+
+def test_fence_inside_a_string_value_is_kept():
+    instructions = "Wymieszaj:\n```\nsos + makaron\n```\nPodawaj na ciepło."
+    text = "```json\n" + plan_text(meal(1, "Makaron", instructions=instructions)) + "\n```\n"
+    assert extract_json(text).endswith("}")
+    plan, truncated = parse_plan(text)
+    assert not truncated
+    assert plan["meals"][0]["instructions"] == instructions
+
+
+def test_reply_without_json_fails():
+    with pytest.raises(PlanParseError):
+        parse_plan("Przepraszam, nie mogę pomóc.")
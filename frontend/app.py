@@ -1,13 +1,20 @@
 import streamlit as st
 import json
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 import time
 import sys
 import os
+from images import image_html
 
 API_URL = os.environ.get("API_URL", "http://rag-backend:5000/api/ask")
+# How long identical requests are answered from the cache (seconds) - the catalog changes daily
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+# Read timeout of a plan request (seconds) - above the backend's REQUEST_DEADLINE_S; a request given
+# up on closes its connection, which cancels the generation in the backend
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", 90))
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,6 +25,32 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class PlanRequestError(Exception):
+    """Failed plan request - raised (not returned) so that st.cache_data does not cache it"""
+
+    def __init__(self, message: str, result: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.result = result or {"status": "error", "message": message}
+
+
+class DegradedPlan(Exception):
+    """Plan simplified or cut short by the backend (deadline, max_tokens) - raised so that st.cache_data does not cache it"""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(f"Degraded plan: {result.get('degraded')}")
+        self.result = result
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled HTTP session per server process - keep-alive connections to the backend"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def post_query(query, days=1, people=1, dietary_restrictions=[], meal_types=[], excluded_ingredients=""):
     payload = {
         "query": query,
@@ -28,7 +61,33 @@ def post_query(query, days=1, people=1, dietary_restrictions=[], meal_types=[],
         "excluded_ingredients": excluded_ingredients,
     }
 
-    return requests.post(API_URL, json=payload)
+    return get_session().post(API_URL, json=payload, timeout=(5, API_TIMEOUT))
+
+
+@st.cache_data(ttl=RESPONSE_CACHE_TTL, max_entries=64, show_spinner=False)
+def fetch_plan(query: str, days: int, people: int, dietary_restrictions: tuple, meal_types: tuple,
+               excluded_ingredients: str) -> Dict[str, Any]:
+    """Plan for the given parameters; successful responses are cached (lists passed as tuples for the cache key)"""
+    response = post_query(query, days, people, list(dietary_restrictions), list(meal_types), excluded_ingredients)
+    if response.status_code == 504:
+        raise PlanRequestError("Przekroczono limit czasu tworzenia jadłospisu - spróbuj krótszego planu")
+    if response.status_code != 200:
+        raise PlanRequestError(f"Błąd serwera: {response.status_code}")
+    result = response.json()
+    if result.get("status") != "success":
+        raise PlanRequestError(result.get("message", "Nieznany błąd"), result)
+    if result.get("degraded"):
+        raise DegradedPlan(result)
+    return result
+
+
+def request_plan(query: str, days: int, people: int, dietary_restrictions: tuple, meal_types: tuple,
+                 excluded_ingredients: str) -> Tuple[Dict[str, Any], bool]:
+    """Plan and whether the backend had to simplify it (such plans are not cached)"""
+    try:
+        return fetch_plan(query, days, people, dietary_restrictions, meal_types, excluded_ingredients), False
+    except DegradedPlan as e:
+        return e.result, True
 
 def get_meal_type_emoji(meal_type: str) -> str:
     """Get emoji for meal type"""
@@ -40,10 +99,104 @@ def get_meal_type_emoji(meal_type: str) -> str:
     }
     return emojis.get(meal_type.lower(), "🍽️")
 
-def display_meals(meals, plan_info):
+MEAL_ORDER = {"breakfast": 1, "lunch": 2, "dinner": 3, "snack": 4}
+
+
+def item_details(item: Dict[str, Any], price_key: Optional[str] = None, price_prefix: str = "") -> str:
+    """Quantity and (optionally) price suffix shown after a product/ingredient name"""
+    details = ""
+    if 'quantity' in item:
+        details += f" ({item['quantity']})"
+    if price_key and price_key in item:
+        details += f" - {price_prefix}{item[price_key]}"
+    return details
+
+
+def build_view_model(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Everything the results view needs, computed once per response: meals grouped by day
+    and sorted, markdown lines prebuilt, shopping lists deduplicated and sorted.
+    Reruns (widget interactions) only render this structure.
+    """
+    meals = result.get("meals", [])
+
+    days: Dict[int, List[Dict[str, Any]]] = {}
+    for meal in meals:
+        meal_type = meal.get("type", "posiłek")
+        days.setdefault(meal.get("day", 1), []).append({
+            "title": f"### {get_meal_type_emoji(meal_type)} {meal.get('name', 'Posiłek bez nazwy')}",
+            "name": meal.get('name', 'Posiłek bez nazwy'),
+            "image_name": meal.get('image_name'),
+            "details": (f"**Typ:** {meal_type.title()}\n\n"
+                        f"**⏰ Czas przygotowania:** {meal.get('prep_time', 'N/A')}\n\n"
+                        f"**🍽️ Opis:** {meal.get('instructions', 'Brak opisu')}"),
+            "main_products": [f"- 🛒 **{product['name']}**{item_details(product, 'price')}"
+                              for product in meal.get("main_products", [])],
+            "additional_ingredients": [f"- {ingredient['name']}{item_details(ingredient, 'estimated_price', '~')}"
+                                       for ingredient in meal.get("additional_ingredients", [])],
+            "order": MEAL_ORDER.get(meal_type.lower(), 5),
+        })
+    for day_meals in days.values():
+        # Sort meals by typical order (breakfast, lunch, dinner)
+        day_meals.sort(key=lambda meal: meal["order"])
+
+    # Zbierz wszystkie produkty i składniki
+    all_main_products = set()
+    all_additional_ingredients = set()
+    for meal in meals:
+        for product in meal.get("main_products", []):
+            all_main_products.add(product['name'] + item_details(product))
+        for ingredient in meal.get("additional_ingredients", []):
+            all_additional_ingredients.add(ingredient['name'] + item_details(ingredient))
+
+    shopping_summary = result.get("shopping_summary", {})
+    costs = []
+    if 'promotional_products_cost' in shopping_summary:
+        costs.append(f"- Koszt produktów promocyjnych: {shopping_summary['promotional_products_cost']}")
+    if 'additional_ingredients_cost' in shopping_summary:
+        costs.append(f"- Koszt dodatkowych składników: {shopping_summary['additional_ingredients_cost']}")
+    if 'total_savings' in shopping_summary:
+        costs.append(f"- Oszczędności dzięki promocjom: {shopping_summary['total_savings']}")
+    if 'estimated_total_cost' in shopping_summary:
+        costs.append(f"- **Łączny szacowany koszt: {shopping_summary['estimated_total_cost']}**")
+    if shopping_summary.get('cost_basis') == 'per_meal':
+        costs.append("- _Produkt użyty w kilku posiłkach jest liczony w każdym z nich_")
+
+    return {
+        "plan_info": result.get("plan_info", {}),
+        "days": [(day, days[day]) for day in sorted(days)],
+        "main_products": "\n".join(f"- {product}" for product in sorted(all_main_products)),
+        "additional_ingredients": "\n".join(f"- {ingredient}" for ingredient in sorted(all_additional_ingredients)),
+        "costs": "\n".join(costs),
+    }
+
+
+def display_meal(meal: Dict[str, Any]):
+    st.markdown(meal["title"])
+    # Display image if available - resized, cached variant instead of the full-size original
+    if meal["image_name"]:
+        picture = image_html(meal["image_name"], caption=meal["name"])
+        if picture:
+            st.markdown(picture, unsafe_allow_html=True)
+
+    st.markdown(meal["details"])
+
+    # Main products from promotions
+    if meal["main_products"]:
+        st.markdown("**🏷️ Produkty promocyjne z Biedronki:**\n" + "\n".join(meal["main_products"]))
+
+    # Additional ingredients
+    if meal["additional_ingredients"]:
+        st.markdown("**🧂 Dodatkowe składniki:**\n" + "\n".join(meal["additional_ingredients"]))
+
+    st.markdown("---")
+
+
+def display_meals(view: Dict[str, Any]):
     st.subheader("🍽️ Oto przygotowany jadłospis dla Ciebie")
 
     # Display plan info
+    plan_info = view["plan_info"]
     if plan_info:
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -55,104 +208,37 @@ def display_meals(meals, plan_info):
 
     st.markdown("---")
 
-    # Group meals by day
-    meals_by_day = {}
-    for meal in meals:
-        day = meal.get("day", 1)
-        meals_by_day.setdefault(day, []).append(meal)
-
-    # Display meals by day
-    for day in sorted(meals_by_day.keys()):
-        with st.expander(f"📅 Dzień {day}", expanded=True):
-            day_meals = meals_by_day[day]
-
-            # Sort meals by typical order (breakfast, lunch, dinner)
-            meal_order = {"breakfast": 1, "lunch": 2, "dinner": 3, "snack": 4}
-            day_meals.sort(key=lambda x: meal_order.get(x.get("type", "").lower(), 5))
+    days = view["days"]
+    if not days:
+        return
+    # Only the selected day is rendered - a 7-day plan does not build all days on every rerun
+    if len(days) > 1:
+        selected = st.radio("📅 Dzień", [day for day, _ in days], horizontal=True,
+                            format_func=lambda day: f"Dzień {day}", key="selected_day")
+    else:
+        selected = days[0][0]
 
+    for day, day_meals in days:
+        if day == selected:
+            st.markdown(f"#### 📅 Dzień {day}")
             for meal in day_meals:
-                meal_type = meal.get("type", "posiłek")
-                meal_emoji = get_meal_type_emoji(meal_type)
-
-                st.markdown(f"### {meal_emoji} {meal.get('name', 'Posiłek bez nazwy')}")
-                # Display image if available
-                if meal.get('image_name'):
-                    st.image(f"Images/{meal['image_name']}.jpg", caption=meal.get('name', 'Posiłek bez nazwy'), use_container_width=True)
-
-                st.markdown(f"**Typ:** {meal_type.title()}")
-                st.markdown(f"**⏰ Czas przygotowania:** {meal.get('prep_time', 'N/A')}")
-                st.markdown(f"**🍽️ Opis:** {meal.get('instructions', 'Brak opisu')}")
-
-                # Main products from promotions
-                main_products = meal.get("main_products", [])
-                if main_products:
-                    st.markdown("**🏷️ Produkty promocyjne z Biedronki:**")
-                    for product in main_products:
-                        product_info = f"- 🛒 **{product['name']}**"
-                        if 'quantity' in product:
-                            product_info += f" ({product['quantity']})"
-                        if 'price' in product:
-                            product_info += f" - {product['price']}"
-                        st.write(product_info)
-
-                # Additional ingredients
-                additional_ingredients = meal.get("additional_ingredients", [])
-                if additional_ingredients:
-                    st.markdown("**🧂 Dodatkowe składniki:**")
-                    for ingredient in additional_ingredients:
-                        ingredient_info = f"- {ingredient['name']}"
-                        if 'quantity' in ingredient:
-                            ingredient_info += f" ({ingredient['quantity']})"
-                        if 'estimated_price' in ingredient:
-                            ingredient_info += f" - ~{ingredient['estimated_price']}"
-                        st.write(ingredient_info)
-
-                    st.markdown("---")
-
-
-def display_shopping_summary(shopping_summary, meals):
-    st.subheader("🛍️ Podsumowanie zakupów")
+                display_meal(meal)
 
-    # Zbierz wszystkie produkty i składniki
-    all_main_products = set()
-    all_additional_ingredients = set()
-
-    for meal in meals:
-        for product in meal.get("main_products", []):
-            product_str = product['name']
-            if 'quantity' in product:
-                product_str += f" ({product['quantity']})"
-            all_main_products.add(product_str)
 
-        for ingredient in meal.get("additional_ingredients", []):
-            ingredient_str = ingredient['name']
-            if 'quantity' in ingredient:
-                ingredient_str += f" ({ingredient['quantity']})"
-            all_additional_ingredients.add(ingredient_str)
+def display_shopping_summary(view: Dict[str, Any]):
+    st.subheader("🛍️ Podsumowanie zakupów")
 
     # Wyświetl produkty promocyjne
-    if all_main_products:
-        st.markdown("**🏷️ Produkty promocyjne do kupienia w Biedronce:**")
-        for product in sorted(all_main_products):
-            st.write(f"- {product}")
+    if view["main_products"]:
+        st.markdown("**🏷️ Produkty promocyjne do kupienia w Biedronce:**\n" + view["main_products"])
 
     # Wyświetl dodatkowe składniki
-    if all_additional_ingredients:
-        st.markdown("**🧂 Inne potrzebne składniki:**")
-        for ingredient in sorted(all_additional_ingredients):
-            st.write(f"- {ingredient}")
+    if view["additional_ingredients"]:
+        st.markdown("**🧂 Inne potrzebne składniki:**\n" + view["additional_ingredients"])
 
     # Wyświetl podsumowanie kosztów
-    if shopping_summary:
-        st.markdown("**💰 Podsumowanie kosztów:**")
-        if 'promotional_products_cost' in shopping_summary:
-            st.write(f"- Koszt produktów promocyjnych: {shopping_summary['promotional_products_cost']}")
-        if 'additional_ingredients_cost' in shopping_summary:
-            st.write(f"- Koszt dodatkowych składników: {shopping_summary['additional_ingredients_cost']}")
-        if 'total_savings' in shopping_summary:
-            st.write(f"- Oszczędności dzięki promocjom: {shopping_summary['total_savings']}")
-        if 'estimated_total_cost' in shopping_summary:
-            st.write(f"- **Łączny szacowany koszt: {shopping_summary['estimated_total_cost']}**")
+    if view["costs"]:
+        st.markdown("**💰 Podsumowanie kosztów:**\n" + view["costs"])
 
 def display_error_message(result):
     """Display error message from API response"""
@@ -211,15 +297,9 @@ with st.sidebar:
     st.markdown("- Szybkie posiłki do pracy")
     st.markdown("- Zdrowe przekąski dla dzieci")
 
-# Initialize session state
-if "meals" not in st.session_state:
-    st.session_state.meals = []
-if "plan_info" not in st.session_state:
-    st.session_state.plan_info = {}
-if "shopping_summary" not in st.session_state:
-    st.session_state.shopping_summary = {}
-if "status" not in st.session_state:
-    st.session_state.status = ""
+# Initialize session state - the view model of the last successful plan
+if "view" not in st.session_state:
+    st.session_state.view = None
 
 # Main input
 query = st.text_input(
@@ -237,31 +317,24 @@ if st.button("🎯 Stwórz jadłospis", type="primary"):
 
         with st.spinner("🔍 Pobieranie aktualnej gazetki i tworzenie jadłospisu..."):
             try:
-                response = post_query(query, days, people, dietary_restrictions, meal_types, excluded_ingredients)
-
-                if response.status_code != 200:
-                    logger.error(f"Server error: {response.status_code}")
-                    st.error(f"❌ Błąd serwera: {response.status_code}")
-                else:
-                    result = response.json()
-                    logger.info(f"Received response with status: {result.get('status', 'unknown')}")
-
-                    if result.get("status") == "success":
-                        # Store results in session state
-                        st.session_state.meals = result.get("meals", [])
-                        st.session_state.plan_info = result.get("plan_info", {})
-                        st.session_state.shopping_summary = result.get("shopping_summary", {})
-                        st.session_state.status = result["status"]
-
-                        logger.info(f"Successfully loaded {len(st.session_state.meals)} meals")
-
-                        # Display success
-                        st.success("✅ Jadłospis został pomyślnie wygenerowany!")
-
-                    else:
-                        # Handle error response
-                        display_error_message(result)
-
+                result, degraded = request_plan(query, days, people, tuple(dietary_restrictions),
+                                                tuple(meal_types), excluded_ingredients)
+
+                # Store the precomputed view in session state
+                st.session_state.view = build_view_model(result)
+                st.session_state.pop("selected_day", None)
+                logger.info(f"Successfully loaded {len(result.get('meals', []))} meals")
+
+                # Display success
+                st.success("✅ Jadłospis został pomyślnie wygenerowany!")
+                if degraded:
+                    st.warning("⏱️ Jadłospis uproszczono lub skrócono (limit czasu albo długości odpowiedzi) - "
+                               "spróbuj ponownie, aby otrzymać pełną wersję")
+
+            except PlanRequestError as e:
+                logger.error(f"Plan request failed: {e}")
+                # Handle error response
+                display_error_message(e.result)
             except requests.exceptions.RequestException as e:
                 logger.exception("Network error during diet generation")
                 st.error(f"❌ Błąd połączenia z serwerem: {str(e)}")
@@ -273,17 +346,17 @@ if st.button("🎯 Stwórz jadłospis", type="primary"):
                 st.error(f"❌ Nieoczekiwany błąd: {str(e)}")
 
 # Display results if available
-if st.session_state.status == "success" and st.session_state.meals:
+if st.session_state.view and st.session_state.view["days"]:
     st.markdown("---")
 
     # Create two columns for layout
     col1, col2 = st.columns([2, 1])
 
     with col1:
-        display_meals(st.session_state.meals, st.session_state.plan_info)
+        display_meals(st.session_state.view)
 
     with col2:
-        display_shopping_summary(st.session_state.shopping_summary, st.session_state.meals)
+        display_shopping_summary(st.session_state.view)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,119 @@
+import hashlib
+import html
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = Path(os.environ.get("IMAGES_DIR", "Images"))
+
+# Streamlit serves ./static at app/static/ (server.enableStaticServing in .streamlit/config.toml),
+# without a Cache-Control header. Variant file names contain the hash of the source image, so they
+# never change: in front of Streamlit, nginx (nginx.conf, docker-compose) and the Traefik middleware
+# (k8s/ingress.yaml) serve app/static/thumbs with "Cache-Control: public, max-age=31536000, immutable".
+THUMBNAILS_DIR = Path(__file__).parent / "static" / "thumbs"
+THUMBNAILS_URL = "app/static/thumbs"
+
+# Widths matching the layout: mobile, the 2/3 meal column, wide screens / HiDPI
+THUMBNAIL_WIDTHS = (320, 640, 960)
+FORMATS = {"webp": {"format": "WEBP", "quality": 80, "method": 4},
+           "jpg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}}
+
+# Source hashes keyed by (path, size, mtime) - a rerun does not re-read unchanged images
+_source_hashes: Dict[tuple, str] = {}
+
+
+def source_hash(path: Path) -> str:
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _source_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _source_hashes[key] = digest.hexdigest()[:20]
+    return _source_hashes[key]
+
+
+def variant_name(digest: str, width: int, extension: str) -> str:
+    return f"{digest}-{width}.{extension}"
+
+
+def ensure_variants(path: Path) -> Optional[str]:
+    """
+    Generate the resized WebP/JPEG variants of an image (once per image content).
+    Returns the content hash used in the variant names, or None if the image is missing/broken.
+    """
+    if not path.is_file():
+        return None
+    try:
+        digest = source_hash(path)
+        missing = [(width, extension) for width in THUMBNAIL_WIDTHS for extension in FORMATS
+                   if not (THUMBNAILS_DIR / variant_name(digest, width, extension)).exists()]
+        if not missing:
+            return digest
+
+        THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+        with Image.open(path) as source:
+            source = source.convert("RGB")
+            for width, extension in missing:
+                image = source
+                if source.width > width:
+                    height = round(source.height * width / source.width)
+                    image = source.resize((width, height), Image.LANCZOS)
+                target = THUMBNAILS_DIR / variant_name(digest, width, extension)
+                # Write + rename, so a concurrent rerun never serves a half-written file
+                tmp_target = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+                image.save(tmp_target, **FORMATS[extension])
+                os.replace(tmp_target, target)
+        return digest
+    except (OSError, ValueError) as e:
+        logger.error(f"Thumbnail generation failed for {path}: {e}")
+        return None
+
+
+def image_html(image_name: str, caption: str = "", sizes: str = "(max-width: 640px) 100vw, 60vw") -> Optional[str]:
+    """
+    <picture> markup for a recipe image: WebP with JPEG fallback, the browser picks the width
+    that fits the layout (srcset) and loads images below the fold lazily.
+    """
+    digest = ensure_variants(IMAGES_DIR / f"{image_name}.jpg")
+    if digest is None:
+        return None
+
+    def srcset(extension: str) -> str:
+        return ", ".join(f"{THUMBNAILS_URL}/{variant_name(digest, width, extension)} {width}w"
+                         for width in THUMBNAIL_WIDTHS)
+
+    alt = html.escape(caption, quote=True)
+    caption_html = f'<figcaption style="text-align:center;opacity:0.7">{html.escape(caption)}</figcaption>' \
+        if caption else ""
+    return (
+        f'<figure style="margin:0 0 1rem 0">'
+        f'<picture>'
+        f'<source type="image/webp" srcset="{srcset("webp")}" sizes="{sizes}">'
+        f'<img src="{THUMBNAILS_URL}/{variant_name(digest, THUMBNAIL_WIDTHS[1], "jpg")}" '
+        f'srcset="{srcset("jpg")}" sizes="{sizes}" alt="{alt}" loading="lazy" decoding="async" '
+        f'style="width:100%;height:auto;border-radius:0.5rem">'
+        f'</picture>{caption_html}</figure>'
+    )
+
+
+def pregenerate(images_dir: Path = IMAGES_DIR) -> int:
+    """Generate variants for every image in the dataset (e.g. after adding new recipes)"""
+    count = 0
+    for path in sorted(images_dir.glob("*.jpg")):
+        if ensure_variants(path):
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else IMAGES_DIR
+    logger.info(f"Generated thumbnails for {pregenerate(directory)} images from {directory}")
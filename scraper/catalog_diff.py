@@ -0,0 +1,116 @@
+import re
+from pathlib import Path
+from typing import List, Dict, Optional, Iterable
+from catalog_io import CatalogReader
+
+# Pola, których zmiana oznacza zmianę oferty (a nie samego produktu)
+PRICE_FIELDS = ('price', 'original_price', 'discount_info', 'promotion_type')
+
+# Status produktu względem poprzedniego snapshotu zapisywany w polu `diff_status`
+ADDED = 'added'
+PRICE_CHANGED = 'price_changed'
+UNCHANGED = 'unchanged'
+
+PRODUCT_ID_PATTERN = re.compile(r'product,id,(\d+)')
+
+
+def product_id_from_url(url: Optional[str]) -> Optional[str]:
+    """Wyciąga ID produktu z adresu typu /pl/product,id,440327,name,..."""
+    if not url:
+        return None
+    match = PRODUCT_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def product_key(product: Dict) -> str:
+    """
+    Klucz produktu używany do porównywania snapshotów - ID produktu,
+    a gdy go brak (stare pliki, produkty bez URL) znormalizowana nazwa
+    """
+    product_id = product.get('product_id') or product_id_from_url(product.get('product_url'))
+    if product_id:
+        return str(product_id)
+    return 'name:' + ' '.join(product.get('name', '').lower().split())
+
+
+def load_previous_results(filepath, fields: Iterable[str]) -> Dict[str, Dict]:
+    """
+    Wczytuje z poprzedniego przebiegu tylko nazwę i wskazane pola każdego produktu
+    (klucz produktu -> {'name', *fields}), żeby nie trzymać w pamięci całego katalogu.
+    Brak pliku lub uszkodzony plik oznacza pusty snapshot - wtedy wszystko jest 'added'.
+    """
+    if not filepath or not Path(filepath).exists():
+        return {}
+    fields = list(fields)
+    results = {}
+    try:
+        for product in CatalogReader(filepath):
+            entry = {'name': product.get('name')}
+            for field in fields:
+                if field in product:
+                    entry[field] = product[field]
+            results[product_key(product)] = entry
+    except (OSError, ValueError):
+        return {}
+    return results
+
+
+class DiffTracker:
+    """
+    Przyrostowe porównanie strumienia produktów z poprzednim snapshotem.
+    `classify` zwraca status pojedynczego produktu, `result` - pełne zbiory
+    kluczy (added, removed, price_changed, unchanged) po przejściu całego strumienia.
+    """
+
+    def __init__(self, previous: Dict[str, Dict]):
+        self.previous = previous
+        self.sets = {ADDED: [], PRICE_CHANGED: [], UNCHANGED: []}
+        self.seen = set()
+
+    def classify(self, product: Dict) -> str:
+        key = product_key(product)
+        self.seen.add(key)
+        old = self.previous.get(key)
+        if old is None:
+            status = ADDED
+        elif any(old.get(field) != product.get(field) for field in PRICE_FIELDS):
+            status = PRICE_CHANGED
+        else:
+            status = UNCHANGED
+        self.sets[status].append(key)
+        return status
+
+    def result(self) -> Dict[str, List[str]]:
+        diff = {name: sorted(keys) for name, keys in self.sets.items()}
+        diff['removed'] = sorted(key for key in self.previous if key not in self.seen)
+        return diff
+
+
+def diff_summary(diff: Dict[str, List[str]]) -> str:
+    """Krótki opis diffa do logów"""
+    return ", ".join(f"{name}: {len(diff.get(name, []))}"
+                     for name in (ADDED, 'removed', PRICE_CHANGED, UNCHANGED))
+
+
+def carry_over(product: Dict, previous: Optional[Dict], fields: Iterable[str]) -> bool:
+    """
+    Przenosi wyniki poprzedniego przebiegu (pola `fields`) do produktu.
+
+    Wyniki LLM zależą tylko od nazwy produktu, więc zmiana samej ceny nie wymaga
+    ponownego przetwarzania - przenosimy je, o ile nazwa się nie zmieniła,
+    produkt nie jest oznaczony przez scraper jako nowy i poprzedni wynik zawiera
+    wszystkie pola (puste wartości traktujemy jak brak wyniku - np. nieudany batch LLM).
+    Zwraca True jeśli przeniesiono.
+    """
+    if previous is None:
+        return False
+    if product.get('diff_status') == ADDED:
+        return False
+    if previous.get('name') != product.get('name'):
+        return False
+    fields = list(fields)
+    if any(previous.get(field) in (None, [], '') for field in fields):
+        return False
+    for field in fields:
+        product[field] = previous[field]
+    return True
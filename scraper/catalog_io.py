@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Format wymiany między etapami pipeline'u (JSON Lines):
+#   {"_header": {"format": "catalog-jsonl", "version": 1, ...metadane}}
+#   {...produkt...}
+#   ...
+#   {"_footer": {"total_products": N, ...statystyki znane dopiero po przetworzeniu}}
+# Stopka oznacza, że plik jest kompletny. Pliki .json (stary format) są nadal obsługiwane.
+FORMAT_NAME = "catalog-jsonl"
+FORMAT_VERSION = 1
+HEADER_KEY = "_header"
+FOOTER_KEY = "_footer"
+PARTIAL_SUFFIX = ".partial"
+
+
+def is_jsonl(path) -> bool:
+    return str(path).endswith(".jsonl")
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Dzieli strumień na listy po `size` elementów (itertools.batched jest dopiero w 3.12)"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class CatalogReader:
+    """
+    Strumieniowy odczyt katalogu produktów.
+
+    Nagłówek jest dostępny od razu (`header`), produkty zwraca iterator,
+    a stopka (`footer`) jest wypełniona po przeczytaniu całego pliku.
+    W trybie `follow` czytnik czeka na kolejne rekordy pliku `<path>.partial`,
+    który wciąż zapisuje poprzedni etap - aż do pojawienia się stopki. Plik docelowy
+    jest wtedy przyjmowany tylko, jeśli powstał po `not_before` (domyślnie: start czytnika),
+    żeby etap nie przetworzył katalogu z poprzedniego przebiegu.
+    """
+
+    def __init__(self, path, follow: bool = False, poll_interval: float = 0.5,
+                 timeout: Optional[float] = None, not_before: Optional[float] = None):
+        self.path = Path(path)
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.not_before = time.time() if not_before is None else not_before
+        self.header: Dict[str, Any] = {}
+        self.footer: Optional[Dict[str, Any]] = None
+        self._products: Optional[List[Dict]] = None
+        self._file = None
+
+        if is_jsonl(self.path):
+            self._open_jsonl()
+        else:
+            self._open_json()
+
+    def _open_json(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get('products'), list):
+            raise ValueError(f"Brak listy 'products' w pliku {self.path}")
+        self._products = data.pop('products')
+        # W starym formacie metadane i statystyki są w jednym obiekcie
+        self.header = data
+        self.footer = dict(data)
+
+    def _open_jsonl(self):
+        if self.follow:
+            source = self._open_followed()
+        else:
+            source = self.path
+            self._file = open(source, 'r', encoding='utf-8')
+        first = self._read_record()
+        if not first or HEADER_KEY not in first:
+            self.close()
+            raise ValueError(f"Brak nagłówka w pliku {source}")
+        self.header = first[HEADER_KEY]
+
+    def _open_followed(self) -> Path:
+        """
+        Czeka (najwyżej `timeout`), aż poprzedni etap zacznie pisać `<path>.partial` albo
+        opublikuje plik docelowy nowszy niż `not_before`, i otwiera go
+        """
+        partial = Path(str(self.path) + PARTIAL_SUFFIX)
+        started = time.monotonic()
+        while True:
+            try:
+                self._file = open(partial, 'r', encoding='utf-8')
+                return partial
+            except FileNotFoundError:
+                # Jeszcze nie powstał albo właśnie został przemianowany na plik docelowy
+                pass
+            try:
+                if self.path.stat().st_mtime >= self.not_before:
+                    self._file = open(self.path, 'r', encoding='utf-8')
+                    return self.path
+            except FileNotFoundError:
+                pass
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                raise TimeoutError(f"Poprzedni etap nie zaczął pisać {partial} przez {self.timeout}s")
+            time.sleep(self.poll_interval)
+
+    def _read_record(self) -> Optional[Dict]:
+        """Czyta jeden pełny rekord; w trybie follow czeka na dopisanie niepełnej linii"""
+        started = time.monotonic()
+        while True:
+            position = self._file.tell()
+            line = self._file.readline()
+            if line.endswith("\n"):
+                if line.strip():
+                    return json.loads(line)
+                continue
+            if not self.follow:
+                return json.loads(line) if line.strip() else None
+            # Niepełna linia albo koniec pliku - poprzedni etap jeszcze pisze
+            self._file.seek(position)
+            if self.timeout is not None and time.monotonic() - started > self.timeout:
+                raise TimeoutError(f"Brak nowych rekordów w {self.path} przez {self.timeout}s")
+            time.sleep(self.poll_interval)
+
+    def __iter__(self) -> Iterator[Dict]:
+        if self._products is not None:
+            yield from self._products
+            return
+        try:
+            while True:
+                record = self._read_record()
+                if record is None:
+                    return
+                if FOOTER_KEY in record:
+                    self.footer = record[FOOTER_KEY]
+                    return
+                yield record
+        finally:
+            self.close()
+
+    @property
+    def complete(self) -> bool:
+        return self.footer is not None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CatalogWriter:
+    """
+    Strumieniowy zapis katalogu produktów.
+
+    JSONL: nagłówek i kolejne produkty trafiają od razu do `<path>.partial`
+    (może go czytać następny etap), a przy zamknięciu dopisywana jest stopka
+    i plik jest atomowo przemianowany na docelowy.
+    JSON: produkty są zbierane i zapisywane na końcu w starym formacie.
+    """
+
+    def __init__(self, path, header: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.header = {k: v for k, v in (header or {}).items() if k not in ('format', 'version')}
+        self.footer: Dict[str, Any] = {}
+        self.count = 0
+        self._products: Optional[List[Dict]] = None
+        self._file = None
+
+        if self.path.parent:
+            os.makedirs(self.path.parent, exist_ok=True)
+        if is_jsonl(self.path):
+            self._partial = Path(str(self.path) + PARTIAL_SUFFIX)
+            self._file = open(self._partial, 'w', encoding='utf-8')
+            self._write_line({HEADER_KEY: {'format': FORMAT_NAME, 'version': FORMAT_VERSION, **self.header}})
+        else:
+            self._products = []
+
+    def _write_line(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def write(self, product: Dict):
+        self.count += 1
+        if self._products is not None:
+            self._products.append(product)
+        else:
+            self._write_line(product)
+
+    def write_all(self, products: Iterable[Dict]):
+        for product in products:
+            self.write(product)
+
+    def close(self, footer: Optional[Dict[str, Any]] = None) -> str:
+        """Kończy zapis (z opcjonalną stopką) i publikuje plik. Zwraca ścieżkę."""
+        if footer:
+            self.footer.update(footer)
+        if self._products is not None:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({**self.header, **self.footer, 'products': self._products},
+                          f, ensure_ascii=False, indent=2)
+            self._products = None
+        elif self._file is not None:
+            self._write_line({FOOTER_KEY: self.footer})
+            self._file.close()
+            self._file = None
+            os.replace(self._partial, self.path)
+        return str(self.path)
+
+    def abort(self):
+        """Porzuca zapis - plik docelowy pozostaje nietknięty"""
+        self._products = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._partial.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif self._file is not None or self._products is not None:
+            self.close()
+
+
+# Pola zmieniające się przy każdym przebiegu, bez zmiany treści katalogu
+VOLATILE_FIELDS = ('scraped_at', 'diff_status')
+
+
+def content_hash(path) -> str:
+    """
+    Skrót treści katalogu - tylko produkty, bez nagłówka/stopki i pól zmiennych przy każdym
+    przebiegu (czas scrapowania, status diffa), żeby ten sam katalog dawał ten sam skrót
+    """
+    digest = hashlib.sha256()
+    for product in CatalogReader(path):
+        stable = {k: v for k, v in product.items() if k not in VOLATILE_FIELDS}
+        digest.update(json.dumps(stable, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        digest.update(b"\n")
+    return digest.hexdigest()
@@ -1,142 +1,280 @@
 import json
 import openai
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import time
 from pathlib import Path
 import os
 import sys
+from catalog_diff import product_key, load_previous_results, carry_over
+from catalog_io import CatalogReader, CatalogWriter
+from result_cache import ResultCache
+from llm_batch import LLMBatchExecutor, BatchFailed, estimate_tokens, executor_from_env, limiter_summary
+from openai_limiter import limited_http_client, shared_limiter
+from prefilter import LexiconClassifier
 
-class ProductKeywordsEnhancer:
-    def __init__(self, api_key: str):
+# Zmiana promptu lub modelu = nowa wersja, stare wpisy w cache przestają pasować
+ANNOTATION_PROMPT_VERSION = "annotation-v1"
+
+# Szacowana liczba tokenów odpowiedzi na jeden produkt (tłumaczenie, keywords, kategoria, flagi)
+ANNOTATION_OUTPUT_TOKENS = 70
+
+# Pola katalogu wyliczane przez LLM w jednym przebiegu
+ANNOTATION_FIELDS = ('translated_name', 'english_keywords', 'category', 'keep', 'dietary_flags')
+
+CATEGORIES = (
+    'meat', 'fish', 'dairy', 'eggs', 'bakery', 'vegetables', 'fruits', 'grains',
+    'pantry', 'frozen', 'sweets', 'snacks', 'beverages', 'non_food', 'other'
+)
+
+DIETARY_FLAGS = ('vegetarian', 'vegan', 'gluten_free', 'lactose_free')
+
+class ProductAnnotator:
+    def __init__(self, api_key: str, cache_file: str = None, executor: LLMBatchExecutor = None,
+                 prefilter: Optional[LexiconClassifier] = None):
         """
-        Agent LLM do dodawania angielskich słów kluczowych do produktów Biedronki
+        Agent LLM wyliczający w jednym zapytaniu wszystkie pola pochodne produktów Biedronki:
+        tłumaczenie nazwy, angielskie słowa kluczowe, kategorię, decyzję keep/remove i flagi dietetyczne.
+        `prefilter` rozstrzyga oczywiste przypadki przed LLM - produkty do usunięcia nie trafiają do LLM wcale,
+        a pewne "zostaw" dostają od LLM tylko opis (decyzja słownika jest ostateczna).
         """
-        self.client = openai.OpenAI(api_key=api_key)
+        # Ponowienia (z Retry-After) obsługuje LLMBatchExecutor, nie klient; limit klucza wspólny z backendem
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0, http_client=limited_http_client(shared_limiter(), 'batch'))
+        self.executor = executor or LLMBatchExecutor(max_batch_tokens=1600, max_batch_items=20)
+        # Trwały cache adnotacji - te same produkty wracają w gazetce co tydzień
+        self.cache = ResultCache(cache_file, ANNOTATION_PROMPT_VERSION)
+        self.prefilter = prefilter
         
-    def create_batch_prompt(self, products: List[Dict]) -> str:
+    @staticmethod
+    def batch_ids(products: List[Dict]) -> List[str]:
+        """ID produktów w prompcie - ID Biedronki, a dla produktów bez ID (lub powtórzonych) numer w batchu"""
+        ids = []
+        for i, product in enumerate(products):
+            key = product_key(product)
+            if key.startswith('name:') or key in ids:
+                key = f"item{i + 1}"
+            ids.append(key)
+        return ids
+    
+    def create_batch_prompt(self, products: List[Dict], ids: List[str]) -> str:
         """
         Tworzy sprytny prompt dla wielu produktów naraz - oszczędność tokenów
         """
-        # Wyciągamy tylko nazwy produktów
-        product_names = [p['name'] for p in products]
+        product_lines = [f"{product_id}: {product['name']}" for product_id, product in zip(ids, products)]
         
-        prompt = f"""Dodaj angielskie słowa kluczowe dla produktów spożywczych z polskiej sieci Biedronka.
+        prompt = f"""Opisz produkty z polskiej sieci Biedronka na potrzeby planera posiłków.
 
-PRODUKTY:
-{chr(10).join([f"{i+1}. {name}" for i, name in enumerate(product_names)])}
+PRODUKTY (ID: nazwa):
+{chr(10).join(product_lines)}
 
-ZADANIE: Dla każdego produktu podaj 3-5 angielskich słów kluczowych które pomogą w wyszukiwaniu przepisów.
+ZADANIE: Dla każdego produktu podaj:
+- "translated_name": krótka angielska nazwa produktu (bez marki i gramatury)
+- "keywords": 3-5 angielskich słów kluczowych, które pomogą w wyszukiwaniu przepisów
+- "category": jedna z: {', '.join(CATEGORIES)}
+- "keep": true jeśli produkt jest składnikiem do gotowania posiłków, false jeśli nie
+  (napoje, kawa/kapsułki, słodycze i przekąski do jedzenia bez gotowania, oleje i tłuszcze,
+  kosmetyki, chemia, artykuły dla dzieci i zwierząt, suplementy, elektronika)
+- "dietary": flagi {', '.join(DIETARY_FLAGS)} (true/false)
 
-FORMAT ODPOWIEDZI (JSON):
+FORMAT ODPOWIEDZI (JSON, klucze to ID produktów):
 {{
-  "keywords": [
-    ["sausage", "meat", "pork", "deli"],
-    ["bread", "bakery", "wheat", "loaf"],
+  "products": {{
+    "440327": {{
+      "translated_name": "pork sausage",
+      "keywords": ["sausage", "meat", "pork", "deli"],
+      "category": "meat",
+      "keep": true,
+      "dietary": {{"vegetarian": false, "vegan": false, "gluten_free": true, "lactose_free": true}}
+    }},
     ...
-  ]
+  }}
 }}
 
 ZASADY:
 - Używaj podstawowych angielskich nazw składników
-- Skupiaj się na kategoriach jedzenia (meat, dairy, vegetables, etc.)
 - Unikaj marek i szczegółów - tylko typy jedzenia
+- W razie wątpliwości, czy produkt nadaje się do gotowania - "keep": true
 - Odpowiedz TYLKO JSON, bez dodatkowych komentarzy"""
         
         return prompt
     
-    def get_keywords_batch(self, products: List[Dict]) -> List[List[str]]:
+    @staticmethod
+    def parse_annotation(raw: Any) -> Optional[Dict[str, Any]]:
+        """Waliduje adnotację jednego produktu i mapuje ją na pola katalogu; None = do ponowienia"""
+        if not isinstance(raw, dict):
+            return None
+        translated_name = raw.get('translated_name')
+        keywords = raw.get('keywords')
+        keep = raw.get('keep')
+        dietary = raw.get('dietary')
+        if not isinstance(translated_name, str) or not translated_name.strip():
+            return None
+        if not isinstance(keywords, list) or not keywords or not all(isinstance(k, str) for k in keywords):
+            return None
+        if not isinstance(keep, bool) or not isinstance(dietary, dict):
+            return None
+        category = raw.get('category')
+        return {
+            'translated_name': translated_name.strip(),
+            'english_keywords': keywords,
+            'category': category if category in CATEGORIES else 'other',
+            'keep': keep,
+            'dietary_flags': {flag: dietary.get(flag) is True for flag in DIETARY_FLAGS}
+        }
+    
+    def annotate_batch(self, products: List[Dict]) -> List[Optional[Dict[str, Any]]]:
         """
-        Pobiera słowa kluczowe dla grupy produktów w jednym zapytaniu
+        Pobiera adnotacje dla grupy produktów w jednym zapytaniu.
+        Błędy API są propagowane (ponawia je LLMBatchExecutor), a produkty
+        bez poprawnej odpowiedzi dostają None i zostaną ponowione osobno.
         """
-        prompt = self.create_batch_prompt(products)
+        ids = self.batch_ids(products)
+        prompt = self.create_batch_prompt(products, ids)
+        
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "Jesteś ekspertem od składników spożywczych. Odpowiadasz TYLKO w formacie JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.1,
+            max_tokens=100 + ANNOTATION_OUTPUT_TOKENS * 2 * len(products),
+            response_format={"type": "json_object"}
+        )
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "Jesteś ekspertem od składników spożywczych. Odpowiadasz TYLKO w formacie JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=800
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            return result["keywords"]
-            
-        except Exception as e:
-            print(f"Błąd API: {e}")
-            # Fallback - puste słowa kluczowe
-            return [[] for _ in products]
+            annotations = json.loads(response.choices[0].message.content)["products"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise BatchFailed(f"Niepoprawna odpowiedź LLM: {e}")
+        if not isinstance(annotations, dict):
+            raise BatchFailed("Pole 'products' nie jest obiektem")
+        
+        return [self.parse_annotation(annotations.get(product_id)) for product_id in ids]
+    
+    def product_cost(self, product: Dict) -> int:
+        """Szacowany koszt produktu w tokenach (linia promptu z ID + odpowiedź)"""
+        return estimate_tokens(product.get('name', '')) + 6 + ANNOTATION_OUTPUT_TOKENS
     
-    def enhance_products_file(self, input_file: str, output_file: str = None, batch_size: int = 10):
+    def enhance_products_file(self, input_file: str, output_file: str = None, follow: bool = False):
         """
-        Główna funkcja - wczytuje JSON, dodaje keywords, zapisuje
+        Główna funkcja - strumieniowo czyta katalog (JSONL lub JSON), dodaje adnotacje LLM, zapisuje.
+        Z `follow=True` czyta plik, który poprzedni etap wciąż zapisuje.
         """
         # Sprawdź czy plik wejściowy istnieje
-        if not Path(input_file).exists():
+        if not follow and not Path(input_file).exists():
             print(f"❌ Plik wejściowy nie istnieje: {input_file}")
             return None
         
-        # Wczytaj dane
+        if output_file is None:
+            output_file = input_file.replace('.json', '_enhanced.json')
+        
+        # Adnotacje z poprzedniego przebiegu - do LLM idą tylko nowe/zmienione produkty
+        previous = load_previous_results(output_file, ANNOTATION_FIELDS)
+        
+        # Otwórz dane
         try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            reader = CatalogReader(input_file, follow=follow)
         except Exception as e:
             print(f"❌ Błąd wczytywania pliku: {e}")
             return None
         
-        if 'products' not in data:
-            print("❌ Brak klucza 'products' w danych")
-            return None
-        
-        products = data['products']
-        total_products = len(products)
-        
-        if total_products == 0:
-            print("⚠️ Brak produktów do przetworzenia")
-            return input_file
+        print(f"🔄 Przetwarzanie nowych/zmienionych produktów "
+              f"(batche do {self.executor.max_batch_tokens} tokenów, {self.executor.max_concurrency} równolegle)...")
         
-        print(f"🔄 Przetwarzanie {total_products} produktów w batchach po {batch_size}...")
-        
-        # Przetwarzaj w batchach
+        total_products = 0
+        carried = 0
         processed = 0
-        for i in range(0, total_products, batch_size):
-            batch = products[i:i+batch_size]
-            batch_num = i//batch_size + 1
-            batch_end = min(i+batch_size, total_products)
-            
-            print(f"📦 Batch {batch_num}: produkty {i+1}-{batch_end}")
-            
-            # Pobierz keywords dla batcha
-            keywords_list = self.get_keywords_batch(batch)
-            
-            # Dodaj keywords do produktów
-            for j, keywords in enumerate(keywords_list):
-                if i+j < len(products):
-                    products[i+j]['english_keywords'] = keywords
-                    processed += 1
-            
-            print(f"   ✅ Przetworzono {len(keywords_list)} produktów")
-            
-            # Krótka pauza żeby nie spamować API
-            if i + batch_size < total_products:  # Nie czekaj po ostatnim batchu
-                time.sleep(1)
-        
-        # Zapisz wynik
-        if output_file is None:
-            output_file = input_file.replace('.json', '_enhanced.json')
-        
+        failed = 0
+        local_removed = 0
+        local_kept = 0
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with CatalogWriter(output_file, reader.header) as writer:
+                def llm_candidates():
+                    """Zapisuje od razu produkty z poprzedniego przebiegu, cache i oczywiste do usunięcia, resztę przekazuje do LLM"""
+                    nonlocal total_products, carried, local_removed, local_kept
+                    for product in reader:
+                        total_products += 1
+                        if carry_over(product, previous.get(product_key(product)), ANNOTATION_FIELDS):
+                            carried += 1
+                            writer.write(product)
+                            continue
+                        
+                        # Oczywiste przypadki rozstrzyga lokalny słownik - produkt do usunięcia nie potrzebuje opisu
+                        local_remove = self.prefilter.classify(product) if self.prefilter else None
+                        if local_remove:
+                            local_removed += 1
+                            product['keep'] = False
+                            writer.write(product)
+                            continue
+                        if local_remove is False:
+                            local_kept += 1
+                        
+                        # Do LLM trafiają tylko produkty, których nie ma w cache
+                        cached = self.cache.get(product['name'])
+                        if cached is not None:
+                            product.update(cached)
+                            if local_remove is False:
+                                product['keep'] = True
+                            writer.write(product)
+                            continue
+                        
+                        if local_remove is False:
+                            product['keep'] = True
+                        yield product
+                
+                for product, annotation in self.executor.run(llm_candidates(), self.annotate_batch, self.product_cost):
+                    local_keep = product.get('keep') is True
+                    if annotation is None:
+                        # Fallback - puste słowa kluczowe i brak decyzji keep, o ile nie dał jej słownik (rozstrzygnie filtr),
+                        # kolejny przebieg spróbuje ponownie
+                        failed += 1
+                        product['english_keywords'] = []
+                    else:
+                        processed += 1
+                        self.cache.put(product['name'], annotation)
+                        product.update(annotation)
+                        if local_keep:
+                            product['keep'] = True
+                    writer.write(product)
+                
+                if total_products == 0:
+                    print("⚠️ Brak produktów do przetworzenia")
+                    writer.abort()
+                    return input_file
+                
+                writer.close({
+                    **(reader.footer or {}),
+                    'total_products': total_products,
+                    'enhance_info': {
+                        'enhanced_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'prompt_version': ANNOTATION_PROMPT_VERSION,
+                        'fields': list(ANNOTATION_FIELDS),
+                        'processed_count': processed,
+                        'failed_count': failed,
+                        'carried_over_count': carried,
+                        'local_removed_count': local_removed,
+                        'local_kept_count': local_kept,
+                        'cache_hits': self.cache.hits,
+                        'cache_misses': self.cache.misses
+                    }
+                })
             
-            print(f"✅ Zapisano {processed} rozszerzonych produktów do: {output_file}")
+            print(f"♻️ Przeniesiono adnotacje dla {carried} produktów z poprzedniego przebiegu")
+            if self.prefilter:
+                print(f"⚡ Rozstrzygnięto lokalnie (słownik) {local_removed} do usunięcia bez LLM, "
+                      f"{local_kept} do zostawienia")
+            print(f"💾 Adnotacje z cache dla {self.cache.hits} produktów")
+            print(f"🤖 LLM: {self.executor.summary()}")
+            if shared_limiter() is not None:
+                print(f"🚦 Kolejka OpenAI: {limiter_summary(shared_limiter())}")
+            print(f"✅ Zapisano {total_products} produktów ({processed} przetworzonych przez LLM) do: {output_file}")
             return output_file
             
         except Exception as e:
-            print(f"❌ Błąd zapisu pliku: {e}")
+            print(f"❌ Błąd przetwarzania lub zapisu pliku: {e}")
             return None
+        finally:
+            # Wyniki LLM zapisujemy nawet gdy zapis katalogu się nie powiódł
+            self.cache.save()
 
 def main():
     """Główna funkcja uruchamiająca enhancement"""
@@ -149,38 +287,60 @@ def main():
         sys.exit(1)
     
     # Ścieżki plików
-    input_file = "/shared/biedronka_offers.json"
-    output_file = "/shared/biedronka_offers_enhanced.json"
+    input_file = os.getenv('ENHANCER_INPUT_FILE', "/shared/biedronka_offers.jsonl")
+    output_file = os.getenv('ENHANCER_OUTPUT_FILE', "/shared/biedronka_offers_enhanced.jsonl")
+    follow = os.getenv('STREAM_INPUT', '0') == '1'
+    cache_file = os.getenv('ANNOTATION_CACHE_FILE', "/shared/cache/product_annotations.json")
+    
+    # Lokalny pre-klasyfikator przed adnotacją (FILTER_PREFILTER=0 wyłącza, PREFILTER_LEXICON - własny słownik JSON)
+    prefilter = None
+    if os.getenv('FILTER_PREFILTER', '1') == '1':
+        prefilter = LexiconClassifier.from_file(os.getenv('PREFILTER_LEXICON'))
     
     # Sprawdź czy plik wejściowy istnieje
-    if not Path(input_file).exists():
+    if not follow and not Path(input_file).exists():
         print(f"❌ Plik wejściowy nie istnieje: {input_file}")
         sys.exit(1)
     
     # Utwórz enhancer i uruchom
     try:
-        enhancer = ProductKeywordsEnhancer(api_key)
+        enhancer = ProductAnnotator(
+            api_key,
+            cache_file=cache_file,
+            executor=executor_from_env('ENHANCER', default_batch_tokens=1600, max_batch_items=20),
+            prefilter=prefilter
+        )
         result = enhancer.enhance_products_file(
             input_file=input_file,
             output_file=output_file,
-            batch_size=8  # Mniejsze batche = mniej błędów API
+            follow=follow
         )
         
         if result:
             print("🎉 Enhancement zakończony pomyślnie!")
             
-            # Pokaż przykład rezultatu
-            with open(result, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Statystyki i kilka przykładów - bez wczytywania całego pliku
+            total_count = 0
+            enhanced_count = 0
+            removed_count = 0
+            examples = []
+            for product in CatalogReader(result):
+                total_count += 1
+                if product.get('english_keywords'):
+                    enhanced_count += 1
+                    if len(examples) < 3:
+                        examples.append(product)
+                if product.get('keep') is False:
+                    removed_count += 1
+            print(f"📊 Statystyki: {enhanced_count}/{total_count} produktów ma adnotacje, "
+                  f"{removed_count} oznaczonych do usunięcia")
             
-            enhanced_count = sum(1 for p in data['products'] if 'english_keywords' in p and p['english_keywords'])
-            print(f"📊 Statystyki: {enhanced_count}/{len(data['products'])} produktów ma keywords")
-            
-            # Pokaż kilka przykładów
             print("\n🎯 PRZYKŁADY REZULTATÓW:")
-            examples = [p for p in data['products'] if 'english_keywords' in p and p['english_keywords']][:3]
             for product in examples:
-                print(f"• {product['name']} → {', '.join(product['english_keywords'])}")
+                print(f"• {product['name']} → {product['translated_name']} [{product['category']}] "
+                      f"{', '.join(product['english_keywords'])}")
+            
+            print(f"\n💾 Cache adnotacji: {enhancer.cache.summary()}")
         else:
             print("❌ Enhancement nie powiódł się")
             sys.exit(1)
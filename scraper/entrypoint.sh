@@ -1 +1 @@
-python -u main.py && python -u enhancer.py && python -u filter.py
+python -u pipeline.py --once
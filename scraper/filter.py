@@ -1,17 +1,26 @@
 import json
 import openai
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Set, Optional
 import time
 from pathlib import Path
 import os
 import sys
+from catalog_diff import product_key, carry_over
+from catalog_io import CatalogReader, CatalogWriter
+from llm_batch import LLMBatchExecutor, BatchFailed, estimate_tokens, executor_from_env, limiter_summary
+from openai_limiter import limited_http_client, shared_limiter
+from prefilter import LexiconClassifier
 
 class ProductFilter:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, executor: LLMBatchExecutor = None, prefilter: Optional[LexiconClassifier] = None):
         """
-        Agent LLM do filtrowania produktów dla meal plannera
+        Agent LLM do filtrowania produktów dla meal plannera.
+        `prefilter` rozstrzyga lokalnie oczywiste przypadki - do LLM trafiają tylko niepewne.
         """
-        self.client = openai.OpenAI(api_key=api_key)
+        # Ponowienia (z Retry-After) obsługuje LLMBatchExecutor, nie klient; limit klucza wspólny z backendem
+        self.client = openai.OpenAI(api_key=api_key, max_retries=0, http_client=limited_http_client(shared_limiter(), 'batch'))
+        self.executor = executor or LLMBatchExecutor(max_batch_tokens=1500, max_batch_items=40)
+        self.prefilter = prefilter
         
     def create_filter_prompt(self, product_details_batch: List[Dict[str, Any]]) -> str:
         """
@@ -62,197 +71,218 @@ Respond ONLY with JSON, without any additional comments or explanations. Ensure
     def get_products_to_remove(self, product_details_batch: List[Dict[str, Any]]) -> Set[int]:
         """
         Pobiera listę 1-based indeksów produktów do usunięcia dla danego batcha.
-        Zwraca set indeksów.
+        Zwraca set indeksów. Błędy API są propagowane (ponawia je LLMBatchExecutor),
+        a niepoprawny JSON zgłaszany jako BatchFailed.
         """
         if not product_details_batch:
             return set()
             
         prompt = self.create_filter_prompt(product_details_batch)
         
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert shopping list reviewer. Your task is to reduce the shopping list by removing items not used for cooking meals. You ONLY respond in JSON format. Ensure the output is a valid JSON object with the key 'to_remove' containing a list of numbers."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.05,
-                max_tokens=1500,
-                response_format={"type": "json_object"}
-            )
-            
-            result_content = response.choices[0].message.content
-            # Czasem LLM może zwrócić JSON w bloku markdown, usuwamy go
-            if result_content.startswith("```json"):
-                result_content = result_content.strip("```json").strip("```").strip()
+        response = self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "You are an expert shopping list reviewer. Your task is to reduce the shopping list by removing items not used for cooking meals. You ONLY respond in JSON format. Ensure the output is a valid JSON object with the key 'to_remove' containing a list of numbers."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.05,
+            max_tokens=1500,
+            response_format={"type": "json_object"}
+        )
+        
+        result_content = response.choices[0].message.content
+        # Czasem LLM może zwrócić JSON w bloku markdown, usuwamy go
+        if result_content.startswith("```json"):
+            result_content = result_content.strip("```json").strip("```").strip()
 
+        try:
             result = json.loads(result_content)
             indices_to_remove = set(result.get("to_remove", []))
-            
-            # Walidacja indeksów (czy są w zakresie batcha)
-            valid_indices = set()
-            max_index_in_batch = len(product_details_batch)
-            for idx in indices_to_remove:
-                if 1 <= idx <= max_index_in_batch:
-                    valid_indices.add(idx)
-                else:
-                    print(f"⚠️ Ostrzeżenie: LLM zwrócił niepoprawny indeks {idx} dla batcha o rozmiarze {max_index_in_batch}. Indeks zignorowany.")
-            return valid_indices
-            
-        except json.JSONDecodeError as e:
+        except (ValueError, AttributeError, TypeError) as e:
             print(f"❌ Błąd dekodowania JSON od API: {e}")
-            print(f"   Otrzymana odpowiedź: {response.choices[0].message.content if response and response.choices else 'Brak odpowiedzi'}")
-            return set()
-        except Exception as e:
-            print(f"❌ Błąd API OpenAI: {e}")
-            return set()
+            print(f"   Otrzymana odpowiedź: {result_content}")
+            raise BatchFailed(str(e))
+        
+        # Walidacja indeksów (czy są w zakresie batcha)
+        valid_indices = set()
+        max_index_in_batch = len(product_details_batch)
+        for idx in indices_to_remove:
+            if isinstance(idx, int) and 1 <= idx <= max_index_in_batch:
+                valid_indices.add(idx)
+            else:
+                print(f"⚠️ Ostrzeżenie: LLM zwrócił niepoprawny indeks {idx} dla batcha o rozmiarze {max_index_in_batch}. Indeks zignorowany.")
+        return valid_indices
     
-    def filter_products_file(self, input_file: str, output_file: str = None, batch_size: int = 40):
+    def load_previous_decisions(self, output_file) -> Dict[str, Dict[str, Any]]:
         """
-        Główna funkcja - wczytuje JSON, filtruje produkty, zapisuje
+        Odtwarza decyzje poprzedniego przebiegu z pliku wynikowego:
+        produkty w pliku zostały zachowane, a `filter_info.removed_products` usunięte.
+        Zwraca słownik klucz produktu -> {'name', 'filter_remove'}.
         """
-        if not Path(input_file).exists():
+        if not Path(output_file).exists():
+            return {}
+        
+        decisions = {}
+        try:
+            reader = CatalogReader(output_file)
+            for product in reader:
+                decisions[product_key(product)] = {'name': product.get('name'), 'filter_remove': False}
+        except (OSError, ValueError):
+            return {}
+        
+        for entry in (reader.footer or {}).get('filter_info', {}).get('removed_products', []):
+            decisions[entry['key']] = {'name': entry.get('name'), 'filter_remove': True}
+        
+        return decisions
+    
+    def filter_batch(self, batch: List[Dict[str, Any]]) -> List[bool]:
+        """Pyta LLM o jeden batch produktów i zwraca decyzję (True = usuń) dla każdego produktu"""
+        # Przygotuj listę szczegółów produktów (nazwa + słowa kluczowe)
+        product_details_batch = [
+            {'name': p.get('name', 'Brak nazwy'), 'keywords': p.get('english_keywords', [])}
+            for p in batch
+        ]
+        
+        # LLM zwraca indeksy 1-based dla przekazanego batcha
+        indices_1_based_from_llm = self.get_products_to_remove(product_details_batch)
+        return [idx in indices_1_based_from_llm for idx in range(1, len(batch) + 1)]
+    
+    def product_cost(self, product: Dict[str, Any]) -> int:
+        """Szacowany koszt produktu w tokenach (linia promptu z nazwą i keywords + indeks w odpowiedzi)"""
+        keywords = ', '.join(product.get('english_keywords', []))
+        return estimate_tokens(f"{product.get('name', '')} (Keywords: {keywords})") + 5
+    
+    def filter_products_file(self, input_file: str, output_file: str = None, follow: bool = False):
+        """
+        Główna funkcja - strumieniowo czyta katalog (JSONL lub JSON), filtruje produkty, zapisuje.
+        Z `follow=True` czyta plik, który poprzedni etap wciąż zapisuje.
+        """
+        if not follow and not Path(input_file).exists():
             print(f"❌ Plik wejściowy nie istnieje: {input_file}")
             return None
         
+        if output_file is None:
+            input_path = Path(input_file)
+            output_file = input_path.parent / f"{input_path.stem}_filtered{input_path.suffix}"
+        
+        # Decyzje z poprzedniego przebiegu - do LLM trafiają tylko nowe/zmienione produkty
+        previous_decisions = self.load_previous_decisions(output_file)
+        
         try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            reader = CatalogReader(input_file, follow=follow)
         except Exception as e:
             print(f"❌ Błąd wczytywania pliku: {e}")
             return None
         
-        if 'products' not in data or not isinstance(data['products'], list):
-            print("❌ Brak klucza 'products' w danych lub nie jest listą.")
-            return None
-        
-        all_products_original = data['products']
-        total_products_original_count = len(all_products_original)
-        
-        if total_products_original_count == 0:
-            print("⚠️ Brak produktów do przetworzenia.")
-            # Zapisz plik z aktualizacją statystyk, nawet jeśli jest pusty
-            data['total_products'] = 0
-            if 'filter_info' not in data:
-                data['filter_info'] = {}
-            data['filter_info'].update({
-                'filtered_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
-                'original_count': 0,
-                'filtered_count': 0,
-                'removed_count': 0,
-                'batch_size_used': batch_size
-            })
-            if output_file is None:
-                output_file = input_file.replace('.json', '_filtered.json')
-            try:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                print(f"✅ Zapisano pusty plik wynikowy do: {output_file}")
-            except Exception as e:
-                print(f"❌ Błąd zapisu pustego pliku wynikowego: {e}")
-            return output_file
-
-        print(f"🔍 Analizowanie {total_products_original_count} produktów do filtrowania...")
-        
-        # Przygotuj listę szczegółów produktów (nazwa + słowa kluczowe)
-        product_details_list = [
-            {'name': p.get('name', 'Brak nazwy'), 'keywords': p.get('english_keywords', [])} 
-            for p in all_products_original
-        ]
+        print(f"🔍 Filtrowanie produktów (batche do {self.executor.max_batch_tokens} tokenów, "
+              f"{self.executor.max_concurrency} równolegle)...")
         
-        all_indices_to_remove_0_based = set()
+        total_products_original_count = 0
+        removed_products = []
+        llm_processed_count = 0
+        failed_count = 0
+        annotated_count = 0
+        local_count = 0
         
-        if total_products_original_count <= batch_size:
-            print(f"📦 Przetwarzanie wszystkich {total_products_original_count} produktów naraz...")
-            # LLM zwraca indeksy 1-based dla przekazanego batcha
-            indices_1_based_from_llm = self.get_products_to_remove(product_details_list)
-            # Konwersja na 0-based
-            all_indices_to_remove_0_based = {idx - 1 for idx in indices_1_based_from_llm}
-            print(f" 🗑️ Do usunięcia (z tego batcha): {len(all_indices_to_remove_0_based)} produktów")
-        else:
-            print(f"📦 Przetwarzanie w batchach po {batch_size} produktów...")
-            for i in range(0, total_products_original_count, batch_size):
-                batch_start_idx_0_based = i
-                batch_end_idx_0_based = min(i + batch_size, total_products_original_count)
-                
-                current_batch_details = product_details_list[batch_start_idx_0_based:batch_end_idx_0_based]
-                batch_num = batch_start_idx_0_based // batch_size + 1
-                
-                print(f"📦 Batch {batch_num}: produkty {batch_start_idx_0_based + 1}-{batch_end_idx_0_based}")
+        try:
+            with CatalogWriter(output_file, reader.header) as writer:
+                def llm_candidates():
+                    """Rozstrzyga od razu produkty z decyzją enhancera lub poprzedniego przebiegu, resztę przekazuje do LLM"""
+                    nonlocal total_products_original_count, annotated_count, local_count
+                    for product in reader:
+                        total_products_original_count += 1
+                        # Decyzja keep/remove z przebiegu adnotacji enhancera - bez dodatkowego zapytania
+                        if isinstance(product.get('keep'), bool):
+                            annotated_count += 1
+                            if product['keep']:
+                                writer.write(product)
+                            else:
+                                removed_products.append(product)
+                            continue
+                        if carry_over(product, previous_decisions.get(product_key(product)), ['filter_remove']):
+                            if product.pop('filter_remove'):
+                                removed_products.append(product)
+                            else:
+                                writer.write(product)
+                            continue
+                        
+                        # Oczywiste przypadki rozstrzyga lokalny słownik
+                        local_remove = self.prefilter.classify(product) if self.prefilter else None
+                        if local_remove is not None:
+                            local_count += 1
+                            if local_remove:
+                                removed_products.append(product)
+                            else:
+                                writer.write(product)
+                            continue
+                        yield product
                 
-                # LLM zwraca indeksy 1-based dla bieżącego batcha
-                batch_indices_1_based_from_llm = self.get_products_to_remove(current_batch_details)
+                for product, remove in self.executor.run(llm_candidates(), self.filter_batch, self.product_cost):
+                    if remove is None:
+                        # Brak decyzji mimo ponowień - zostawiamy produkt (lepiej za dużo niż za mało)
+                        failed_count += 1
+                    else:
+                        llm_processed_count += 1
+                    if remove:
+                        removed_products.append(product)
+                    else:
+                        writer.write(product)
                 
-                # Konwersja na globalne indeksy 0-based
-                # idx_1_based_in_batch odnosi się do pozycji w `current_batch_details`
-                # (idx_1_based_in_batch - 1) daje 0-based indeks w `current_batch_details`
-                # dodanie `batch_start_idx_0_based` mapuje go na globalny 0-based indeks
-                global_indices_for_this_batch_0_based = {
-                    (idx_1_based_in_batch - 1) + batch_start_idx_0_based 
-                    for idx_1_based_in_batch in batch_indices_1_based_from_llm
-                }
+                carried_count = (total_products_original_count - annotated_count - local_count
+                                 - llm_processed_count - failed_count)
+                print(f"🏷️ Decyzje z adnotacji enhancera dla {annotated_count} produktów")
+                print(f"⚡ Rozstrzygnięto lokalnie (słownik) {local_count} produktów")
+                print(f"♻️ Przeniesiono decyzje dla {carried_count} produktów z poprzedniego przebiegu")
+                print(f"🤖 LLM: {self.executor.summary()}")
+                if shared_limiter() is not None:
+                    print(f"🚦 Kolejka OpenAI: {limiter_summary(shared_limiter())}")
                 
-                all_indices_to_remove_0_based.update(global_indices_for_this_batch_0_based)
+                if total_products_original_count == 0:
+                    print("⚠️ Brak produktów do przetworzenia.")
                 
-                print(f"  🗑️ Do usunięcia (z tego batcha): {len(batch_indices_1_based_from_llm)} produktów")
-                print(f"  🗑️ Sumarycznie do usunięcia: {len(all_indices_to_remove_0_based)} produktów")
+                # Pokaż produkty do usunięcia
+                if removed_products:
+                    print(f"\n🗑️ PRODUKTY DO USUNIĘCIA ({len(removed_products)}):")
+                    for product in removed_products[:15]: # Pokaż maksymalnie 15
+                        print(f"  • {product.get('name', 'Brak nazwy')}")
+                    if len(removed_products) > 15:
+                        print(f"  ... i {len(removed_products) - 15} więcej.")
+                else:
+                    print("\n👍 Żadne produkty nie zostały oznaczone do usunięcia przez LLM.")
                 
-                if batch_end_idx_0_based < total_products_original_count:
-                    time.sleep(1) # Krótka pauza między batchami, aby nie przeciążać API
-        
-        # Pokaż produkty do usunięcia (na podstawie globalnych indeksów 0-based)
-        products_marked_for_removal_names = []
-        for idx_0_based in sorted(list(all_indices_to_remove_0_based)):
-            if 0 <= idx_0_based < total_products_original_count:
-                products_marked_for_removal_names.append(all_products_original[idx_0_based].get('name', 'Brak nazwy'))
-        
-        if products_marked_for_removal_names:
-            print(f"\n🗑️ PRODUKTY DO USUNIĘCIA ({len(products_marked_for_removal_names)}):")
-            for name in products_marked_for_removal_names[:15]: # Pokaż maksymalnie 15
-                print(f"  • {name}")
-            if len(products_marked_for_removal_names) > 15:
-                print(f"  ... i {len(products_marked_for_removal_names) - 15} więcej.")
-        else:
-            print("\n👍 Żadne produkty nie zostały oznaczone do usunięcia przez LLM.")
-            
-        # Utwórz listę przefiltrowanych produktów
-        filtered_products = [
-            product for i, product in enumerate(all_products_original) 
-            if i not in all_indices_to_remove_0_based
-        ]
-        
-        data['products'] = filtered_products
-        data['total_products'] = len(filtered_products)
-        
-        if 'filter_info' not in data:
-            data['filter_info'] = {}
-        
-        data['filter_info'].update({
-            'filtered_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
-            'original_count': total_products_original_count,
-            'filtered_count': len(filtered_products),
-            'removed_count': len(all_indices_to_remove_0_based), # Używamy len zbioru indeksów
-            'batch_size_used': batch_size
-        })
-        
-        if output_file is None:
-            input_path = Path(input_file)
-            output_file = input_path.parent / f"{input_path.stem}_filtered{input_path.suffix}"
-        
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+                footer = dict(reader.footer or {})
+                filter_info = dict(footer.get('filter_info', {}))
+                filter_info.update({
+                    'filtered_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'original_count': total_products_original_count,
+                    'filtered_count': writer.count,
+                    'removed_count': len(removed_products),
+                    'batch_tokens_used': self.executor.max_batch_tokens,
+                    'llm_processed_count': llm_processed_count,
+                    'llm_failed_count': failed_count,
+                    'annotated_count': annotated_count,
+                    'local_decisions_count': local_count,
+                    'carried_over_count': carried_count,
+                    # Usunięte produkty zapamiętujemy, żeby kolejny przebieg mógł przenieść decyzje
+                    'removed_products': [
+                        {'key': product_key(product), 'name': product.get('name')}
+                        for product in removed_products
+                    ]
+                })
+                footer.update({'total_products': writer.count, 'filter_info': filter_info})
+                filtered_count = writer.count
+                writer.close(footer)
             
             print(f"\n✅ Przefiltrowano produkty:")
             print(f"  📊 Oryginalnie: {total_products_original_count} produktów")
-            print(f"  ✂️ Usunięto: {len(all_indices_to_remove_0_based)} produktów")
-            print(f"  📝 Pozostało: {len(filtered_products)} produktów")
+            print(f"  ✂️ Usunięto: {len(removed_products)} produktów")
+            print(f"  📝 Pozostało: {filtered_count} produktów")
             print(f"  💾 Zapisano do: {output_file}")
             
             return str(output_file)
             
         except Exception as e:
-            print(f"❌ Błąd zapisu pliku: {e}")
+            print(f"❌ Błąd przetwarzania lub zapisu pliku: {e}")
             return None
 
 def main():
@@ -264,27 +294,29 @@ def main():
         sys.exit(1)
     
     base_path = Path(__file__).parent 
-    input_file_path = os.getenv('FILTER_INPUT_FILE', "/shared/biedronka_offers_enhanced.json")
-    output_file_path = os.getenv('FILTER_OUTPUT_FILE', "/shared/biedronka_offers_filtered.json")
+    input_file_path = os.getenv('FILTER_INPUT_FILE', "/shared/biedronka_offers_enhanced.jsonl")
+    output_file_path = os.getenv('FILTER_OUTPUT_FILE', "/shared/biedronka_offers_filtered.jsonl")
+    follow = os.getenv('STREAM_INPUT', '0') == '1'
     
-    # Konfiguracja batch size
-    try:
-        batch_size = int(os.getenv('FILTER_BATCH_SIZE', 40))
-    except ValueError:
-        print("⚠️ Niepoprawna wartość dla FILTER_BATCH_SIZE. Używam domyślnej: 40.")
-        batch_size = 40
+    # Konfiguracja batchy (FILTER_BATCH_TOKENS, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES)
+    executor = executor_from_env('FILTER', default_batch_tokens=1500, max_batch_items=40)
+    
+    # Lokalny pre-klasyfikator (FILTER_PREFILTER=0 wyłącza, PREFILTER_LEXICON - własny słownik JSON)
+    prefilter = None
+    if os.getenv('FILTER_PREFILTER', '1') == '1':
+        prefilter = LexiconClassifier.from_file(os.getenv('PREFILTER_LEXICON'))
 
-    if not Path(input_file_path).exists():
+    if not follow and not Path(input_file_path).exists():
         print(f"❌ Plik wejściowy nie istnieje: {input_file_path}")
-        print("💡 Upewnij się, że plik 'biedronka_offers_enhanced.json' (lub inny podany) istnieje, np. po uruchomieniu skryptu 'enhancer.py'.")
+        print("💡 Upewnij się, że plik 'biedronka_offers_enhanced.jsonl' (lub inny podany) istnieje, np. po uruchomieniu skryptu 'enhancer.py'.")
         sys.exit(1)
     
     try:
-        filter_agent = ProductFilter(api_key=api_key)
+        filter_agent = ProductFilter(api_key=api_key, executor=executor, prefilter=prefilter)
         result_file = filter_agent.filter_products_file(
             input_file=str(input_file_path),
             output_file=str(output_file_path),
-            batch_size=batch_size
+            follow=follow
         )
         
         if result_file:
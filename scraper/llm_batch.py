@@ -0,0 +1,227 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Błędy, których ponawianie nic nie da (zły request, klucz, model)
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+class BatchFailed(Exception):
+    """Odpowiedź LLM nie dała się sparsować - cały batch trzeba ponowić"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Zgrubne oszacowanie liczby tokenów (~4 znaki na token) - bez zależności od tiktoken"""
+    return len(text) // 4 + 1
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Czyta Retry-After (lub retry-after-ms od OpenAI) z odpowiedzi błędu API"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    retry_ms = headers.get('retry-after-ms')
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def status_code(error: Exception) -> Optional[int]:
+    return getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+class LLMBatchExecutor:
+    """
+    Wspólny wykonawca zapytań batchowych do LLM dla etapów pipeline'u.
+
+    - batche są budowane wg szacowanej liczby tokenów (a nie stałej liczby produktów),
+    - do `max_concurrency` batchy jest w locie jednocześnie,
+    - po 429 wszystkie wątki wstrzymują się na czas z Retry-After, a inne błędy
+      są ponawiane z wykładniczym backoffem (z jitterem),
+    - ponawiane są tylko elementy, dla których nie ma wyniku - funkcja batcha
+      zwraca listę wyników z None dla elementów, których odpowiedź nie objęła.
+
+    `run` jest generatorem (element, wynik) w kolejności kończenia batchy;
+    wynik None oznacza, że element nie powiódł się mimo ponowień.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_batch_tokens: int = 1500, max_batch_items: int = 40,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'failed_items': 0}
+
+    def make_batches(self, items: Iterable[T], cost: Callable[[T], int]) -> Iterator[List[T]]:
+        """Pakuje strumień elementów w batche mieszczące się w budżecie tokenów"""
+        batch, batch_tokens = [], 0
+        for item in items:
+            item_tokens = cost(item)
+            if batch and (batch_tokens + item_tokens > self.max_batch_tokens
+                          or len(batch) >= self.max_batch_items):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(item)
+            batch_tokens += item_tokens
+        if batch:
+            yield batch
+
+    def backoff_delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _call(self, process_batch: Callable[[List[T]], List[Optional[R]]], batch: List[T]) -> List[Optional[R]]:
+        with self._lock:
+            self.stats['requests'] += 1
+        results = list(process_batch(batch))
+        # Krótsza odpowiedź = brakujące elementy do ponowienia
+        return (results + [None] * len(batch))[:len(batch)]
+
+    def run(self, items: Iterable[T], process_batch: Callable[[List[T]], List[Optional[R]]],
+            cost: Callable[[T], int] = lambda item: 1) -> Iterator[Tuple[T, Optional[R]]]:
+        source = self.make_batches(items, cost)
+        source_done = False
+        retry_queue: Deque[Tuple[float, int, List[T]]] = deque()  # (gotowe_od, próba, batch)
+        in_flight: Dict = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            while True:
+                # Uzupełnij batche w locie - najpierw gotowe ponowienia, potem nowe
+                now = time.monotonic()
+                while len(in_flight) < self.max_concurrency and now >= self._pause_until:
+                    job = None
+                    for entry in retry_queue:
+                        if entry[0] <= now:
+                            job = entry
+                            retry_queue.remove(entry)
+                            break
+                    if job is None and not source_done:
+                        batch = next(source, None)
+                        if batch is None:
+                            source_done = True
+                        else:
+                            job = (now, 0, batch)
+                    if job is None:
+                        break
+                    _, attempt, batch = job
+                    in_flight[pool.submit(self._call, process_batch, batch)] = (attempt, batch)
+
+                if not in_flight:
+                    if source_done and not retry_queue:
+                        return
+                    # Czekamy na najbliższe ponowienie albo koniec pauzy po 429
+                    wake_at = max(self._pause_until, min(entry[0] for entry in retry_queue)) \
+                        if retry_queue else self._pause_until
+                    time.sleep(max(0.0, wake_at - time.monotonic()))
+                    continue
+
+                # Przy wolnych slotach budzimy się też na najbliższe ponowienie / koniec pauzy
+                timeout = None
+                if len(in_flight) < self.max_concurrency:
+                    ready_times = [entry[0] for entry in retry_queue]
+                    if not source_done:
+                        ready_times.append(now)
+                    if ready_times:
+                        timeout = max(0.0, max(min(ready_times), self._pause_until) - time.monotonic())
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    attempt, batch = in_flight.pop(future)
+                    failed = []
+                    # Brakujące elementy odpowiedzi ponawiamy od razu, błędy API - z backoffem
+                    delay = 0.0
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        code = status_code(e)
+                        if code in NON_RETRYABLE_STATUS:
+                            print(f"❌ Błąd API ({code}) - bez ponawiania: {e}")
+                            attempt = self.max_retries
+                        elif code == 429:
+                            delay = retry_after_seconds(e) or self.backoff_delay(attempt)
+                            with self._lock:
+                                self.stats['rate_limited'] += 1
+                                self._pause_until = max(self._pause_until, time.monotonic() + delay)
+                            print(f"⏳ Limit zapytań (429) - wstrzymuję wysyłkę na {delay:.1f}s")
+                        else:
+                            print(f"⚠️ Błąd batcha ({len(batch)} elementów, próba {attempt + 1}): {e}")
+                            delay = self.backoff_delay(attempt)
+                        failed = list(batch)
+                    else:
+                        for item, result in zip(batch, results):
+                            if result is None:
+                                failed.append(item)
+                            else:
+                                yield item, result
+
+                    if not failed:
+                        continue
+                    if attempt + 1 > self.max_retries:
+                        self.stats['failed_items'] += len(failed)
+                        for item in failed:
+                            yield item, None
+                        continue
+                    self.stats['retries'] += 1
+                    retry_queue.append((time.monotonic() + delay, attempt + 1, failed))
+
+    def summary(self) -> str:
+        return (f"zapytania: {self.stats['requests']}, ponowienia: {self.stats['retries']}, "
+                f"429: {self.stats['rate_limited']}, nieudane elementy: {self.stats['failed_items']}")
+
+
+def executor_from_env(prefix: str, default_batch_tokens: int, max_batch_items: int) -> LLMBatchExecutor:
+    """
+    Tworzy wykonawcę z konfiguracją ze zmiennych środowiskowych:
+    LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES i <PREFIX>_BATCH_TOKENS
+    """
+    def int_env(name: str, default: int) -> int:
+        try:
+            return int(os.getenv(name, default))
+        except ValueError:
+            print(f"⚠️ Niepoprawna wartość dla {name}. Używam domyślnej: {default}.")
+            return default
+
+    return LLMBatchExecutor(
+        max_concurrency=int_env('LLM_MAX_CONCURRENCY', 4),
+        max_batch_tokens=int_env(f'{prefix}_BATCH_TOKENS', default_batch_tokens),
+        max_batch_items=max_batch_items,
+        max_retries=int_env('LLM_MAX_RETRIES', 5),
+    )
+
+
+def limiter_summary(limiter) -> str:
+    """Czas oczekiwania w kolejce OpenAI per priorytet (z `metrics()` limitera z openai_limiter.py)"""
+    parts = []
+    for name, stats in limiter.metrics().items():
+        if stats['calls'] or stats['rejected']:
+            parts.append(f"{name}: {stats['calls']} zapytań, czekało {stats['waited']}, "
+                         f"p95 {stats['p95_wait_s']:.2f}s, max {stats['max_wait_s']:.2f}s, odrzucone {stats['rejected']}")
+    return "; ".join(parts) or "brak zapytań"
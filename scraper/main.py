@@ -1,14 +1,15 @@
 import requests
 from bs4 import BeautifulSoup
-import json
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Iterable
 from dataclasses import dataclass
 import time
 from urllib.parse import urljoin, urlparse
 import os
 import logging
 from datetime import datetime
+from catalog_diff import product_id_from_url, load_previous_results, DiffTracker, diff_summary, PRICE_FIELDS
+from catalog_io import CatalogWriter
 
 # Konfiguracja logowania
 logging.basicConfig(
@@ -27,6 +28,7 @@ class Product:
     promotion_type: Optional[str] = None
     product_url: Optional[str] = None
     image_url: Optional[str] = None
+    product_id: Optional[str] = None
 
 class BiedronkaScraper:
     def __init__(self):
@@ -203,19 +205,20 @@ class BiedronkaScraper:
             unit=price_info['unit'],
             promotion_type=price_info['promotion_type'],
             product_url=product_link['url'],
-            image_url=product_link['image_url']
+            image_url=product_link['image_url'],
+            product_id=product_id_from_url(product_link['url'])
         )
         
         return product
     
-    def scrape_offers(self, url: str, max_products: int = 20) -> List[Product]:
-        """Główna metoda do scrapowania ofert"""
+    def iter_offers(self, url: str, max_products: int = 20) -> Iterator[Product]:
+        """Generator produktów - kolejne etapy mogą zapisywać je zaraz po zescrapowaniu"""
         logger.info(f"Scrapowanie ofert z: {url}")
         
         # Pobiera stronę główną
         soup = self.fetch_page(url)
         if not soup:
-            return []
+            return
         
         # Wyciąga linki do produktów
         product_links = self.extract_product_links(soup)
@@ -226,54 +229,72 @@ class BiedronkaScraper:
             # Debug - pokazuje fragment HTML
             logger.debug("Pierwsze 1000 znaków HTML:")
             logger.debug(soup.prettify()[:1000])
-            return []
+            return
         
         # Ogranicza liczbę produktów do sprawdzenia
         products_to_check = product_links[:max_products]
         logger.info(f"Sprawdzanie szczegółów dla {len(products_to_check)} produktów...")
         
-        products = []
+        found = 0
         for i, product_link in enumerate(products_to_check, 1):
             logger.info(f"Sprawdzanie produktu {i}/{len(products_to_check)}: {product_link['name']}")
             
             product = self.scrape_product_details(product_link)
             if product:
-                products.append(product)
+                found += 1
+                yield product
             
             # Przerwa między requestami
-            time.sleep(1)
+            if i < len(products_to_check):
+                time.sleep(1)
         
-        logger.info(f"Pomyślnie wyciągnięto dane dla {len(products)} produktów")
-        return products
+        logger.info(f"Pomyślnie wyciągnięto dane dla {found} produktów")
     
-    def save_to_json(self, products: List[Product], filepath: str = "/shared/biedronka_offers.json"):
-        """Zapisuje produkty do pliku JSON"""
-        products_dict = []
-        for product in products:
-            products_dict.append({
-                'name': product.name,
-                'price': product.price,
-                'original_price': product.original_price,
-                'discount_info': product.discount_info,
-                'unit': product.unit,
-                'promotion_type': product.promotion_type,
-                'product_url': product.product_url,
-                'image_url': product.image_url,
-                'scraped_at': datetime.now().isoformat()
-            })
-        
-        # Tworzy katalog jeśli nie istnieje
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    def scrape_offers(self, url: str, max_products: int = 20) -> List[Product]:
+        """Główna metoda do scrapowania ofert"""
+        return list(self.iter_offers(url, max_products))
+    
+    def save_to_json(self, products: Iterable[Product], filepath: str = "/shared/biedronka_offers.jsonl",
+                     previous: Optional[Dict[str, Dict]] = None, store: str = "biedronka") -> Optional[Dict]:
+        """
+        Zapisuje produkty strumieniowo (JSONL, albo JSON dla ścieżek .json).
+        Nagłówek zawiera `store` - backend trzyma osobny katalog dla każdego sklepu/regionu.
+        Każdy produkt dostaje `diff_status` względem poprzedniego snapshotu,
+        a pełny diff trafia do stopki. Zwraca stopkę (statystyki i diff)
+        albo None gdy nie zapisano żadnego produktu.
+        """
+        tracker = DiffTracker(previous or {})
+        promo_count = 0
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump({
-                'scraped_at': datetime.now().isoformat(),
-                'total_products': len(products_dict),
-                'products': products_dict
-            }, f, ensure_ascii=False, indent=2)
+        with CatalogWriter(filepath, {'store': store, 'scraped_at': datetime.now().isoformat()}) as writer:
+            for product in products:
+                product_dict = {
+                    'product_id': product.product_id,
+                    'name': product.name,
+                    'price': product.price,
+                    'original_price': product.original_price,
+                    'discount_info': product.discount_info,
+                    'unit': product.unit,
+                    'promotion_type': product.promotion_type,
+                    'product_url': product.product_url,
+                    'image_url': product.image_url,
+                    'scraped_at': datetime.now().isoformat()
+                }
+                product_dict['diff_status'] = tracker.classify(product_dict)
+                writer.write(product_dict)
+                if product.promotion_type or product.discount_info:
+                    promo_count += 1
+            
+            if writer.count == 0:
+                # Nie nadpisujemy poprzedniego snapshotu pustym plikiem
+                writer.abort()
+                return None
+            
+            footer = {'total_products': writer.count, 'promo_products': promo_count, 'diff': tracker.result()}
+            writer.close(footer)
         
         logger.info(f"Dane zapisane do pliku: {filepath}")
-        return filepath
+        return footer
 
 def main():
     """Główna funkcja programu - dla Dockera"""
@@ -284,26 +305,28 @@ def main():
     # Konfiguracja z zmiennych środowiskowych
     url = os.getenv('SCRAPER_URL', "https://www.biedronka.pl/pl/oferta-z-karta-moja-biedronka")
     max_products = int(os.getenv('MAX_PRODUCTS', '20'))
-    output_file = os.getenv('OUTPUT_FILE', '/shared/biedronka_offers.json')
+    output_file = os.getenv('OUTPUT_FILE', '/shared/biedronka_offers.jsonl')
+    store = os.getenv('STORE', 'biedronka')
     
+    logger.info(f"Sklep: {store}")
     logger.info(f"URL: {url}")
     logger.info(f"Max produktów: {max_products}")
     logger.info(f"Plik wyjściowy: {output_file}")
     
     try:
-        # Scrapuje oferty
-        products = scraper.scrape_offers(url, max_products)
+        # Poprzedni snapshot - kolejne etapy przetwarzają tylko zmiany
+        previous = load_previous_results(output_file, PRICE_FIELDS)
         
-        if products:
-            # Zapisuje do JSON
-            saved_file = scraper.save_to_json(products, output_file)
-            
-            logger.info(f"SUKCES: Znaleziono {len(products)} produktów")
-            logger.info(f"Dane zapisane do: {saved_file}")
+        # Scrapuje oferty i zapisuje je na bieżąco
+        summary = scraper.save_to_json(scraper.iter_offers(url, max_products), output_file, previous, store)
+        
+        if summary is not None:
+            logger.info(f"SUKCES: Znaleziono {summary['total_products']} produktów")
+            logger.info(f"Dane zapisane do: {output_file}")
+            logger.info(f"Zmiany względem poprzedniego snapshotu: {diff_summary(summary['diff'])}")
             
             # Podsumowanie produktów z promocjami
-            promo_products = [p for p in products if p.promotion_type or p.discount_info]
-            logger.info(f"Produkty z promocjami: {len(promo_products)}")
+            logger.info(f"Produkty z promocjami: {summary['promo_products']}")
             
         else:
             logger.error("Nie udało się wyciągnąć żadnych produktów")
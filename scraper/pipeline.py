@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import schedule
+
+from catalog_io import content_hash, is_jsonl
+
+# Konfiguracja logowania
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Ile ostatnich przebiegów (z czasami etapów) trzymamy w pliku stanu
+RUN_HISTORY_LIMIT = 30
+
+# Nieudany przebieg sprzed mniej niż tylu godzin jest przy starcie wznawiany (bez ponownego scrapowania)
+RESUME_WINDOW_HOURS = 6
+
+
+@dataclass
+class Stage:
+    """
+    Etap pipeline'u uruchamiany jako osobny proces (`python -u <script>`).
+    Etap bez `inputs` (scraper - źródłem jest strona sklepu) uruchamia się zawsze,
+    pozostałe tylko gdy zmieniła się treść wejść, kod etapu albo brakuje wyjść.
+    """
+    name: str
+    script: str
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    deps: List[str] = field(default_factory=list)
+    env: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_source(self) -> bool:
+        return not self.inputs
+
+
+def file_hash(path) -> Optional[str]:
+    """Skrót treści pliku; katalogi (.json/.jsonl) bez metadanych zmiennych przy każdym przebiegu"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    if is_jsonl(path) or path.suffix == '.json':
+        try:
+            return content_hash(path)
+        except (OSError, ValueError):
+            pass
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def topological_order(stages: List[Stage]) -> List[Stage]:
+    """Kolejność etapów zgodna z zależnościami (DAG); cykl lub nieznana zależność to błąd konfiguracji"""
+    by_name = {stage.name: stage for stage in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage: Stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Cykl w zależnościach etapu {stage.name}")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Etap {stage.name} zależy od nieznanego etapu {dep}")
+            visit(by_name[dep])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+class PipelineRunner:
+    """
+    Uruchamia etapy w kolejności DAG i zapisuje w pliku stanu skróty wejść/wyjść,
+    status i czas trwania każdego etapu. Kolejny przebieg pomija etapy, których
+    wejścia się nie zmieniły (i wyjścia są na miejscu), a ponawia tylko nieudane.
+    """
+
+    def __init__(self, stages: List[Stage], state_file: str, max_attempts: int = 3,
+                 retry_delay: float = 30.0, workdir: Optional[str] = None):
+        self.stages = topological_order(stages)
+        self.state_file = Path(state_file)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.workdir = workdir or str(Path(__file__).parent)
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        if not self.state_file.exists():
+            return {'stages': {}, 'runs': []}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            state.setdefault('stages', {})
+            state.setdefault('runs', [])
+            return state
+        except (OSError, ValueError) as e:
+            logger.warning(f"Nie udało się wczytać stanu pipeline'u {self.state_file}: {e} - zaczynam od zera")
+            return {'stages': {}, 'runs': []}
+
+    def _save_state(self):
+        os.makedirs(self.state_file.parent, exist_ok=True)
+        tmp_path = self.state_file.with_suffix(self.state_file.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def input_hash(self, stage: Stage) -> str:
+        """Skrót wejść etapu: treść plików wejściowych, kod skryptu i konfiguracja środowiska"""
+        digest = hashlib.sha256()
+        for path in [*stage.inputs, str(Path(self.workdir) / stage.script)]:
+            digest.update(f"{path}={file_hash(path)}\n".encode('utf-8'))
+        for key in sorted(stage.env):
+            digest.update(f"{key}={stage.env[key]}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def output_hashes(self, stage: Stage) -> Dict[str, Optional[str]]:
+        return {path: file_hash(path) for path in stage.outputs}
+
+    def is_up_to_date(self, stage: Stage, input_hash: str, resume: bool = False) -> bool:
+        previous = self.state['stages'].get(stage.name)
+        if not previous or previous.get('status') != 'success':
+            return False
+        # Etap źródłowy powtarzamy w każdym przebiegu, chyba że wznawiamy nieudany
+        if stage.is_source and not resume:
+            return False
+        if previous.get('input_hash') != input_hash:
+            return False
+        # Wyjście usunięte lub zmienione ręcznie - etap trzeba powtórzyć
+        return previous.get('output_hashes') == self.output_hashes(stage)
+
+    def _execute(self, stage: Stage) -> subprocess.CompletedProcess:
+        env = {**os.environ, **stage.env}
+        return subprocess.run([sys.executable, '-u', stage.script], cwd=self.workdir, env=env)
+
+    def run_stage(self, stage: Stage, input_hash: str) -> Dict:
+        """Uruchamia etap z ponowieniami; zwraca wpis stanu etapu"""
+        started = time.monotonic()
+        entry = {'started_at': datetime.now().isoformat(), 'input_hash': input_hash}
+        for attempt in range(1, self.max_attempts + 1):
+            logger.info(f"▶️ Etap {stage.name} (próba {attempt}/{self.max_attempts})")
+            try:
+                result = self._execute(stage)
+                error = None if result.returncode == 0 else f"kod wyjścia {result.returncode}"
+            except OSError as e:
+                error = str(e)
+            if error is None:
+                entry.pop('error', None)
+                entry.update({'status': 'success', 'attempts': attempt, 'output_hashes': self.output_hashes(stage)})
+                break
+            logger.error(f"❌ Etap {stage.name} nie powiódł się: {error}")
+            entry.update({'status': 'failed', 'attempts': attempt, 'error': error})
+            if attempt < self.max_attempts:
+                time.sleep(self.retry_delay * attempt)
+        entry['duration_s'] = round(time.monotonic() - started, 2)
+        return entry
+
+    def should_resume(self, window_hours: float = RESUME_WINDOW_HOURS) -> bool:
+        """Czy ostatni przebieg był nieudany i na tyle świeży, żeby go tylko dokończyć"""
+        if not self.state['runs'] or self.state['runs'][-1].get('success'):
+            return False
+        started_at = datetime.fromisoformat(self.state['runs'][-1]['started_at'])
+        return (datetime.now() - started_at).total_seconds() < window_hours * 3600
+
+    def run(self, resume: bool = False) -> bool:
+        """
+        Jeden przebieg pipeline'u; zwraca True gdy żaden etap nie zakończył się błędem.
+        `resume` - wznowienie nieudanego przebiegu: ponawiane są tylko etapy nieudane lub nieaktualne.
+        """
+        run_started = time.monotonic()
+        run_info = {'started_at': datetime.now().isoformat(), 'resume': resume, 'stages': {}}
+        statuses: Dict[str, str] = {}
+
+        for stage in self.stages:
+            blocked_by = [dep for dep in stage.deps if statuses.get(dep) in ('failed', 'blocked')]
+            if blocked_by:
+                logger.warning(f"⏭️ Etap {stage.name} wstrzymany - nieudane zależności: {', '.join(blocked_by)}")
+                statuses[stage.name] = 'blocked'
+                run_info['stages'][stage.name] = {'status': 'blocked', 'duration_s': 0.0}
+                continue
+
+            hash_started = time.monotonic()
+            input_hash = self.input_hash(stage)
+            if self.is_up_to_date(stage, input_hash, resume):
+                logger.info(f"⏭️ Etap {stage.name} pominięty - wejścia bez zmian")
+                statuses[stage.name] = 'skipped'
+                run_info['stages'][stage.name] = {
+                    'status': 'skipped', 'duration_s': round(time.monotonic() - hash_started, 2)
+                }
+                continue
+
+            entry = self.run_stage(stage, input_hash)
+            statuses[stage.name] = entry['status']
+            self.state['stages'][stage.name] = entry
+            run_info['stages'][stage.name] = {
+                'status': entry['status'], 'duration_s': entry['duration_s'], 'attempts': entry['attempts']
+            }
+            # Stan zapisujemy po każdym etapie - przerwany przebieg nie traci wyników
+            self._save_state()
+
+        run_info['duration_s'] = round(time.monotonic() - run_started, 2)
+        run_info['success'] = all(status in ('success', 'skipped') for status in statuses.values())
+        self.state['runs'] = (self.state['runs'] + [run_info])[-RUN_HISTORY_LIMIT:]
+        self._save_state()
+
+        logger.info(f"⏱️ Przebieg zakończony w {run_info['duration_s']}s: " + ", ".join(
+            f"{name} {info['status']} ({info['duration_s']}s)" for name, info in run_info['stages'].items()
+        ))
+        return run_info['success']
+
+
+def default_stages() -> List[Stage]:
+    """Etapy scraper -> enhancer -> filtr -> dopasowanie przepisów; ścieżki ze zmiennych środowiskowych przekazywane etapom"""
+    offers = os.getenv('OUTPUT_FILE', '/shared/biedronka_offers.jsonl')
+    enhanced = os.getenv('ENHANCER_OUTPUT_FILE', '/shared/biedronka_offers_enhanced.jsonl')
+    filtered = os.getenv('FILTER_OUTPUT_FILE', '/shared/biedronka_offers_filtered.jsonl')
+    matches = os.getenv('RECIPE_MATCHES_OUTPUT_FILE', '/shared/biedronka_recipe_matches.json')
+    return [
+        Stage('scrape', 'main.py', outputs=[offers], env={'OUTPUT_FILE': offers}),
+        Stage('enhance', 'enhancer.py', inputs=[offers], outputs=[enhanced], deps=['scrape'],
+              env={'ENHANCER_INPUT_FILE': offers, 'ENHANCER_OUTPUT_FILE': enhanced}),
+        Stage('filter', 'filter.py', inputs=[enhanced], outputs=[filtered], deps=['enhance'],
+              env={'FILTER_INPUT_FILE': enhanced, 'FILTER_OUTPUT_FILE': filtered}),
+        Stage('match_recipes', 'recipe_matcher.py', inputs=[filtered], outputs=[matches], deps=['filter'],
+              env={'RECIPE_MATCHES_INPUT_FILE': filtered, 'RECIPE_MATCHES_OUTPUT_FILE': matches}),
+    ]
+
+
+def main():
+    """
+    Uruchamia pipeline od razu, a potem codziennie o PIPELINE_DAILY_AT (domyślnie 03:00).
+    Z `--once` (np. CronJob w k8s) wykonuje tylko jeden przebieg, a `--resume` wymusza
+    wznowienie ostatniego przebiegu (domyślnie tylko gdy nie powiódł się niedawno).
+    """
+    runner = PipelineRunner(
+        default_stages(),
+        state_file=os.getenv('PIPELINE_STATE_FILE', '/shared/pipeline_state.json'),
+        max_attempts=int(os.getenv('PIPELINE_MAX_ATTEMPTS', '3')),
+        retry_delay=float(os.getenv('PIPELINE_RETRY_DELAY', '30')),
+    )
+
+    resume = '--resume' in sys.argv or runner.should_resume(
+        float(os.getenv('PIPELINE_RESUME_WINDOW_HOURS', RESUME_WINDOW_HOURS))
+    )
+    if resume:
+        logger.info("🔁 Wznawiam nieudany przebieg - tylko nieudane i nieaktualne etapy")
+    success = runner.run(resume=resume)
+    if '--once' in sys.argv:
+        return 0 if success else 1
+
+    daily_at = os.getenv('PIPELINE_DAILY_AT', '03:00')
+    schedule.every().day.at(daily_at).do(runner.run)
+    logger.info(f"🕒 Kolejne przebiegi codziennie o {daily_at}")
+    while True:
+        schedule.run_pending()
+        time.sleep(30)
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import sys
+from typing import Dict, Iterable, Optional
+from catalog_io import CatalogReader
+
+# Słownik oczywistych przypadków (polskie nazwy + angielskie keywords).
+# Wzorzec z '*' pasuje do początku słowa ("kurczak*" -> "kurczakiem"), bez '*' - do całego słowa
+# (np. "sok" nie może łapać marki "Sokołów"). Frazy wielowyrazowe dopasowujemy w całości.
+REMOVE_TERMS = [
+    # chemia, kosmetyki, higiena
+    'szampon*', 'mydło', 'mydła', 'żel pod prysznic', 'dezodorant*', 'antyperspirant*', 'pasta do zębów',
+    'szczoteczk*', 'proszek do prania', 'płyn do*', 'kapsułki do prania', 'tabletki do zmywarki',
+    'papier toaletowy', 'ręcznik papierowy', 'ręczniki papierowe', 'chusteczki', 'pieluch*', 'podpaski',
+    'odplamiacz*', 'domestos', 'worki na śmieci',
+    # zwierzęta, technika, suplementy
+    'karma', 'karmy', 'żwirek', 'bateri*', 'żarówk*', 'suplement*', 'witamin*',
+    # napoje
+    'kawa', 'kawy', 'kapsułki', 'herbata', 'herbaty', 'sok', 'soki', 'nektar', 'woda', 'wody', 'napój',
+    'napoje', 'piwo', 'wino', 'wódka', 'cola', 'lemoniada', 'energetyk*',
+    # słodycze i przekąski
+    'baton*', 'lizak*', 'cukierki', 'żelki', 'guma do żucia', 'chipsy', 'chrupki', 'lody',
+    # tłuszcze
+    'olej', 'oliwa',
+    # angielskie keywords z enhancera
+    'shampoo', 'soap', 'detergent', 'cosmetic*', 'hygiene', 'toiletries', 'cleaning', 'diaper*',
+    'pet food', 'battery', 'supplement*', 'vitamin*', 'beverage*', 'drink*', 'coffee', 'tea', 'juice',
+    'water', 'beer', 'wine', 'alcohol*', 'soda', 'candy', 'chips', 'chewing gum', 'ice cream', 'oil',
+]
+
+KEEP_TERMS = [
+    # mięso i ryby
+    'kurczak*', 'filet*', 'pierś', 'piersi', 'udk*', 'skrzydełk*', 'indyk*', 'wieprz*', 'wołow*',
+    'schab*', 'karkówk*', 'łopatk*', 'mięso mielone', 'mielone', 'boczek', 'kiełbas*', 'szynk*',
+    'łosoś*', 'łososia', 'dorsz*', 'mintaj*', 'pstrąg*', 'śledź*', 'śledzie', 'makrel*', 'tuńczyk*', 'krewetk*',
+    # nabiał i jaja
+    'jaj*', 'ser', 'sery', 'serek', 'twaróg', 'twarożek', 'mozzarell*', 'jogurt naturalny', 'śmietan*',
+    'kefir*', 'maślank*',
+    # warzywa i owoce
+    'ziemniak*', 'marchew*', 'cebul*', 'czosnek', 'pomidor*', 'ogórek', 'ogórki', 'papryk*', 'kapust*',
+    'brokuł*', 'kalafior*', 'cukini*', 'bakłażan*', 'pieczark*', 'sałat*', 'szpinak*', 'por', 'seler*',
+    'jabłk*', 'banan*', 'gruszk*', 'cytryn*', 'pomarańcz*', 'truskawk*', 'malin*', 'borówk*',
+    # produkty zbożowe i spiżarnia
+    'mąka', 'ryż', 'makaron*', 'kasza', 'kaszy', 'płatki owsiane', 'chleb*', 'bułk*', 'bagietk*',
+    'fasol*', 'ciecierzyc*', 'soczewic*', 'groszek', 'kukurydz*',
+    # angielskie keywords z enhancera
+    'chicken', 'pork', 'beef', 'turkey', 'meat', 'fish', 'salmon', 'cod', 'egg*', 'cheese', 'flour',
+    'rice', 'pasta', 'vegetable*', 'fruit*', 'potato*', 'onion*', 'tomato*', 'bread', 'legume*',
+]
+
+
+def compile_terms(terms: Iterable[str]) -> re.Pattern:
+    """Składa listę wzorców słownika w jedno wyrażenie regularne"""
+    parts = []
+    for term in terms:
+        term = term.lower().strip()
+        if term.endswith('*'):
+            parts.append(re.escape(term[:-1]) + r'\w*')
+        else:
+            parts.append(re.escape(term))
+    return re.compile(r'(?<!\w)(?:' + '|'.join(parts) + r')(?!\w)')
+
+
+class LexiconClassifier:
+    """
+    Lokalny, pierwszy etap filtrowania: rozstrzyga oczywiste przypadki (szampon, kapsułki kawy,
+    świeży kurczak) na podstawie słownika dopasowanego do nazwy i `english_keywords`.
+    Produkt, który pasuje tylko do słownika "usuń" lub tylko "zostaw", jest rozstrzygany lokalnie,
+    a niejednoznaczne (oba słowniki, np. "karma dla psa z kurczakiem") i nieznane trafiają do LLM.
+    """
+
+    def __init__(self, remove_terms: Iterable[str] = REMOVE_TERMS, keep_terms: Iterable[str] = KEEP_TERMS):
+        self.remove_pattern = compile_terms(remove_terms)
+        self.keep_pattern = compile_terms(keep_terms)
+
+    @classmethod
+    def from_file(cls, path: Optional[str]) -> 'LexiconClassifier':
+        """Wczytuje słownik z pliku JSON {"remove": [...], "keep": [...]}; brak pliku = słownik wbudowany"""
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            lexicon = json.load(f)
+        return cls(lexicon.get('remove', REMOVE_TERMS), lexicon.get('keep', KEEP_TERMS))
+
+    @staticmethod
+    def product_text(product: Dict) -> str:
+        keywords = product.get('english_keywords') or []
+        return ' '.join([product.get('name', '')] + list(keywords)).lower()
+
+    def classify(self, product: Dict) -> Optional[bool]:
+        """True = usuń, False = zostaw, None = niepewne (decyzja LLM)"""
+        text = self.product_text(product)
+        remove = self.remove_pattern.search(text) is not None
+        keep = self.keep_pattern.search(text) is not None
+        if remove == keep:
+            return None
+        return remove
+
+    def evaluate(self, products: Iterable[Dict]) -> Dict:
+        """
+        Porównuje decyzje słownika z decyzjami LLM na oznaczonej próbce.
+        Etykietą jest `filter_remove` albo `keep` z przebiegu adnotacji enhancera.
+        """
+        report = {'total': 0, 'labeled': 0, 'decided_locally': 0, 'agreed': 0,
+                  'false_remove': 0, 'false_keep': 0, 'disagreements': []}
+        for product in products:
+            report['total'] += 1
+            if isinstance(product.get('filter_remove'), bool):
+                label = product['filter_remove']
+            elif isinstance(product.get('keep'), bool):
+                label = not product['keep']
+            else:
+                continue
+            report['labeled'] += 1
+            decision = self.classify(product)
+            if decision is None:
+                continue
+            report['decided_locally'] += 1
+            if decision == label:
+                report['agreed'] += 1
+                continue
+            report['false_remove' if decision else 'false_keep'] += 1
+            report['disagreements'].append({'name': product.get('name'), 'local_remove': decision})
+
+        labeled = report['labeled']
+        decided = report['decided_locally']
+        report['coverage'] = round(decided / labeled, 4) if labeled else 0.0
+        report['agreement'] = round(report['agreed'] / decided, 4) if decided else 0.0
+        return report
+
+
+def main():
+    """Raport zgodności słownika z decyzjami LLM: python prefilter.py <katalog z etykietami> [słownik.json]"""
+    if len(sys.argv) < 2:
+        print("Użycie: python prefilter.py <plik .jsonl/.json z etykietami keep/filter_remove> [słownik.json]")
+        sys.exit(1)
+
+    classifier = LexiconClassifier.from_file(sys.argv[2] if len(sys.argv) > 2 else os.getenv('PREFILTER_LEXICON'))
+    report = classifier.evaluate(CatalogReader(sys.argv[1]))
+
+    print(f"📊 Próbka: {report['labeled']} oznaczonych produktów (z {report['total']})")
+    print(f"⚡ Rozstrzygnięte lokalnie: {report['decided_locally']} ({report['coverage']:.0%}) - "
+          f"tyle produktów mniej trafia do LLM")
+    print(f"🎯 Zgodność z LLM: {report['agreement']:.1%} "
+          f"(błędnie usunięte: {report['false_remove']}, błędnie zostawione: {report['false_keep']})")
+    for entry in report['disagreements'][:20]:
+        decision = 'usuń' if entry['local_remove'] else 'zostaw'
+        print(f"  • {entry['name']} → słownik: {decision}")
+
+
+if __name__ == "__main__":
+    main()
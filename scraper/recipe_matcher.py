@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+import requests
+
+from catalog_diff import product_key
+from catalog_io import CatalogReader
+from openai_limiter import limited_http_client, shared_limiter
+
+# Tabela dopasowań produkt -> przepisy publikowana obok katalogu:
+#   {"format": "recipe-matches", "version": 1, ...metadane,
+#    "matches": {klucz produktu: {"t": skrót tekstu produktu, "r": [[id punktu Qdrant, score], ...]}}}
+# Backend bierze z niej kandydatów przepisów dla produktów, a wyszukiwanie wektorowe
+# przy zapytaniu robi już tylko dla części zależnej od zapytania użytkownika.
+MATCHES_FORMAT = "recipe-matches"
+MATCHES_VERSION = 1
+
+
+def product_text(product: Dict[str, Any]) -> str:
+    """Tekst produktu osadzany do wyszukiwania przepisów (przepisy są po angielsku)"""
+    name = product.get('translated_name') or product.get('name', '')
+    keywords = product.get('english_keywords') or []
+    return f"{name}; {', '.join(keywords)}" if keywords else name
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+class RecipeMatcher:
+    def __init__(self, api_key: str, qdrant_url: str, collection: str = "recipes",
+                 embedding_model: str = "text-embedding-3-small", top_n: int = 5, batch_size: int = 64):
+        """
+        Wyszukuje top-N przepisów dla każdego produktu katalogu jednym przebiegiem:
+        osadzenia w batchach (jedno zapytanie do API na `batch_size` produktów)
+        i wyszukiwanie zbiorcze w Qdrant (points/search/batch).
+        Model osadzeń musi być ten sam, którym zaindeksowano kolekcję przepisów.
+        """
+        # Limit klucza wspólny z backendem (OPENAI_RPM / OPENAI_TPM)
+        self.client = openai.OpenAI(api_key=api_key, http_client=limited_http_client(shared_limiter(), 'batch'))
+        self.qdrant_url = qdrant_url.rstrip('/')
+        self.collection = collection
+        self.embedding_model = embedding_model
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.session = requests.Session()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.embedding_model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def search(self, vectors: List[List[float]]) -> List[List[List[Any]]]:
+        """[[id, score], ...] dla każdego wektora"""
+        response = self.session.post(
+            f"{self.qdrant_url}/collections/{self.collection}/points/search/batch",
+            json={"searches": [{"vector": vector, "limit": self.top_n, "with_payload": False} for vector in vectors]},
+            timeout=120,
+        )
+        response.raise_for_status()
+        return [[[hit['id'], round(hit['score'], 4)] for hit in hits] for hits in response.json()['result']]
+
+    def settings(self) -> Dict[str, Any]:
+        """Parametry, od których zależą wyniki - zmiana któregoś unieważnia poprzednią tabelę"""
+        return {'collection': self.collection, 'embedding_model': self.embedding_model, 'top_n': self.top_n}
+
+    def load_previous(self, path) -> Dict[str, Dict[str, Any]]:
+        """Dopasowania z poprzedniego przebiegu (jeśli policzone z tymi samymi parametrami)"""
+        if not path or not Path(path).exists():
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Nie udało się wczytać poprzednich dopasowań: {e}")
+            return {}
+        if any(data.get(key) != value for key, value in self.settings().items()):
+            print("♻️ Zmienione parametry dopasowań - liczę wszystko od nowa")
+            return {}
+        return data.get('matches', {})
+
+    def match_file(self, input_file: str, output_file: str) -> Optional[Dict[str, Any]]:
+        """Liczy tabelę dopasowań dla katalogu i zapisuje ją atomowo. Zwraca statystyki albo None."""
+        if not Path(input_file).exists():
+            print(f"❌ Plik wejściowy nie istnieje: {input_file}")
+            return None
+
+        previous = self.load_previous(output_file)
+        reader = CatalogReader(input_file)
+        matches: Dict[str, Dict[str, Any]] = {}
+        pending: List[Tuple[str, str]] = []
+        reused = 0
+
+        for product in reader:
+            key = product_key(product)
+            text = product_text(product)
+            if not text or key in matches:
+                continue
+            digest = text_hash(text)
+            # Dopasowania zależą tylko od tekstu produktu - zmiana ceny nie wymaga ponownego liczenia
+            entry = previous.get(key)
+            if entry is not None and entry.get('t') == digest:
+                matches[key] = entry
+                reused += 1
+            else:
+                pending.append((key, text))
+
+        print(f"🔎 Dopasowuję przepisy dla {len(pending)} produktów ({reused} z poprzedniego przebiegu)...")
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = self.embed([text for _, text in batch])
+            for (key, text), hits in zip(batch, self.search(vectors)):
+                matches[key] = {'t': text_hash(text), 'r': hits}
+            print(f"   ✅ {min(start + self.batch_size, len(pending))}/{len(pending)}")
+
+        stats = {'products': len(matches), 'matched': len(pending), 'reused': reused}
+        table = {
+            'format': MATCHES_FORMAT,
+            'version': MATCHES_VERSION,
+            'store': reader.header.get('store'),
+            'catalog_scraped_at': reader.header.get('scraped_at'),
+            'created_at': datetime.now().isoformat(),
+            **self.settings(),
+            'stats': stats,
+            'matches': matches,
+        }
+        tmp_file = f"{output_file}.partial"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(table, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, output_file)
+        return stats
+
+
+def main():
+    print("🍲 Uruchamiam dopasowanie produktów do przepisów...")
+
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        print("❌ Brak OPENAI_API_KEY w zmiennych środowiskowych. Ustaw ją i spróbuj ponownie.")
+        sys.exit(1)
+
+    input_file = os.getenv('RECIPE_MATCHES_INPUT_FILE', "/shared/biedronka_offers_filtered.jsonl")
+    output_file = os.getenv('RECIPE_MATCHES_OUTPUT_FILE', "/shared/biedronka_recipe_matches.json")
+
+    matcher = RecipeMatcher(
+        api_key=api_key,
+        qdrant_url=os.getenv('QDRANT_URL', "http://qdrant:6333"),
+        collection=os.getenv('RECIPE_COLLECTION', "recipes"),
+        embedding_model=os.getenv('RECIPE_EMBEDDING_MODEL', "text-embedding-3-small"),
+        top_n=int(os.getenv('RECIPE_MATCHES_TOP_N', '5')),
+    )
+    try:
+        stats = matcher.match_file(input_file, output_file)
+    except (openai.OpenAIError, requests.RequestException) as e:
+        print(f"💥 Dopasowanie nie powiodło się: {e}")
+        sys.exit(1)
+    if stats is None:
+        sys.exit(1)
+    print(f"\n🎉 Tabela dopasowań zapisana: {output_file} "
+          f"({stats['products']} produktów, nowe: {stats['matched']}, przeniesione: {stats['reused']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+UNIT_PATTERN = re.compile(r'(\d)\s+(g|kg|ml|l|szt)\b')
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizuje nazwę produktu do klucza cache:
+    'Szynka Kraina Wędlin, 100 g' i 'szynka  kraina wędlin 100g' dają ten sam klucz
+    """
+    name = unicodedata.normalize('NFKC', name or '').lower()
+    name = re.sub(r'[,;]', ' ', name)
+    name = UNIT_PATTERN.sub(r'\1\2', name)
+    return ' '.join(name.split())
+
+
+class ResultCache:
+    """
+    Trwały cache wyników LLM dla produktów, kluczowany znormalizowaną nazwą
+    i wersją promptu - zmiana promptu automatycznie unieważnia stare wpisy.
+    Plik JSON jest zapisywany atomowo (tmp + rename).
+    """
+
+    def __init__(self, path: Optional[str], prompt_version: str):
+        self.path = Path(path) if path else None
+        self.prompt_version = prompt_version
+        self.entries: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('entries', {})
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"⚠️ Nie udało się wczytać cache {self.path}: {e} - zaczynam od pustego")
+            self.entries = {}
+
+    def key(self, name: str) -> str:
+        return f"{self.prompt_version}:{normalize_name(name)}"
+
+    def get(self, name: str) -> Optional[Any]:
+        value = self.entries.get(self.key(name))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, name: str, value: Any):
+        # Puste wyniki (nieudane zapytania) nie trafiają do cache
+        if not value:
+            return
+        self.entries[self.key(name)] = value
+        self._dirty = True
+
+    def save(self):
+        if self.path is None or not self._dirty:
+            return
+        os.makedirs(self.path.parent, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def summary(self) -> str:
+        return (f"trafienia {self.hits}/{self.lookups} ({self.hit_ratio:.0%}), "
+                f"wpisów w cache: {len(self.entries)}")